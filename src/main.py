@@ -1,11 +1,31 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
-import json
 from datetime import datetime
 import os
-from textblob import TextBlob  # add this import at the top with others
 from response_engine import ResponseEngine
 from modules.analytical_hub import AnalyticsHub
+from modules.tone_strategies import auto_tone
+from modules.records import FeedbackRecord, MemoryRecord, feedback_records, memory_records
+from modules.json_stream import JsonEntryStream
+from modules.compaction import write_compact, append_compact, repair_compact
+from modules.analytics_query import to_seconds, from_seconds, preset_range, RANGE_PRESETS
+from modules.memory_export import MemoryExporter, EXPORT_FORMATS
+from modules.background import BackgroundRunner, SendCoalescer
+from modules.speech import SpeechQueue
+from modules.reply_metrics import MetricsLog
+from modules.analytics_snapshot import SnapshotScheduler
+from modules.routing import RoutingConfig
+from modules.topic_index import TopicIndexer
+from modules.log_setup import get_logger, setup_logging
+import threading
+
+log = get_logger("app")
+
+# Past exchanges restored into the context window and transcript on startup
+RESUME_EXCHANGES = 5
+
+# Messages sent within this many ms of each other get one combined reply
+COALESCE_MS = 400
 
 
 class AICoachCompanion:
@@ -17,6 +37,8 @@ class AICoachCompanion:
 
         # --- Load memory on startup ---
         self.memory_file = "data/memory.json"
+        self.memory_tail = []
+        self.memory_in_place = False
         self.memory_data = self.load_memory()
 
         # --- Load user feedback data on startup ---
@@ -24,19 +46,43 @@ class AICoachCompanion:
         self.user_feedback = self.load_user_data()
 
         # --- Initialize Response Engine ---
-        self.engine = ResponseEngine(mode="api")
+        # Analyzers and the API client warm up in the background while the window paints.
+        # Per-reply latency/fallback metrics are appended to data/reply_metrics.jsonl
+        self.metrics = MetricsLog()
+        # The backend comes from data/routing.json ("mode", default "api"); "auto"
+        # sends trivial messages to the local templates and the rest to the API
+        routing = RoutingConfig.from_file()
+        self.engine = ResponseEngine(mode=routing.mode, routing=routing, background_warmup=True,
+                                     metrics=self.metrics)
+
+        # Precomputed all-time analytics so the hub opens instantly;
+        # rebuilt in the background after bursts of feedback and at shutdown
+        self.snapshots = SnapshotScheduler(self.root, lambda: self.user_feedback, self.user_data_file)
+        self.snapshots.ensure_fresh()
+
+        # Topics of each logged message, extracted on a worker thread (Topics tab)
+        self.topics = TopicIndexer()
+        self.topics.catch_up(self.memory_file)
+
+        # Replies are generated on a worker thread; bursts of sends share one request
+        self.sends = SendCoalescer(self.root, self.generate_ai_response, self.show_ai_response,
+                                   window_ms=COALESCE_MS, on_error=self.on_reply_error)
 
         # Chat history
         self.chat_history = []
 
         # Short-term memory (stores last few messages)
         self.context_window = []
-        self.max_context = 5  # how many past exchanges to remember
+        self.max_context = RESUME_EXCHANGES  # how many past exchanges to remember
 
         
         # Track last tone used in Auto mode
         self.last_auto_tone = None
 
+        # Optional spoken replies (created when first enabled)
+        self.speech = None
+        self.speak_var = tk.BooleanVar(value=False)
+
          # ✅ Define main frame FIRST
         self.main_frame = tk.Frame(self.root, bg="#1e1e1e")
         self.main_frame.pack(fill="both", expand=True)
@@ -53,16 +99,39 @@ class AICoachCompanion:
 )
         analytics_btn.pack(side="right", padx=10, pady=0)
 
+        # Warm-up readiness indicator
+        self.readiness_label = tk.Label(
+            self.main_frame,
+            text="◌ Warming up…",
+            font=("Segoe UI", 9),
+            bg="#1e1e1e",
+            fg="#f1c40f"
+        )
+        self.readiness_label.pack(side="left", padx=10)
+        self.root.after(200, self.update_readiness)
 
 
         # UI setup
         self.setup_ui()
 
+        # Pick up where the last session left off
+        self.resume_session()
+
         # Welcome message
         self.add_message("AI Coach", "Hello! I'm your AI Coach Companion. How can I help you today?", "system")
 
-        self.engine = ResponseEngine()
-        print(self.engine.test_openai_connection("Hey, WHATS THE DAY TODAY?"))
+    def update_readiness(self):
+        """Poll the engine's warm-up stage and show which components are still loading"""
+        pending = self.engine.warmup.pending()
+        if pending:
+            self.readiness_label.config(text=f"◌ Warming up: {', '.join(pending)}", fg="#f1c40f")
+            self.root.after(200, self.update_readiness)
+            return
+
+        timings = ", ".join(f"{name} {seconds * 1000:.0f} ms"
+                            for name, seconds in self.engine.warmup.timings.items())
+        self.readiness_label.config(text="● Ready", fg="#2ecc71")
+        log.info("Warm-up finished: %s", timings)
 
     def open_analytics_hub(self):
         analytics_window = tk.Toplevel(self.root)
@@ -73,28 +142,64 @@ class AICoachCompanion:
         """Load memory file if exists, otherwise create a new one"""
         if os.path.exists(self.memory_file):
             try:
-                with open(self.memory_file, "r") as f:
-                    return json.load(f)
-            except:
+                # A crash mid-append can tear the end of the file; re-seal it first
+                repair_compact(self.memory_file)
+                # Only the last few entries are read (from the end of the file), so
+                # startup doesn't grow with history; "entries" loads on first use
+                stream = JsonEntryStream(self.memory_file)
+                self.memory_tail = memory_records(stream.tail(RESUME_EXCHANGES))
+                self.memory_in_place = True
+                return {"user_name": "Taiba", **stream.fields, "entries": None}
+            except Exception as e:
+                # Never overwrite history that couldn't be read: keep it aside and start fresh
+                aside = f"{self.memory_file}.unreadable-{datetime.now():%Y%m%d%H%M%S}"
+                log.error("Could not read %s (kept as %s): %s", self.memory_file, aside, e)
+                try:
+                    os.replace(self.memory_file, aside)
+                except OSError as move_error:
+                    log.error("Could not move %s aside: %s", self.memory_file, move_error)
+                    # Nothing is saved this session rather than replacing the file
+                    return {"user_name": "Taiba", "entries": None}
                 return {"user_name": "Taiba", "entries": []}
         else:
             return {"user_name": "Taiba", "entries": []}
 
+    def memory_entries(self):
+        """Full memory history, streamed from disk the first time it's needed"""
+        if self.memory_data["entries"] is None:
+            self.memory_data["entries"] = memory_records(JsonEntryStream(self.memory_file))
+        return self.memory_data["entries"]
+
     def save_memory(self):
         """Save memory to JSON file"""
-        with open(self.memory_file, "w") as f:
-            json.dump(self.memory_data, f, indent=4)
+        if self.memory_data["entries"] is None:
+            # History was never loaded; every entry is already appended on disk
+            return
+        # Compact layout: repeated replies/inputs are stored once in a string table
+        fields = {k: v for k, v in self.memory_data.items() if k != "entries"}
+        write_compact(self.memory_file, self.memory_data["entries"], fields)
+        self.memory_in_place = True
+
+    def resume_session(self):
+        """Re-seed the context window and transcript with the last session's exchanges"""
+        if not self.memory_tail:
+            return
+        self.add_message("System", "Resuming your last conversation…", "system")
+        for entry in self.memory_tail:
+            self.add_message("You", entry.get("input", ""), "user", timestamp=entry.ts)
+            self.add_message("AI Coach", entry.get("response", ""), "ai", timestamp=entry.ts)
+            self.context_window.append({"user": entry.get("input", ""), "ai": entry.get("response", "")})
+        del self.context_window[:-self.max_context]
 
 
     def load_user_data(self):
         """Safely load persisted user feedback data from JSON file."""
         try:
             if os.path.exists(self.user_data_file):
-                with open(self.user_data_file, "r") as f:
-                    data = json.load(f)
-                    if isinstance(data, list):
-                        return data
-                    return []
+                # Re-seal the log if a crash tore its last append
+                repair_compact(self.user_data_file)
+                # Stream entries into compact slotted records
+                return feedback_records(JsonEntryStream(self.user_data_file, key=None))
             else:
                 # Ensure data directory exists
                 os.makedirs(os.path.dirname(self.user_data_file), exist_ok=True)
@@ -103,27 +208,27 @@ class AICoachCompanion:
             # On any parse or IO error, start fresh but don't crash UI
             return []
 
-    def save_user_data(self):
-        """Safely persist user feedback list to JSON file."""
+    def save_user_data(self, new_entries):
+        """Append new feedback entries to the JSON file (in place, so earlier bytes never change)."""
         try:
             os.makedirs(os.path.dirname(self.user_data_file), exist_ok=True)
-            with open(self.user_data_file, "w") as f:
-                json.dump(self.user_feedback, f, indent=4)
+            append_compact(self.user_data_file, new_entries)
         except Exception as e:
-            print("User data save error:", e)
+            log.error("User data save error: %s", e)
 
     def save_user_feedback_entry(self, user_message, ai_response, feedback, detected_mood, tone_used):
         """Append one feedback entry and persist to disk."""
-        entry = {
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "user_message": user_message,
-            "ai_response": ai_response,
-            "feedback": feedback,
-            "detected_mood": detected_mood,
-            "tone_used": tone_used
-        }
+        entry = FeedbackRecord(
+            ts=to_seconds(datetime.now()),
+            user_message=user_message,
+            ai_response=ai_response,
+            feedback=feedback,
+            detected_mood=detected_mood,
+            tone_used=tone_used
+        )
         self.user_feedback.append(entry)
-        self.save_user_data()
+        self.save_user_data([entry])
+        self.snapshots.notify()
 
         self.engine.refresh_user_preferences()
 
@@ -132,6 +237,8 @@ class AICoachCompanion:
     def detect_mood(self, message):
         """Detect mood using sentiment polarity (TextBlob)"""
         try:
+            # Waits only if TextBlob is still warming up
+            TextBlob = self.engine.warmup.get("textblob")
             blob = TextBlob(message)
             polarity = blob.sentiment.polarity  # -1 (negative) → +1 (positive)
             
@@ -142,21 +249,29 @@ class AICoachCompanion:
             else:
                 return "neutral"
         except Exception as e:
-            print("Mood detection error:", e)
+            log.warning("Mood detection error: %s", e)
             return "neutral"
 
     
     def log_interaction(self, user_message, ai_response, mood="unknown"):
         """Store the chat into memory"""
-        entry = {
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "input": user_message,
-            "response": ai_response,
-            "mood": mood,
-            "tags": []
-        }
-        self.memory_data["entries"].append(entry)
-        self.save_memory()
+        entry = MemoryRecord(
+            ts=to_seconds(datetime.now()),
+            input=user_message,
+            response=ai_response,
+            mood=mood
+        )
+        if self.memory_data["entries"] is not None:
+            self.memory_data["entries"].append(entry)
+        self.topics.submit(entry.ts, user_message)
+        try:
+            if self.memory_in_place:
+                # Appended to the file in place; the history isn't rewritten
+                append_compact(self.memory_file, [entry])
+            else:
+                self.save_memory()
+        except Exception as e:
+            log.error("Memory save error: %s", e)
 
     
     def setup_ui(self):
@@ -272,6 +387,29 @@ class AICoachCompanion:
             cursor='hand2'
         )
         export_button.pack(side=tk.LEFT, padx=(10, 0))
+
+        # Speak AI replies aloud (pyttsx3, optional)
+        speak_check = tk.Checkbutton(
+            tone_frame,
+            text="🔊 Speak",
+            variable=self.speak_var,
+            bg='#f0f0f0',
+            font=("Arial", 9),
+            command=self.on_speak_toggle
+        )
+        speak_check.pack(side=tk.LEFT, padx=(10, 0))
+
+    def on_speak_toggle(self):
+        """Start the speech worker the first time spoken replies are enabled"""
+        if self.speak_var.get():
+            if self.speech is None:
+                self.speech = SpeechQueue(self.engine.local_generator.all_replies()).start()
+                # Local templates recur a lot; synthesize them while idle
+                self.speech.warm_cache()
+            if not self.speech.available:
+                self.speak_var.set(False)
+        elif self.speech is not None:
+            self.speech.stop_current()
     
     def setup_input_area(self, parent):
         """Set up the input area with text box and send button"""
@@ -312,12 +450,13 @@ class AICoachCompanion:
         # Focus on input text
         self.input_text.focus()
     
-    def add_message(self, sender, message, message_type="user"):
-        """Add a message to the chat display"""
+    def add_message(self, sender, message, message_type="user", timestamp=None):
+        """Add a message to the chat display (timestamp: stored seconds, default now)"""
         self.chat_display.config(state=tk.NORMAL)
         
         # Add timestamp
-        timestamp = datetime.now().strftime("%H:%M:%S")
+        when = from_seconds(timestamp) if timestamp is not None else datetime.now()
+        timestamp = when.strftime("%H:%M:%S")
         self.chat_display.insert(tk.END, f"[{timestamp}] ", "timestamp")
         
         # Add sender and message
@@ -327,6 +466,10 @@ class AICoachCompanion:
         # Scroll to bottom
         self.chat_display.see(tk.END)
         self.chat_display.config(state=tk.DISABLED)
+
+        # Hand AI replies to the speech worker (never blocks the UI)
+        if message_type == "ai" and self.speech is not None and self.speak_var.get():
+            self.speech.speak(message)
         
         # Store in chat history
         self.chat_history.append({
@@ -409,23 +552,23 @@ class AICoachCompanion:
         # Clear input
         self.input_text.delete("1.0", tk.END)
         
-        # Simulate AI response based on tone
-        self.generate_ai_response(message, detected_mood)
+        # Queue for a reply; messages sent in quick succession are answered together
+        self.sends.add((message, detected_mood))
     
-    def generate_ai_response(self, user_message, mood="neutral"):
-        """Generate AI response using ResponseEngine with context memory + auto tone"""
+    def generate_ai_response(self, batch):
+        """
+        Prepare one reply to a burst of messages [(message, mood)] with context
+        memory + auto tone. Called on the Tk thread by SendCoalescer; returns
+        the engine call, which runs on a worker thread.
+        """
+        user_message = "\n".join(message for message, _ in batch)
+        # The latest message is the user's current mood
+        mood = batch[-1][1]
         selected_tone = self.tone_var.get()
 
         # --- Auto tone logic ---
         if selected_tone == "Auto":
-            mood_to_tone = {
-                "happy": "Balanced",
-                "sad": "Empathetic",
-                "neutral": "Blunt",
-                "angry": "Blunt",
-                "stressed": "Empathetic"
-            }
-            tone = mood_to_tone.get(mood, "Balanced")
+            tone = auto_tone(mood)
 
             if not hasattr(self, "last_auto_tone"):
                 self.last_auto_tone = None
@@ -440,10 +583,21 @@ class AICoachCompanion:
         context_text = "\n".join(
             [f"You: {msg['user']} | Coach: {msg['ai']}" for msg in getattr(self, 'context_window', [])]
         )
-        combined_input = f"{context_text}\nYou: {user_message}"
 
         # --- Generate response ---
-        response = self.engine.generate_response(combined_input, tone, mood)
+        # Context is passed separately so routing looks at the new message only
+        # Preference counts are copied here: the Tk thread updates them on feedback
+        preferences = self.engine.preferences.snapshot()
+
+        def generate():
+            response = self.engine.generate_response(user_message, tone, mood, context=context_text,
+                                                     preferences=preferences)
+            return user_message, mood, tone, response
+        return generate
+
+    def show_ai_response(self, batch, result):
+        """Show a reply from the worker and remember the exchange (Tk thread)."""
+        user_message, mood, tone, response = result
         self.add_message("AI Coach", response, "ai")
         self.log_interaction(user_message, response, mood)
 
@@ -457,7 +611,7 @@ class AICoachCompanion:
             )
         except Exception as e:
             # Don't let UI fail if rendering feedback controls has issues
-            print("Feedback UI error:", e)
+            log.error("Feedback UI error: %s", e)
 
         # --- Update short-term memory ---
         if not hasattr(self, 'context_window'):
@@ -468,6 +622,10 @@ class AICoachCompanion:
         if len(self.context_window) > self.max_context:
             self.context_window.pop(0)
 
+    def on_reply_error(self, batch, error):
+        log.error("Reply generation failed: %s", error, extra={"messages": len(batch)})
+        self.add_message("System", "Sorry, no reply could be generated. Please try again.", "system")
+
 
 
     
@@ -555,7 +713,7 @@ class AICoachCompanion:
         text_area.tag_configure("separator", foreground="#bdc3c7")
         
         # Display memory entries
-        entries = self.memory_data.get("entries", [])
+        entries = self.memory_entries()
         if not entries:
             text_area.insert(tk.END, "No memory entries yet.\n", "header")
         else:
@@ -596,42 +754,126 @@ class AICoachCompanion:
         close_button.pack(pady=10)
     
     def export_memory(self):
-        """Export memory data to a JSON file"""
-        try:
-            # Ask user where to save the file
-            filename = filedialog.asksaveasfilename(
-                defaultextension=".json",
-                filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
-                title="Export Memory"
-            )
-            
-            # If user cancelled, do nothing
-            if not filename:
+        """Open the export dialog (format, date range, mood filter, progress)"""
+        popup = tk.Toplevel(self.root)
+        popup.title("Export Memory")
+        popup.geometry("420x260")
+        popup.configure(bg='#f0f0f0')
+        popup.resizable(False, False)
+
+        form = tk.Frame(popup, bg='#f0f0f0')
+        form.pack(fill=tk.X, padx=20, pady=(15, 5))
+
+        def add_choice(row, label, values):
+            tk.Label(form, text=label, font=("Arial", 10), bg='#f0f0f0', fg='#34495e').grid(
+                row=row, column=0, sticky='w', pady=4)
+            var = tk.StringVar(value=values[0])
+            ttk.Combobox(form, textvariable=var, values=values, state="readonly", width=28).grid(
+                row=row, column=1, sticky='w', padx=(10, 0), pady=4)
+            return var
+
+        format_names = {desc: fmt for fmt, (_, desc) in EXPORT_FORMATS.items()}
+        format_var = add_choice(0, "Format:", list(format_names))
+        range_var = add_choice(1, "Range:", list(RANGE_PRESETS))
+        mood_var = add_choice(2, "Mood:", ["All", "happy", "neutral", "sad"])
+
+        progress_bar = ttk.Progressbar(popup, mode="determinate", maximum=1.0, length=380)
+        progress_bar.pack(padx=20, pady=(10, 0))
+        status_label = tk.Label(popup, text="", font=("Arial", 9), bg='#f0f0f0', fg='#7f8c8d')
+        status_label.pack(pady=(4, 0))
+
+        buttons = tk.Frame(popup, bg='#f0f0f0')
+        buttons.pack(pady=10)
+        cancel_event = threading.Event()
+        state = {"fraction": 0.0, "exported": 0, "running": False}
+        runner = BackgroundRunner(popup)
+
+        def on_progress(fraction, exported):
+            # Called from the worker thread; the dialog polls these values
+            state["fraction"], state["exported"] = fraction, exported
+
+        def poll_progress():
+            if not state["running"]:
                 return
-            
-            # Save the memory data to the selected file
-            with open(filename, "w") as f:
-                json.dump(self.memory_data, f, indent=4)
-            
-            # Show success message
+            progress_bar["value"] = state["fraction"]
+            status_label.config(text=f"Exported {state['exported']} entries…")
+            popup.after(100, poll_progress)
+
+        def on_done(count):
+            state["running"] = False
+            export_button.config(state=tk.NORMAL)
+            if count is None:
+                status_label.config(text="Export cancelled.")
+                return
+            progress_bar["value"] = 1.0
+            status_label.config(text=f"Exported {count} entries.")
             messagebox.showinfo(
                 "Export Successful",
-                f"Memory data has been exported to:\n{filename}",
-                icon="info"
+                f"{count} memory entries have been exported to:\n{exporter.dest_path}",
+                icon="info",
+                parent=popup
             )
-            
-        except Exception as e:
+
+        def on_error(e):
+            state["running"] = False
+            export_button.config(state=tk.NORMAL)
+            status_label.config(text="Export failed.")
             # Show error message if something goes wrong
             messagebox.showerror(
                 "Export Error",
                 f"An error occurred while exporting memory:\n{str(e)}",
-                icon="error"
+                icon="error",
+                parent=popup
+            )
+
+        def start_export():
+            nonlocal exporter
+            fmt = format_names[format_var.get()]
+            extension, description = EXPORT_FORMATS[fmt]
+
+            # Ask user where to save the file
+            filename = filedialog.asksaveasfilename(
+                parent=popup,
+                defaultextension=extension,
+                filetypes=[(description, "*" + extension), ("All files", "*.*")],
+                title="Export Memory"
             )
+            # If user cancelled, do nothing
+            if not filename:
+                return
+
+            # Entries are streamed from disk; every exchange is already appended there
+            start, end = preset_range(range_var.get())
+            moods = None if mood_var.get() == "All" else [mood_var.get()]
+            cancel_event.clear()
+            exporter = MemoryExporter(self.memory_file, filename, fmt=fmt, start=start, end=end,
+                                      moods=moods, progress=on_progress, cancel_event=cancel_event)
+
+            state.update(fraction=0.0, exported=0, running=True)
+            export_button.config(state=tk.DISABLED)
+            runner.submit(exporter.run, on_done, on_error)
+            poll_progress()
+
+        def close():
+            cancel_event.set()
+            popup.destroy()
+
+        exporter = None
+        export_button = tk.Button(buttons, text="Export", command=start_export, font=("Arial", 10, "bold"),
+                                  bg='#16a085', fg='white', relief=tk.FLAT, padx=20, pady=5, cursor='hand2')
+        export_button.pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Cancel", command=cancel_event.set, font=("Arial", 10),
+                  bg='#95a5a6', fg='white', relief=tk.FLAT, padx=15, pady=5, cursor='hand2').pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Close", command=close, font=("Arial", 10),
+                  bg='#e74c3c', fg='white', relief=tk.FLAT, padx=15, pady=5, cursor='hand2').pack(side=tk.LEFT, padx=5)
+        popup.protocol("WM_DELETE_WINDOW", close)
 
 
 
 def main():
     """Main function to run the application"""
+    # Level and per-module overrides: DOTPI_LOG_LEVEL / DOTPI_LOG_LEVELS="engine=DEBUG,..."
+    setup_logging()
     root = tk.Tk()
     app = AICoachCompanion(root)
     
@@ -643,6 +885,9 @@ def main():
     
     # Start the application
     root.mainloop()
+    app.metrics.close()
+    app.snapshots.flush()
+    app.topics.close()
 
 if __name__ == "__main__":
     main()
@@ -3,15 +3,55 @@ import tkinter as tk
 from tkinter import ttk
 from modules.preference_summary import PreferenceSummary
 from modules.mood_trend_dashboard import MoodTrendDashboard
-import matplotlib.pyplot as plt
+from modules.background import BackgroundRunner, FileWatcher
+from modules.analytics_query import TimeIndex, RANGE_PRESETS, preset_range
+from modules.json_stream import JsonEntryStream, open_snapshot
+from modules.records import feedback_records
+from modules.reply_metrics import DailyLatencyAggregate
+from modules.analytics_snapshot import AnalyticsSnapshot, DEFAULT_SNAPSHOT_FILE, format_summary
+from modules.topic_index import TopicIndex
+from modules.chart_utils import bucket_series, max_points_for
+from modules.log_setup import get_logger
+import os
+import threading
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
+
+log = get_logger("dashboard")
 
 class AnalyticsHub:
-    def __init__(self, master):
+    def __init__(self, master, feedback_file="data/user_data.json",
+                 metrics_file="data/reply_metrics.jsonl",
+                 metrics_aggregate_file="data/reply_metrics_daily.json",
+                 snapshot_file=DEFAULT_SNAPSHOT_FILE,
+                 topics_file="data/topic_index.json"):
         self.master = master
         self.master.title("AI Companion - Analytics Hub")
         self.master.geometry("900x600")
         self.master.configure(bg="#1e1e1e")
+        self.feedback_file = feedback_file
+        self.metrics_file = metrics_file
+        self.metrics_aggregate_file = metrics_aggregate_file
+        self.topics_file = topics_file
+
+        # Date-range picker; every tab is computed over the selected range
+        range_bar = tk.Frame(self.master, bg="#1e1e1e")
+        range_bar.pack(fill="x", padx=10, pady=(8, 0))
+        tk.Label(range_bar, text="Range:", font=("Segoe UI", 10), fg="white", bg="#1e1e1e").pack(side="left")
+        self.range_var = tk.StringVar(value=RANGE_PRESETS[0])
+        range_picker = ttk.Combobox(range_bar, textvariable=self.range_var, values=RANGE_PRESETS,
+                                    state="readonly", width=14)
+        range_picker.pack(side="left", padx=(6, 0))
+        range_picker.bind("<<ComboboxSelected>>", lambda e: self.on_data_changed())
+
+        # Sorted timestamp index over the feedback file. New entries are folded
+        # in from index_offset on; it is rebuilt only when the file is rewritten.
+        # Queries hold index_lock, since the index changes in place.
+        self.index = None
+        self.index_signature = None
+        self.index_offset = None
+        self.index_fingerprint = None
+        self.index_lock = threading.RLock()
 
         # Notebook (Tabs)
         self.notebook = ttk.Notebook(self.master)
@@ -20,16 +60,166 @@ class AnalyticsHub:
         # Create frames for tabs
         self.summary_frame = ttk.Frame(self.notebook)
         self.trend_frame = ttk.Frame(self.notebook)
+        self.latency_frame = ttk.Frame(self.notebook)
+        self.topics_frame = ttk.Frame(self.notebook)
 
         self.notebook.add(self.summary_frame, text="📊 Feedback Summary")
         self.notebook.add(self.trend_frame, text="📈 Mood Trends")
+        self.notebook.add(self.latency_frame, text="⏱ Latency")
+        self.notebook.add(self.topics_frame, text="🏷 Topics")
+
+        # Tabs are computed on a worker thread, only once they are selected
+        self.runner = BackgroundRunner(self.master)
+        self.tabs = {
+            str(self.summary_frame): (self.compute_summary, self.render_summary),
+            str(self.trend_frame): (self.compute_trend, self.render_trend),
+            str(self.latency_frame): (self.compute_latency, self.render_latency),
+            str(self.topics_frame): (self.compute_topics, self.render_topics),
+        }
+        self.loaded_tabs = set()
+        self.loading_tabs = set()
+        self.stale_tabs = set()
+
+        # The precomputed all-time snapshot is shown first; tabs are recomputed
+        # from the feedback file only if it has changed since the snapshot
+        self.snapshot = AnalyticsSnapshot.load(snapshot_file)
+        self.snapshot_results = {}
+        if self.snapshot is not None:
+            self.snapshot_results = {
+                str(self.summary_frame): self.snapshot.summary_text(),
+                str(self.trend_frame): self.snapshot.mood_trend(),
+            }
+
+        self.build_summary_tab()
+        self.build_trend_tab()
+        self.build_latency_tab()
+        self.build_topics_tab()
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        # Let the window paint before the first tab starts loading
+        self.master.after_idle(self.on_tab_changed)
+
+        # Refresh open tabs when new feedback lands
+        self.watcher = FileWatcher(self.master, self.feedback_file, self.on_data_changed).start()
+        self.metrics_watcher = FileWatcher(self.master, self.metrics_file, self.on_data_changed).start()
+        self.topics_watcher = FileWatcher(self.master, self.topics_file, self.on_topics_changed).start()
+        self.master.bind("<Destroy>", self.on_destroy, add="+")
+
+    # -------------------- LAZY LOADING --------------------
+    def on_tab_changed(self, event=None):
+        tab_id = self.notebook.select()
+        if tab_id and (tab_id not in self.loaded_tabs or tab_id in self.stale_tabs):
+            self.load_tab(tab_id)
+
+    def load_tab(self, tab_id):
+        if tab_id in self.loading_tabs:
+            return
+        compute, render = self.tabs[tab_id]
+        if self.render_snapshot(tab_id, render):
+            return
+        self.loading_tabs.add(tab_id)
+        self.stale_tabs.discard(tab_id)
+
+        def on_done(result):
+            self.loading_tabs.discard(tab_id)
+            self.loaded_tabs.add(tab_id)
+            render(result)
+            # Data changed again while we were computing
+            if tab_id in self.stale_tabs and self.notebook.select() == tab_id:
+                self.load_tab(tab_id)
+
+        def on_error(error):
+            self.loading_tabs.discard(tab_id)
+            log.error("Could not load tab %s: %s", tab_id, error)
+
+        # Read the picker here: Tk variables must not be touched from the worker
+        bounds = self.selected_range()
+        self.runner.submit(lambda: compute(bounds), on_done, on_error)
+
+    def render_snapshot(self, tab_id, render):
+        """
+        Render a tab from the snapshot the first time it is shown ("All time"
+        only). Returns True if the snapshot is current, so no recompute is needed.
+        """
+        if tab_id not in self.snapshot_results:
+            return False
+        result = self.snapshot_results.pop(tab_id)
+        if self.selected_range() != (None, None):
+            return False
+        render(result)
+        self.loaded_tabs.add(tab_id)
+        if self.snapshot.is_fresh(self.feedback_file):
+            return True
+        # Newer feedback exists: keep the snapshot on screen while reconciling
+        self.master.after_idle(lambda: self.load_tab(tab_id))
+        return True
+
+    def on_data_changed(self):
+        # Snapshot views are superseded by anything computed from here on
+        self.snapshot_results.clear()
+        # Reload the visible tab now, the others when they're next selected
+        self.stale_tabs.update(self.loaded_tabs)
+        self.on_tab_changed()
+
+    def on_topics_changed(self):
+        # Only the Topics tab reads the topic index, which is saved after every batch
+        tab_id = str(self.topics_frame)
+        if tab_id in self.loaded_tabs:
+            self.stale_tabs.add(tab_id)
+            self.on_tab_changed()
+
+    def on_destroy(self, event):
+        if event.widget is self.master:
+            self.watcher.stop()
+            self.metrics_watcher.stop()
+            self.topics_watcher.stop()
+            self.runner.close()
 
-        # Load both dashboards
-        self.load_summary_dashboard()
-        self.load_trend_dashboard()
+    # -------------------- QUERIES --------------------
+    def get_index(self):
+        """Return the feedback TimeIndex, brought up to date with the file (worker thread)."""
+        with self.index_lock:
+            try:
+                with open_snapshot(self.feedback_file) as snapshot:
+                    signature = (snapshot.identity, snapshot.size)
+                    if self.index is None or signature != self.index_signature:
+                        self._update_index(snapshot)
+                        self.index_signature = signature
+            except FileNotFoundError:
+                self.index, self.index_signature, self.index_offset = TimeIndex(), None, None
+            except (OSError, ValueError) as e:
+                # A malformed log is indexed as far as it can be read
+                log.warning("Could not read %s: %s", self.feedback_file, e)
+                self.index = TimeIndex.from_feedback_file(self.feedback_file)
+                self.index_signature = self.index_offset = None
+            return self.index
+
+    def _update_index(self, snapshot):
+        stream = JsonEntryStream(self.feedback_file)
+        if (self.index is not None and self.index_offset is not None
+                and snapshot.fingerprint(self.index_offset) == self.index_fingerprint):
+            try:
+                appended = stream.entries_after(self.index_offset, snapshot)
+            except ValueError:
+                appended = None
+            if appended is not None:
+                for record in feedback_records(appended):
+                    self.index.add(record)
+                self._mark_index(stream, snapshot)
+                return
+        log.debug("Rebuilding the feedback index")
+        self.index = TimeIndex(feedback_records(stream.read(snapshot)))
+        self._mark_index(stream, snapshot)
+
+    def _mark_index(self, stream, snapshot):
+        self.index_offset = stream.end_offset(snapshot)
+        self.index_fingerprint = (snapshot.fingerprint(self.index_offset)
+                                  if self.index_offset is not None else None)
+
+    def selected_range(self):
+        return preset_range(self.range_var.get())
 
     # -------------------- SUMMARY TAB --------------------
-    def load_summary_dashboard(self):
+    def build_summary_tab(self):
         tk.Label(
             self.summary_frame,
             text="User Preference Summary",
@@ -38,21 +228,31 @@ class AnalyticsHub:
             bg="#1e1e1e"
         ).pack(pady=10)
 
-        summary = PreferenceSummary(feedback_file="data/user_data.json")
-        text_summary = summary.summarize()
-
-        tk.Message(
+        self.summary_message = tk.Message(
             self.summary_frame,
-            text=text_summary,
+            text="Loading summary…",
             width=800,
             font=("Segoe UI", 12),
             fg="#dddddd",
             bg="#1e1e1e",
             justify="center"
-        ).pack(pady=20)
+        )
+        self.summary_message.pack(pady=20)
+
+    def compute_summary(self, bounds):
+        start, end = bounds
+        with self.index_lock:
+            index = self.get_index()
+            records = index.range(start, end)
+            like_rate, mood_average = index.like_rate(start, end), index.mood_average(start, end)
+        summary = PreferenceSummary(feedback_file=self.feedback_file, data=records)
+        return format_summary(summary.summarize(), like_rate, mood_average)
+
+    def render_summary(self, text_summary):
+        self.summary_message.config(text=text_summary)
 
     # -------------------- TREND TAB --------------------
-    def load_trend_dashboard(self):
+    def build_trend_tab(self):
         tk.Label(
             self.trend_frame,
             text="Mood Trend Visualization",
@@ -61,21 +261,214 @@ class AnalyticsHub:
             bg="#1e1e1e"
         ).pack(pady=10)
 
-        trend = MoodTrendDashboard(feedback_file="data/user_data.json")
-        fig = trend.plot_mood_trends()
+        self.trend_body = tk.Frame(self.trend_frame, bg="#1e1e1e")
+        self.trend_body.pack(fill="both", expand=True)
+        # Owned by the Tk thread: it holds the figure the trend is drawn on
+        self.trend = MoodTrendDashboard(feedback_file=self.feedback_file, data=[])
+        self.trend_canvas = None
+        self._trend_placeholder("Loading mood trends…")
+
+    def _trend_placeholder(self, text):
+        for widget in self.trend_body.winfo_children():
+            widget.destroy()
+        tk.Label(
+            self.trend_body,
+            text=text,
+            font=("Segoe UI", 12),
+            fg="#bbbbbb",
+            bg="#1e1e1e"
+        ).pack(pady=20)
+
+    def compute_trend(self, bounds):
+        with self.index_lock:
+            records = self.get_index().range(*bounds)
+        # A throwaway dashboard for the counts; self.trend stays on the Tk thread
+        return MoodTrendDashboard(feedback_file=self.feedback_file, data=records).mood_trend()
+
+    def render_trend(self, mood_by_date):
+        # The figure is updated on the Tk thread; only the data crunching is backgrounded
+        fig = self.trend.plot_mood_trends(mood_by_date) if mood_by_date else None
+
+        if not fig:
+            self.trend_canvas = None
+            self._trend_placeholder("No data available yet to visualize mood trends.")
+        elif self.trend_canvas is None:
+            for widget in self.trend_body.winfo_children():
+                widget.destroy()
+            self.trend_canvas = FigureCanvasTkAgg(fig, master=self.trend_body)
+            self.trend_canvas.draw()
+            self.trend_canvas.get_tk_widget().pack(fill="both", expand=True)
+        else:
+            self.trend_canvas.draw_idle()
+
+    # -------------------- LATENCY TAB --------------------
+    def build_latency_tab(self):
+        tk.Label(
+            self.latency_frame,
+            text="Reply Latency & Fallbacks",
+            font=("Segoe UI", 18, "bold"),
+            fg="white",
+            bg="#1e1e1e"
+        ).pack(pady=10)
+
+        self.latency_stats = tk.Label(
+            self.latency_frame,
+            text="Loading reply metrics…",
+            font=("Segoe UI", 11),
+            fg="#bbbbbb",
+            bg="#1e1e1e"
+        )
+        self.latency_stats.pack()
+
+        self.latency_body = tk.Frame(self.latency_frame, bg="#1e1e1e")
+        self.latency_body.pack(fill="both", expand=True)
+        self.latency_aggregate = None
+        self.latency_fig = None
+        self.latency_canvas = None
+        self.latency_lines = {}
+
+    def compute_latency(self, bounds):
+        # Loaded once from the saved daily aggregate, then only new log lines are read
+        if self.latency_aggregate is None:
+            self.latency_aggregate = DailyLatencyAggregate.load(self.metrics_aggregate_file, self.metrics_file)
+        else:
+            self.latency_aggregate.catch_up(self.metrics_file)
+        return self.latency_aggregate.daily_series(*bounds)
+
+    def render_latency(self, rows):
+        if not rows:
+            self.latency_stats.config(text="No reply metrics recorded yet.")
+            self._clear_latency_chart()
+            return
+
+        replies = sum(row[4] for row in rows)
+        fallbacks = sum(row[3] * row[4] for row in rows)
+        self.latency_stats.config(
+            text=f"{replies} replies · fallback rate {fallbacks / replies:.1%} · "
+                 f"latest p50 {rows[-1][1]:.0f} ms · p95 {rows[-1][2]:.0f} ms"
+        )
+
+        if self.latency_fig is None:
+            self.latency_fig = Figure(figsize=(8, 5))
+            latency_ax = self.latency_fig.add_subplot(211)
+            latency_ax.set_title("Reply latency per day", fontsize=12)
+            latency_ax.set_ylabel("ms")
+            latency_ax.grid(True)
+            fallback_ax = self.latency_fig.add_subplot(212, sharex=latency_ax)
+            fallback_ax.set_ylabel("Fallback rate")
+            fallback_ax.set_ylim(0, 1)
+            fallback_ax.grid(True)
+            (self.latency_lines["p50"],) = latency_ax.plot([], [], marker="o", label="p50")
+            (self.latency_lines["p95"],) = latency_ax.plot([], [], marker="o", label="p95")
+            (self.latency_lines["fallback"],) = fallback_ax.plot([], [], marker="o", color="#e74c3c")
+            latency_ax.legend()
+
+        dates = [row[0] for row in rows]
+        series = {"p50": [row[1] for row in rows], "p95": [row[2] for row in rows],
+                  "fallback": [row[3] for row in rows]}
+        latency_ax, fallback_ax = self.latency_fig.axes
+        dates, series = bucket_series(dates, series, max_points_for(self.latency_fig, latency_ax), reduce="mean")
+        for name, line in self.latency_lines.items():
+            line.set_data(dates, series[name])
+        latency_ax.relim()
+        latency_ax.autoscale_view()
+        self.latency_fig.autofmt_xdate()
+        self.latency_fig.tight_layout()
+
+        if self.latency_canvas is None:
+            self.latency_canvas = FigureCanvasTkAgg(self.latency_fig, master=self.latency_body)
+            self.latency_canvas.draw()
+            self.latency_canvas.get_tk_widget().pack(fill="both", expand=True)
+        else:
+            self.latency_canvas.draw_idle()
+
+    def _clear_latency_chart(self):
+        # Drop the previous range's chart; the next rows build a new one
+        for widget in self.latency_body.winfo_children():
+            widget.destroy()
+        self.latency_fig = None
+        self.latency_canvas = None
+        self.latency_lines = {}
+
+    # -------------------- TOPICS TAB --------------------
+    def build_topics_tab(self):
+        tk.Label(
+            self.topics_frame,
+            text="What You Talk About",
+            font=("Segoe UI", 18, "bold"),
+            fg="white",
+            bg="#1e1e1e"
+        ).pack(pady=10)
+
+        self.topics_stats = tk.Label(
+            self.topics_frame,
+            text="Loading topics…",
+            font=("Segoe UI", 11),
+            fg="#bbbbbb",
+            bg="#1e1e1e"
+        )
+        self.topics_stats.pack()
+
+        self.topics_body = tk.Frame(self.topics_frame, bg="#1e1e1e")
+        self.topics_body.pack(fill="both", expand=True)
+        self.topics_fig = None
+        self.topics_canvas = None
+        self.topic_lines = {}
+
+    def compute_topics(self, bounds, top_n=5):
+        # Per-day counters maintained by the topic indexer; no messages are re-read
+        index = TopicIndex.load(self.topics_file)
+        top = index.top(top_n, *bounds)
+        dates, series = index.series([topic for topic, _ in top], *bounds)
+        return top, dates, series
 
-        if fig:
-            canvas = FigureCanvasTkAgg(fig, master=self.trend_frame)
-            canvas.draw()
-            canvas.get_tk_widget().pack(fill="both", expand=True)
+    def render_topics(self, result):
+        top, dates, series = result
+        if not top:
+            self.topics_stats.config(text="No topics extracted yet.")
+            self._clear_topics_chart()
+            return
+        self.topics_stats.config(text="Top topics: " + " · ".join(f"{topic} ({n})" for topic, n in top))
+
+        if self.topics_fig is None:
+            self.topics_fig = Figure(figsize=(8, 5))
+            ax = self.topics_fig.add_subplot(111)
+            ax.set_title("Top topics per day", fontsize=12)
+            ax.set_ylabel("Messages")
+            ax.grid(True)
+        ax = self.topics_fig.axes[0]
+        dates, series = bucket_series(dates, series, max_points_for(self.topics_fig, ax))
+
+        for topic, values in series.items():
+            line = self.topic_lines.get(topic)
+            if line is None:
+                (line,) = ax.plot(dates, values, marker="o", label=topic)
+                self.topic_lines[topic] = line
+            else:
+                line.set_data(dates, values)
+        for topic in list(self.topic_lines):
+            if topic not in series:
+                self.topic_lines.pop(topic).remove()
+        ax.relim()
+        ax.autoscale_view()
+        ax.legend(title="Topic")
+        self.topics_fig.autofmt_xdate()
+        self.topics_fig.tight_layout()
+
+        if self.topics_canvas is None:
+            self.topics_canvas = FigureCanvasTkAgg(self.topics_fig, master=self.topics_body)
+            self.topics_canvas.draw()
+            self.topics_canvas.get_tk_widget().pack(fill="both", expand=True)
         else:
-            tk.Label(
-                self.trend_frame,
-                text="No data available yet to visualize mood trends.",
-                font=("Segoe UI", 12),
-                fg="#bbbbbb",
-                bg="#1e1e1e"
-            ).pack(pady=20)
+            self.topics_canvas.draw_idle()
+
+    def _clear_topics_chart(self):
+        # Drop the previous range's chart; the next topics build a new one
+        for widget in self.topics_body.winfo_children():
+            widget.destroy()
+        self.topics_fig = None
+        self.topics_canvas = None
+        self.topic_lines = {}
 
 
 # -------------------- MAIN --------------------
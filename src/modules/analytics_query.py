@@ -0,0 +1,195 @@
+# -------------------- analytics_query.py --------------------
+from modules.json_stream import iter_json_entries
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from modules.log_setup import get_logger
+
+log = get_logger("analytics")
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Mood → score used for rolling averages (VADER and TextBlob labels)
+MOOD_SCORES = {
+    "positive": 1, "happy": 1,
+    "neutral": 0,
+    "negative": -1, "sad": -1,
+}
+
+# Presets shown in the date-range pickers
+RANGE_PRESETS = ("All time", "Last 7 days", "Last 30 days", "This month")
+
+
+def to_seconds(value):
+    """
+    Convert a stored timestamp string or datetime to integer seconds.
+    Seconds count from 0001-01-01 (local, naive) so no timezone lookups are needed.
+    Returns None for missing or malformed timestamps.
+    """
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return value.toordinal() * 86400 + value.hour * 3600 + value.minute * 60 + value.second
+
+
+def from_seconds(seconds):
+    days, rest = divmod(seconds, 86400)
+    return datetime.fromordinal(days) + timedelta(seconds=rest)
+
+
+def preset_range(name, now=None):
+    """Return (start, end) datetimes for a picker preset; (None, None) means all time."""
+    now = now or datetime.now()
+    end = now + timedelta(seconds=1)
+    if name == "Last 7 days":
+        return now - timedelta(days=7), end
+    if name == "Last 30 days":
+        return now - timedelta(days=30), end
+    if name == "This month":
+        return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0), end
+    return None, None
+
+
+class TimeIndex:
+    """
+    Records sorted by timestamp, with prefix sums for O(1) window aggregates.
+
+    range()/count() locate a window with two binary searches, so a narrow
+    query only pays for the records it returns.
+    """
+
+    def __init__(self, records=(), mood_key="detected_mood", feedback_key="feedback"):
+        self.mood_key = mood_key
+        self.feedback_key = feedback_key
+        self.times = []
+        self.records = []
+        # prefix[i] = totals over records[:i]
+        self._mood_sum = [0]
+        self._mood_n = [0]
+        self._likes = [0]
+        self._rated = [0]
+
+        rows = []
+        for record in records:
+            ts = _record_seconds(record)
+            if ts is not None:
+                rows.append((ts, record))
+        rows.sort(key=lambda row: row[0])
+        self.times = [ts for ts, _ in rows]
+        self.records = [record for _, record in rows]
+        self._rebuild_prefix(0)
+
+    @classmethod
+    def from_feedback_file(cls, path="data/user_data.json"):
+        from modules.records import feedback_records
+        return cls(feedback_records(_iter_entries(path)))
+
+    @classmethod
+    def from_memory_file(cls, path="data/memory.json"):
+        from modules.records import memory_records
+        return cls(memory_records(_iter_entries(path)), mood_key="mood", feedback_key=None)
+
+    def __len__(self):
+        return len(self.records)
+
+    # ---------- MAINTENANCE ----------
+    def _row_values(self, record):
+        score = MOOD_SCORES.get(record.get(self.mood_key))
+        feedback = record.get(self.feedback_key) if self.feedback_key else None
+        return (score or 0, score is not None,
+                feedback == "like", feedback in ("like", "dislike"))
+
+    def _rebuild_prefix(self, start):
+        del self._mood_sum[start + 1:], self._mood_n[start + 1:]
+        del self._likes[start + 1:], self._rated[start + 1:]
+        for record in self.records[start:]:
+            self._append_prefix(record)
+
+    def _append_prefix(self, record):
+        score, has_mood, liked, rated = self._row_values(record)
+        self._mood_sum.append(self._mood_sum[-1] + score)
+        self._mood_n.append(self._mood_n[-1] + has_mood)
+        self._likes.append(self._likes[-1] + liked)
+        self._rated.append(self._rated[-1] + rated)
+
+    def add(self, record):
+        """Add one record; appends in O(1) when it is the newest (the usual case)."""
+        ts = _record_seconds(record)
+        if ts is None:
+            return
+        if not self.times or ts >= self.times[-1]:
+            self.times.append(ts)
+            self.records.append(record)
+            self._append_prefix(record)
+            return
+        pos = bisect_right(self.times, ts)
+        insort(self.times, ts)
+        self.records.insert(pos, record)
+        self._rebuild_prefix(pos)
+
+    # ---------- QUERIES ----------
+    def bounds(self, start=None, end=None):
+        """Index slice [lo, hi) for start <= timestamp < end."""
+        lo = 0 if start is None else bisect_left(self.times, to_seconds(start))
+        hi = len(self.times) if end is None else bisect_left(self.times, to_seconds(end))
+        return lo, max(lo, hi)
+
+    def range(self, start=None, end=None):
+        lo, hi = self.bounds(start, end)
+        return self.records[lo:hi]
+
+    def count(self, start=None, end=None):
+        lo, hi = self.bounds(start, end)
+        return hi - lo
+
+    def mood_average(self, start=None, end=None):
+        lo, hi = self.bounds(start, end)
+        n = self._mood_n[hi] - self._mood_n[lo]
+        return (self._mood_sum[hi] - self._mood_sum[lo]) / n if n else None
+
+    def like_rate(self, start=None, end=None):
+        lo, hi = self.bounds(start, end)
+        rated = self._rated[hi] - self._rated[lo]
+        return (self._likes[hi] - self._likes[lo]) / rated if rated else None
+
+    def _rolling(self, func, window, start, end, step):
+        if not self.times:
+            return []
+        start = from_seconds(self.times[0]) if start is None else start
+        end = from_seconds(self.times[-1]) if end is None else end
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        points = []
+        while day <= end:
+            window_end = day + timedelta(days=1)
+            points.append((day.date(), func(window_end - window, window_end)))
+            day += step
+        return points
+
+    def rolling_mood_average(self, window=timedelta(days=7), start=None, end=None,
+                             step=timedelta(days=1)):
+        """[(date, mean mood score over the `window` ending that day)]"""
+        return self._rolling(self.mood_average, window, start, end, step)
+
+    def rolling_like_rate(self, window=timedelta(days=7), start=None, end=None,
+                          step=timedelta(days=1)):
+        """[(date, like / (like + dislike) over the `window` ending that day)]"""
+        return self._rolling(self.like_rate, window, start, end, step)
+
+
+def _record_seconds(record):
+    # Slotted records (modules/records.py) already carry integer seconds
+    ts = getattr(record, "ts", None)
+    return ts if ts is not None else to_seconds(record.get("timestamp"))
+
+
+def _iter_entries(path):
+    # Stream entries; a malformed file ends the stream instead of raising
+    try:
+        yield from iter_json_entries(path)
+    except (OSError, ValueError) as e:
+        log.debug("Error loading %s: %s", path, e)
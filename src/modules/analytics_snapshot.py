@@ -0,0 +1,225 @@
+# -------------------- analytics_snapshot.py --------------------
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from modules.analytics_query import TimeIndex, from_seconds
+from modules.file_lock import atomic_write
+from modules.preference_summary import PreferenceSummary
+from modules.records import load_feedback_records
+from modules.log_setup import get_logger
+
+log = get_logger("snapshot")
+
+SNAPSHOT_VERSION = 2
+DEFAULT_SNAPSHOT_FILE = "data/analytics_snapshot.json"
+
+
+def file_signature(path):
+    """(mtime_ns, size) of `path`, the same signature FileWatcher compares; None if missing."""
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+def format_summary(summary, like_rate, mood_average):
+    """Text of the hub's summary tab."""
+    lines = [summary]
+    if like_rate is not None:
+        lines.append(f"Like rate: {like_rate:.0%}")
+    if mood_average is not None:
+        lines.append(f"Average mood score: {mood_average:+.2f} (−1 negative … +1 positive)")
+    return "\n\n".join(lines)
+
+
+class AnalyticsSnapshot:
+    """
+    All-time analytics precomputed from the feedback log: the preference
+    summary, like rate and mood average, per-day mood counts and per-tone
+    like/dislike counts. Tone counts cover every record, as the dashboard's
+    JSON and archive paths do; the rest covers the timestamped ones.
+
+    It is a few KB of JSON regardless of history size, so the hub can show
+    real numbers as soon as it opens. `source_signature` is the feedback
+    file's signature when the snapshot was taken; is_fresh() compares it.
+    """
+
+    def __init__(self, summary, like_rate, mood_average, mood_by_date, tone_feedback,
+                 entries=0, source_signature=None, created=None):
+        self.summary = summary
+        self.like_rate = like_rate
+        self.mood_average = mood_average
+        self.mood_by_date = mood_by_date          # {date: Counter(mood → n)}
+        self.tone_feedback = tone_feedback        # {tone: [likes, dislikes]}
+        self.entries = entries
+        self.source_signature = source_signature
+        self.created = created if created is not None else time.time()
+
+    @classmethod
+    def build(cls, records, source_signature=None):
+        """Compute a snapshot from feedback records (the same window as the hub's "All time")."""
+        index = TimeIndex(records)
+        data = index.range()
+
+        mood_by_date = {}
+        for ts, record in zip(index.times, data):
+            day = from_seconds(ts).date()
+            mood_by_date.setdefault(day, Counter())[record.get("detected_mood", "unknown")] += 1
+
+        tone_feedback = {}
+        for record in records:
+            feedback = record.get("feedback")
+            tone = record.get("tone_used")
+            if feedback in ("like", "dislike") and tone is not None:
+                counts = tone_feedback.setdefault(tone, [0, 0])
+                counts[feedback == "dislike"] += 1
+
+        summary = PreferenceSummary(data=data).summarize()
+        return cls(summary, index.like_rate(), index.mood_average(), mood_by_date, tone_feedback,
+                   len(data), source_signature)
+
+    @classmethod
+    def from_file(cls, feedback_file="data/user_data.json"):
+        signature = file_signature(feedback_file)
+        return cls.build(load_feedback_records(feedback_file), signature)
+
+    # ---------- VIEWS ----------
+    def summary_text(self):
+        return format_summary(self.summary, self.like_rate, self.mood_average)
+
+    def mood_trend(self):
+        """{date: Counter} as MoodTrendDashboard.prepare_mood_trend returns it (None if empty)."""
+        return {day: Counter(counts) for day, counts in self.mood_by_date.items()} or None
+
+    def tone_feedback_counts(self):
+        """(liked, disliked) Counters keyed by tone, as ToneAdaptationDashboard returns them."""
+        liked = Counter({tone: n[0] for tone, n in self.tone_feedback.items() if n[0]})
+        disliked = Counter({tone: n[1] for tone, n in self.tone_feedback.items() if n[1]})
+        return liked, disliked
+
+    def is_fresh(self, feedback_file):
+        return self.source_signature is not None and file_signature(feedback_file) == self.source_signature
+
+    # ---------- PERSISTENCE ----------
+    def to_dict(self):
+        return {
+            "version": SNAPSHOT_VERSION,
+            "created": self.created,
+            "source_signature": list(self.source_signature) if self.source_signature else None,
+            "entries": self.entries,
+            "summary": self.summary,
+            "like_rate": self.like_rate,
+            "mood_average": self.mood_average,
+            "mood_by_date": {day.isoformat(): dict(counts) for day, counts in sorted(self.mood_by_date.items())},
+            "tone_feedback": self.tone_feedback,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {data.get('version')!r}")
+        signature = data.get("source_signature")
+        return cls(
+            data["summary"], data.get("like_rate"), data.get("mood_average"),
+            {date.fromisoformat(day): Counter(counts) for day, counts in data.get("mood_by_date", {}).items()},
+            data.get("tone_feedback", {}),
+            data.get("entries", 0), tuple(signature) if signature else None, data.get("created"),
+        )
+
+    @classmethod
+    def load(cls, path=DEFAULT_SNAPSHOT_FILE):
+        """The saved snapshot, or None if there is none or it can't be read."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning("Ignoring unreadable analytics snapshot %s: %s", path, e)
+            return None
+
+    def save(self, path=DEFAULT_SNAPSHOT_FILE):
+        with atomic_write(path) as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+
+class SnapshotScheduler:
+    """
+    Keeps the app's analytics snapshot current.
+
+    notify() after each saved feedback entry; the snapshot is rebuilt on a
+    worker thread once feedback has been quiet for `quiet_ms`, or right away
+    after `max_pending` entries. flush() rebuilds synchronously if anything
+    is pending (call it at shutdown).
+
+    `get_records` is called on the Tk thread and must return the current
+    feedback records; they are copied so the worker never sees later edits.
+    """
+
+    def __init__(self, widget, get_records, feedback_file="data/user_data.json",
+                 path=DEFAULT_SNAPSHOT_FILE, quiet_ms=3000, max_pending=20):
+        self.widget = widget
+        self.get_records = get_records
+        self.feedback_file = feedback_file
+        self.path = path
+        self.quiet_ms = quiet_ms
+        self.max_pending = max_pending
+        self.pending = 0
+        self._job = None
+        # One worker, so snapshots are written in order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot")
+
+    def ensure_fresh(self):
+        """Rebuild in the background if the saved snapshot doesn't match the feedback file."""
+        if file_signature(self.feedback_file) is None:
+            return
+        snapshot = AnalyticsSnapshot.load(self.path)
+        if snapshot is None or not snapshot.is_fresh(self.feedback_file):
+            self.regenerate()
+
+    def notify(self):
+        self.pending += 1
+        self._cancel()
+        if self.pending >= self.max_pending:
+            self.regenerate()
+        else:
+            self._job = self.widget.after(self.quiet_ms, self.regenerate)
+
+    def _cancel(self):
+        if self._job is not None:
+            try:
+                self.widget.after_cancel(self._job)
+            except Exception:
+                pass
+            self._job = None
+
+    def _take(self):
+        # Records and signature are taken together, after the feedback file was written
+        self.pending = 0
+        return list(self.get_records()), file_signature(self.feedback_file)
+
+    def _write(self, records, signature):
+        start = time.perf_counter()
+        try:
+            AnalyticsSnapshot.build(records, signature).save(self.path)
+        except Exception as e:
+            log.error("Analytics snapshot failed: %s", e)
+            return
+        log.debug("Analytics snapshot written",
+                  extra={"entries": len(records), "ms": round((time.perf_counter() - start) * 1000, 1)})
+
+    def regenerate(self):
+        self._job = None
+        self._executor.submit(self._write, *self._take())
+
+    def flush(self):
+        """Rebuild now if feedback arrived since the last snapshot, and wait for writes to finish."""
+        self._cancel()
+        if self.pending:
+            self.regenerate()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,264 @@
+# -------------------- backends.py --------------------
+import asyncio
+import json
+import os
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+from modules.local_generator import LocalGenerator
+from modules.log_setup import get_logger
+
+log = get_logger("backends")
+
+# Registry name → Backend subclass; see register_backend()
+BACKENDS = {}
+
+
+def register_backend(name):
+    """Class decorator adding a Backend subclass to the registry under `name`."""
+    def decorator(cls):
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+def create_backend(name, **options):
+    try:
+        backend_cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown backend {name!r}; registered: {', '.join(sorted(BACKENDS))}") from None
+    return backend_cls(**options)
+
+
+class GenerationRequest:
+    """Everything a backend needs for one reply."""
+
+    __slots__ = ("message", "tone", "mood", "liked_tone_counts", "liked_mood_counts")
+
+    def __init__(self, message, tone, mood, liked_tone_counts=None, liked_mood_counts=None):
+        self.message = message
+        self.tone = tone
+        self.mood = mood
+        self.liked_tone_counts = liked_tone_counts or {}
+        self.liked_mood_counts = liked_mood_counts or {}
+
+
+class Backend:
+    """
+    A reply generator behind ResponseEngine.
+
+    Subclasses implement generate(request) and may override warm_up() and
+    stream(request). Callers go through run()/arun(), which apply the
+    backend's own concurrency limit and timeout and make sure warm_up() has
+    run once. arun() is the async form of run(); both share the same limit.
+    """
+
+    name = None
+
+    def __init__(self, max_concurrency=None, timeout=None):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._ready_lock = threading.Lock()
+        self._ready = False
+
+    # ---------- HOOKS ----------
+    def warm_up(self):
+        """Load clients/models. Called once, possibly from a background thread."""
+
+    def generate(self, request):
+        raise NotImplementedError
+
+    def stream(self, request):
+        """Yield the reply in pieces; backends without streaming yield it whole."""
+        yield self.run(request)
+
+    # ---------- CALLING ----------
+    def ensure_ready(self):
+        if not self._ready:
+            with self._ready_lock:
+                if not self._ready:
+                    self.warm_up()
+                    self._ready = True
+        return self
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the backend's concurrency slots (waits up to `timeout`)."""
+        self.ensure_ready()
+        if self._slots is None:
+            yield
+            return
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"{self.name}: no free slot within {self.timeout}s")
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def run(self, request):
+        with self.slot():
+            return self.generate(request)
+
+    async def arun(self, request):
+        # Runs on a worker thread so blocking SDKs don't stall the event loop
+        call = asyncio.to_thread(self.run, request)
+        if self.timeout is None:
+            return await call
+        return await asyncio.wait_for(call, self.timeout)
+
+
+@register_backend("local")
+class LocalTemplateBackend(Backend):
+    """The precompiled template generator (modules/local_generator.py)."""
+
+    def __init__(self, generator=None, seed=None, **options):
+        super().__init__(**options)
+        self.generator = generator or LocalGenerator(seed=seed)
+
+    def warm_up(self):
+        # Join every tone's reply strings up front
+        self.generator.all_replies()
+
+    def generate(self, request):
+        return self.generator.generate(request.tone, request.mood,
+                                       request.liked_tone_counts, request.liked_mood_counts)
+
+
+@register_backend("openai")
+class OpenAIChatBackend(Backend):
+    """OpenAI chat completions with DotPi's mood/tone system prompt."""
+
+    def __init__(self, model="gpt-4o-mini", temperature=0.8, max_concurrency=8, timeout=30,
+                 api_key=None, base_url=None):
+        super().__init__(max_concurrency=max_concurrency, timeout=timeout)
+        self.model = model
+        self.temperature = temperature
+        self.api_key = api_key
+        # Any OpenAI-compatible endpoint (e.g. the load-test fake API)
+        self.base_url = base_url
+        self.client = None
+
+    def warm_up(self):
+        from openai import OpenAI
+        from dotenv import load_dotenv
+
+        # Load API key and initialize client
+        load_dotenv()
+        api_key = self.api_key or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            log.warning("No OpenAI API key found. Running in local mode.")
+        self.client = OpenAI(api_key=api_key, base_url=self.base_url) if api_key else None
+        return self.client
+
+    @staticmethod
+    def system_prompt(request):
+        return (
+            "You are DotPi — an intelligent, emotionally-aware AI coach. "
+            "Your goal is to respond to the user in a tone that fits both their detected mood "
+            "and their learned preference tone. "
+            "Be concise, human-like, and emotionally attuned. "
+            f"Detected mood: {request.mood}. "
+            f"Preferred tone: {request.tone}. "
+            "If user sounds down, be supportive. If positive, encourage them. "
+            "Keep it conversational, no long paragraphs. "
+        )
+
+    def messages(self, request):
+        return [
+            {"role": "system", "content": self.system_prompt(request)},
+            {"role": "user", "content": request.message}
+        ]
+
+    def _create(self, request, **kwargs):
+        if self.client is None:
+            raise RuntimeError("No OpenAI client configured")
+        return self.client.chat.completions.create(
+            model=self.model,
+            messages=self.messages(request),
+            temperature=self.temperature,
+            timeout=self.timeout,
+            **kwargs
+        )
+
+    def generate(self, request):
+        response = self._create(request)
+        return response.choices[0].message.content.strip()
+
+    def stream(self, request):
+        with self.slot():
+            for chunk in self._create(request, stream=True):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+
+@register_backend("http-chat")
+class HTTPChatBackend(OpenAIChatBackend):
+    """
+    Plain-HTTP client for an OpenAI-compatible /chat/completions endpoint.
+    Needs no SDK; used against local stand-ins such as the load-test fake API.
+    """
+
+    def __init__(self, base_url="http://127.0.0.1:8000/v1", **options):
+        super().__init__(base_url=base_url, **options)
+
+    def warm_up(self):
+        pass
+
+    def generate(self, request):
+        body = json.dumps({
+            "model": self.model,
+            "messages": self.messages(request),
+            "temperature": self.temperature,
+        }).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        http_request = urllib.request.Request(self.base_url.rstrip("/") + "/chat/completions",
+                                              data=body, headers=headers, method="POST")
+        with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+            payload = json.load(response)
+        return payload["choices"][0]["message"]["content"].strip()
+
+    def stream(self, request):
+        yield self.run(request)
+
+
+def benchmark_backends(backends, requests, concurrency=8):
+    """
+    Run the same requests through each backend and compare them.
+
+    backends: {label: Backend}. Returns {label: {"count", "errors",
+    "seconds", "throughput", "p50_ms", "p95_ms"}}.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def timed(backend, request):
+        start = time.perf_counter()
+        try:
+            backend.run(request)
+            return (time.perf_counter() - start) * 1000, False
+        except Exception:
+            return (time.perf_counter() - start) * 1000, True
+
+    report = {}
+    for label, backend in backends.items():
+        backend.ensure_ready()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(lambda r: timed(backend, r), requests))
+        seconds = time.perf_counter() - start
+        latencies = sorted(ms for ms, failed in outcomes if not failed)
+        report[label] = {
+            "count": len(outcomes),
+            "errors": sum(1 for _, failed in outcomes if failed),
+            "seconds": round(seconds, 3),
+            "throughput": round(len(outcomes) / seconds, 1) if seconds else None,
+            "p50_ms": round(latencies[len(latencies) // 2], 2) if latencies else None,
+            "p95_ms": round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)], 2)
+            if latencies else None,
+        }
+    return report
@@ -0,0 +1,171 @@
+# -------------------- background.py --------------------
+import os
+import queue
+import threading
+
+from modules.log_setup import get_logger
+
+log = get_logger("background")
+
+
+class BackgroundRunner:
+    """
+    Run functions on worker threads and deliver results on the Tk thread.
+
+    Tk widgets must only be touched from the main loop, so workers put their
+    results on a queue and the widget polls it with `after`.
+    """
+
+    def __init__(self, widget, poll_ms=50):
+        self.widget = widget
+        self.poll_ms = poll_ms
+        self._results = queue.Queue()
+        self._polling = False
+        self._closed = False
+
+    def submit(self, func, on_done, on_error=None):
+        """Call func() on a daemon thread, then on_done(result) on the Tk thread."""
+        def worker():
+            try:
+                self._results.put((on_done, func()))
+            except Exception as e:
+                if on_error:
+                    self._results.put((on_error, e))
+                else:
+                    log.error("Task failed: %s", e)
+
+        threading.Thread(target=worker, daemon=True).start()
+        if not self._polling:
+            self._polling = True
+            self.widget.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        if self._closed:
+            return
+        try:
+            while True:
+                callback, value = self._results.get_nowait()
+                try:
+                    callback(value)
+                except Exception as e:
+                    log.error("Callback failed: %s", e)
+        except queue.Empty:
+            pass
+        try:
+            self.widget.after(self.poll_ms, self._poll)
+        except Exception:
+            # Widget was destroyed
+            self._closed = True
+
+    def close(self):
+        self._closed = True
+
+
+class FileWatcher:
+    """Poll a file's mtime/size from the Tk loop and call back when it changes."""
+
+    def __init__(self, widget, path, callback, interval_ms=2000):
+        self.widget = widget
+        self.path = path
+        self.callback = callback
+        self.interval_ms = interval_ms
+        self.signature = self._signature()
+        self._job = None
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def start(self):
+        self._job = self.widget.after(self.interval_ms, self._check)
+        return self
+
+    def _check(self):
+        signature = self._signature()
+        if signature != self.signature:
+            self.signature = signature
+            self.callback()
+        try:
+            self._job = self.widget.after(self.interval_ms, self._check)
+        except Exception:
+            self._job = None
+
+    def stop(self):
+        if self._job is not None:
+            try:
+                self.widget.after_cancel(self._job)
+            except Exception:
+                pass
+            self._job = None
+
+
+class SendCoalescer:
+    """
+    Turn rapid successive sends into a single generation request.
+
+    add() queues an item and restarts a `window_ms` timer on the Tk loop;
+    when the timer fires, everything still unanswered goes out as one batch.
+    start(batch) is called on the Tk thread and returns the function to run
+    on a worker thread; deliver(batch, result) gets its result on the Tk thread.
+
+    A send while a request is in flight supersedes it: a worker call can't
+    be interrupted, so its result is dropped on arrival and its items stay
+    pending, to be answered together with the new ones. Every item goes out
+    in exactly one delivered reply, made with the context current when it
+    was requested.
+    """
+
+    def __init__(self, widget, start, deliver, window_ms=400, on_error=None):
+        self.widget = widget
+        self.start = start
+        self.deliver = deliver
+        self.window_ms = window_ms
+        self.on_error = on_error
+        self.runner = BackgroundRunner(widget)
+        self.pending = []           # sent but not yet answered, oldest first
+        self.superseded = 0
+        self._generation = 0        # bumped by every add(); results of older requests are stale
+        self._in_flight = None      # generation of the newest request running on a worker
+        self._job = None
+
+    def add(self, item):
+        self.pending.append(item)
+        self._generation += 1
+        if self._in_flight is not None:
+            self.superseded += 1
+        if self._job is not None:
+            self.widget.after_cancel(self._job)
+        self._job = self.widget.after(self.window_ms, self._dispatch)
+
+    def _dispatch(self):
+        self._job = None
+        if not self.pending:
+            return
+        batch = list(self.pending)
+        generation = self._generation
+        try:
+            func = self.start(batch)
+        except Exception as e:
+            self._finish(generation, batch, e, self.on_error)
+            return
+        self._in_flight = generation
+        self.runner.submit(func,
+                           lambda result: self._finish(generation, batch, result, self.deliver),
+                           lambda e: self._finish(generation, batch, e, self.on_error))
+
+    def _finish(self, generation, batch, value, callback):
+        if self._in_flight == generation:
+            self._in_flight = None
+        if generation != self._generation:
+            # Newer sends overtook this batch; its items are still pending and
+            # go out with them, so only the stale reply is discarded
+            log.debug("Dropped a superseded reply", extra={"messages": len(batch)})
+            return
+        del self.pending[:len(batch)]
+        if callback is not None:
+            callback(batch, value)
+        elif isinstance(value, Exception):
+            log.error("Send failed: %s", value)
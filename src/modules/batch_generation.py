@@ -0,0 +1,115 @@
+# -------------------- batch_generation.py --------------------
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Reply for an item whose local fallback failed too
+SAFE_RESPONSE = "Sorry, I couldn't come up with a reply to that one. Could you say it again?"
+
+
+class RateLimiter:
+    """Token bucket shared by all workers. rate=None disables limiting."""
+
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class BatchResult:
+    """
+    Outcome of one batch item. `error` (message) and `error_type` (exception
+    class name) are set when the local fallback was used.
+    """
+
+    __slots__ = ("index", "response", "fallback", "error", "error_type", "latency")
+
+    def __init__(self, index, response, fallback=False, error=None, latency=0.0, error_type=None):
+        self.index = index
+        self.response = response
+        self.fallback = fallback
+        self.error = error
+        self.error_type = error_type
+        self.latency = latency
+
+    def to_dict(self):
+        return {
+            "index": self.index,
+            "response": self.response,
+            "fallback": self.fallback,
+            "error": self.error,
+            "error_type": self.error_type,
+            "latency": self.latency,
+        }
+
+
+def normalize_item(item, default_tone="Balanced"):
+    """Accept a message string, a (message, tone[, mood]) tuple or a dict."""
+    if isinstance(item, str):
+        return item, default_tone, None
+    if isinstance(item, dict):
+        return item.get("message", ""), item.get("tone", default_tone), item.get("mood")
+    message = item[0]
+    tone = item[1] if len(item) > 1 else default_tone
+    mood = item[2] if len(item) > 2 else None
+    return message, tone, mood
+
+
+def run_batch(generate, fallback, items, concurrency=8, rate_limit=None, progress=None):
+    """
+    Run `generate(message, tone, mood)` over items on a bounded thread pool.
+
+    Results come back in input order. If an item raises, `fallback` is used for
+    that item only, and if that raises too the item gets SAFE_RESPONSE, so
+    one bad item never fails the batch. `progress(done, total)` is called
+    as items finish.
+    """
+    items = [normalize_item(item) for item in items]
+    total = len(items)
+    results = [None] * total
+    limiter = RateLimiter(rate_limit, burst=concurrency)
+
+    def run_one(index, message, tone, mood):
+        limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = generate(message, tone, mood)
+            return BatchResult(index, response, latency=time.perf_counter() - start)
+        except Exception as e:
+            error = e
+        message_text = str(error)
+        try:
+            response = fallback(message, tone, mood)
+        except Exception as e:
+            response = SAFE_RESPONSE
+            message_text = f"{message_text} (fallback failed: {e})"
+        return BatchResult(index, response, fallback=True, error=message_text,
+                           latency=time.perf_counter() - start, error_type=type(error).__name__)
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        futures = [pool.submit(run_one, i, *item) for i, item in enumerate(items)]
+        done = 0
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.index] = result
+            done += 1
+            if progress:
+                progress(done, total)
+
+    return results
@@ -0,0 +1,56 @@
+# -------------------- chart_utils.py --------------------
+from datetime import date as date_cls
+
+# Roughly how many pixels each plotted point needs to stay readable
+PIXELS_PER_POINT = 4
+
+
+def max_points_for(fig, ax=None):
+    """Pixel-appropriate number of points for a figure (or one of its axes)."""
+    width_px = fig.get_figwidth() * fig.dpi
+    if ax is not None:
+        width_px *= ax.get_position().width
+    return max(int(width_px / PIXELS_PER_POINT), 2)
+
+
+def bucket_series(dates, series, max_points, reduce="sum"):
+    """
+    Bucket a daily series into at most `max_points` points.
+
+    dates: sorted list of datetime.date
+    series: {name: [value per date]}
+    reduce: "sum" for counts, "mean" for rates/latencies.
+    Returns (bucket_dates, {name: [value per bucket]}); each bucket is labeled
+    with its first date. Short series are returned unchanged.
+    """
+    if len(dates) <= max_points:
+        return list(dates), {name: list(values) for name, values in series.items()}
+
+    # Fixed-width day buckets so the x axis stays linear in time
+    first = dates[0].toordinal()
+    span = dates[-1].toordinal() - first + 1
+    width = -(-span // max_points)
+
+    bucket_dates = []
+    bucket_index = {}
+    for d in dates:
+        b = (d.toordinal() - first) // width
+        if b not in bucket_index:
+            bucket_index[b] = len(bucket_dates)
+            bucket_dates.append(date_cls.fromordinal(first + b * width))
+
+    bucketed = {}
+    for name, values in series.items():
+        sums = [0.0] * len(bucket_dates)
+        counts = [0] * len(bucket_dates)
+        for d, value in zip(dates, values):
+            if value is None:
+                continue
+            i = bucket_index[(d.toordinal() - first) // width]
+            sums[i] += value
+            counts[i] += 1
+        if reduce == "mean":
+            bucketed[name] = [s / c if c else None for s, c in zip(sums, counts)]
+        else:
+            bucketed[name] = sums
+    return bucket_dates, bucketed
@@ -0,0 +1,400 @@
+# -------------------- compaction.py --------------------
+import argparse
+import json
+import os
+import re
+import tempfile
+import time
+import zlib
+from array import array
+from collections import Counter
+
+from modules.file_lock import file_lock, replace_file
+from modules.json_stream import COMPACT_FORMAT, COMPACT_TRAILER, ENTRIES_LINE, JsonEntryStream
+from modules.log_setup import get_logger, setup_logging
+
+try:
+    import numpy as np
+except ImportError:  # optional; signatures are computed in pure Python without it
+    np = None
+
+log = get_logger("compaction")
+
+# Fields whose repeated values go into the string table: local-mode replies
+# repeat a handful of templates. Free text the user types is left inline, so
+# the table (which every reader parses, even JsonEntryStream.tail()) doesn't
+# grow with the history.
+STRING_FIELDS = ("response", "ai_response")
+
+# Fields compared for near-duplicates (memory entries / feedback entries)
+TEXT_FIELDS = ("input", "user_message")
+
+# Set on an entry whose input nearly repeats an earlier one: index of that entry
+DUPLICATE_KEY = "near_duplicate_of"
+
+# MinHash: NUM_PERM permutations split into BANDS bands for LSH candidate lookup.
+# With 16 bands of 4 rows, pairs at Jaccard 0.8 share 6.5 bands on average and
+# fewer than MIN_BAND_HITS well under 1% of the time.
+NUM_PERM = 64
+BANDS = 16
+MIN_BAND_HITS = 2
+# Bounds per-text work on very repetitive stores
+MAX_BUCKET = 64
+MAX_VERIFY = 8
+SHINGLE_SIZE = 5
+_PRIME = (1 << 31) - 1
+
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _permutations(seed=1):
+    # Fixed (a, b) pairs so signatures are reproducible between runs
+    state = seed
+    pairs = []
+    for _ in range(NUM_PERM):
+        state = (state * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+        a = state >> 33
+        state = (state * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+        b = state >> 33
+        pairs.append((a % (_PRIME - 1) + 1, b % _PRIME))
+    return pairs
+
+
+_PERMUTATIONS = _permutations()
+if np is not None:
+    _PERM_A = np.array([a for a, _ in _PERMUTATIONS], dtype=np.uint64)[:, None]
+    _PERM_B = np.array([b for _, b in _PERMUTATIONS], dtype=np.uint64)[:, None]
+
+
+def normalize(text):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return _SPACE_RE.sub(" ", _NON_WORD_RE.sub(" ", text.lower())).strip()
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Set of character `size`-grams of normalized text, hashed to 32-bit ints."""
+    if len(text) <= size:
+        return {zlib.crc32(text.encode("utf-8"))}
+    return {zlib.crc32(text[i:i + size].encode("utf-8")) for i in range(len(text) - size + 1)}
+
+
+def minhash(hashes):
+    """MinHash signature (NUM_PERM values) of a set of shingle hashes."""
+    if np is not None:
+        values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes)) % _PRIME
+        return ((_PERM_A * values + _PERM_B) % _PRIME).min(axis=1).tolist()
+    values = [h % _PRIME for h in hashes]
+    return [min((a * h + b) % _PRIME for h in values) for a, b in _PERMUTATIONS]
+
+
+class NearDuplicateIndex:
+    """
+    Flags texts that nearly repeat an earlier one (estimated Jaccard
+    similarity of their shingles >= `threshold`).
+
+    Exact repeats (after normalization) are found by a dict lookup; others
+    go through MinHash + LSH banding, so each text is only compared with the
+    few earlier texts sharing the most bands. Only first occurrences are
+    indexed, and a band bucket stops growing at MAX_BUCKET texts, so a match
+    can occasionally be missed but never invented.
+    """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self.rows = NUM_PERM // BANDS
+        self._exact = {}
+        self._buckets = {}
+        self._signatures = array("Q")
+        self._owners = array("q")   # entry index per stored signature
+
+    def add(self, index, text):
+        """Index entry `index`; return the earlier entry it duplicates, or None."""
+        text = normalize(text)
+        if not text:
+            return None
+        original = self._exact.get(text)
+        if original is not None:
+            return original
+
+        signature = minhash(shingles(text))
+        keys = [(band, tuple(signature[band * self.rows:(band + 1) * self.rows])) for band in range(BANDS)]
+        hits = Counter(slot for key in keys for slot in self._buckets.get(key, ()))
+        for slot, n in hits.most_common(MAX_VERIFY):
+            if n < MIN_BAND_HITS:
+                break
+            stored = self._signatures[slot * NUM_PERM:(slot + 1) * NUM_PERM]
+            if sum(1 for x, y in zip(signature, stored) if x == y) >= self.threshold * NUM_PERM:
+                return self._owners[slot]
+
+        self._exact[text] = index
+        slot = len(self._owners)
+        self._owners.append(index)
+        self._signatures.extend(signature)
+        for key in keys:
+            bucket = self._buckets.setdefault(key, [])
+            if len(bucket) < MAX_BUCKET:
+                bucket.append(slot)
+        return None
+
+
+# -------------------- WRITING --------------------
+def _as_dict(entry):
+    return entry.to_dict() if hasattr(entry, "to_dict") else entry
+
+
+def _string_table(entries, string_fields):
+    """Values of `string_fields` that occur more than once, most frequent first."""
+    counts = Counter(
+        value for entry in entries for field in string_fields
+        if isinstance(value := entry.get(field), str)
+    )
+    return [value for value, n in counts.most_common() if n > 1]
+
+
+def write_compact(path, entries, fields=None, string_fields=STRING_FIELDS, strings=None, source=None):
+    """
+    Write entries (dicts or records) in the compact layout, atomically.
+
+    Repeated values of `string_fields` are stored once in a string table and
+    referenced by index; other top-level `fields` (e.g. "user_name") are kept.
+    `strings` may be passed in when the table was built in an earlier pass;
+    values missing from it are written inline. Readers going through
+    JsonEntryStream get the original entries back.
+
+    The file is published under the writer lock. When `entries` were read
+    from `path` itself, pass the JsonEntryStream as `source`: entries another
+    process appended meanwhile are carried over instead of being lost.
+    """
+    if strings is None:
+        entries = [_as_dict(entry) for entry in entries]
+        strings = _string_table(entries, string_fields)
+    refs = {value: i for i, value in enumerate(strings)}
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        # "\n" on every platform: readers rely on one entry per line
+        with os.fdopen(fd, "w", encoding="utf-8", newline="\n") as out:
+            out.write(f'{{"format": {json.dumps(COMPACT_FORMAT)},\n'
+                      f'"string_fields": {json.dumps(list(string_fields))},\n"strings": [')
+            out.write(",".join("\n" + json.dumps(value, ensure_ascii=False) for value in strings))
+            out.write("\n],\n")
+            for name, value in (fields or {}).items():
+                out.write(f"{json.dumps(name)}: {json.dumps(value, ensure_ascii=False)},\n")
+            out.write('"entries": [')
+            first = True
+
+            def write_entries(entries):
+                nonlocal first
+                for entry in entries:
+                    entry = dict(_as_dict(entry))
+                    for field in string_fields:
+                        ref = refs.get(entry.get(field)) if isinstance(entry.get(field), str) else None
+                        if ref is not None:
+                            entry[field] = ref
+                    out.write(("\n" if first else ",\n") + json.dumps(entry, ensure_ascii=False))
+                    first = False
+
+            write_entries(entries)
+            with file_lock(path):
+                if source is not None:
+                    write_entries(source.appended())
+                out.write(COMPACT_TRAILER.decode("ascii"))
+                out.close()
+                replace_file(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def append_compact(path, entries, fields=None):
+    """
+    Append entries to a store without rewriting it.
+
+    A compact store is extended in place: its closing "]}" is overwritten by
+    the new entry lines, so the cost depends only on what is appended (new
+    values are written inline; the next compaction interns them). A compact
+    store whose trailer was torn by a crash is repaired first (see
+    repair_compact). A missing or legacy-layout store is rewritten once in
+    the compact layout, with `fields` as defaults for its top-level fields;
+    one that can't be read raises and is left untouched.
+    """
+    lines = [json.dumps(_as_dict(entry), ensure_ascii=False).encode("utf-8") for entry in entries]
+    if not lines:
+        return
+    with file_lock(path):
+        _append_locked(path, entries, lines, fields)
+
+
+def _append_locked(path, entries, lines, fields):
+    if os.path.exists(path) and _is_compact(path):
+        with open(path, "r+b") as f:
+            end = _repair(f, path)
+            f.seek(end - 1)
+            # "[" for an empty list, otherwise the end of the last entry
+            separator = b"\n" if f.read(1) == b"[" else b",\n"
+            f.seek(end)
+            f.write(separator + b",\n".join(lines) + COMPACT_TRAILER)
+        return
+
+    stream = JsonEntryStream(path)
+    existing = list(stream) if os.path.exists(path) else []
+    write_compact(path, existing + [_as_dict(entry) for entry in entries], dict(fields or {}, **stream.fields))
+
+
+def repair_compact(path):
+    """
+    Make a compact store whose trailer was torn (a crash mid-append) readable
+    again: it is cut back to its last complete entry and re-sealed. Returns
+    True if anything was cut. Other layouts are left alone.
+    """
+    if not os.path.exists(path) or not _is_compact(path):
+        return False
+    with file_lock(path):
+        with open(path, "r+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            return _repair(f, path) + len(COMPACT_TRAILER) != size
+
+
+def _repair(f, path):
+    """Offset where the next entry goes, re-sealing the store first if its trailer is torn."""
+    size = f.seek(0, os.SEEK_END)
+    f.seek(max(0, size - len(COMPACT_TRAILER)))
+    if f.read() == COMPACT_TRAILER:
+        return size - len(COMPACT_TRAILER)
+    end = _last_entry_end(f, size)
+    log.warning("Repairing %s: cut %d bytes after the last complete entry", path, size - end)
+    f.truncate(end)
+    f.seek(end)
+    f.write(COMPACT_TRAILER)
+    return end
+
+
+def _last_entry_end(f, size, block_size=1 << 16):
+    """Offset just past the last entry line that decodes (or the entries' "[")."""
+    pos = size
+    data = b""
+    while True:
+        step = min(block_size, pos)
+        pos -= step
+        f.seek(pos)
+        data = f.read(step) + data
+        lines = data.split(b"\n")
+        offsets = [pos]
+        for line in lines[:-1]:
+            offsets.append(offsets[-1] + len(line) + 1)
+        # The first line may be cut off until the start of the file is reached
+        first = 0 if pos == 0 else 1
+        for offset, line in reversed(list(zip(offsets, lines))[first:]):
+            if line == ENTRIES_LINE:
+                return offset + len(line)
+            if line.startswith(b"{"):
+                body = line.rstrip(b",")
+                try:
+                    json.loads(body)
+                except ValueError:
+                    continue
+                return offset + len(body)
+        if pos == 0:
+            raise json.JSONDecodeError("Entries not found", data.decode("utf-8", "replace"), 0)
+
+
+def _is_compact(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read(len(COMPACT_FORMAT) + 16).startswith(f'{{"format": {json.dumps(COMPACT_FORMAT)}')
+
+
+# -------------------- COMPACTION JOB --------------------
+def _load_seconds(path):
+    start = time.perf_counter()
+    for _ in JsonEntryStream(path):
+        pass
+    return time.perf_counter() - start
+
+
+def compact_store(path, threshold=0.8, string_fields=STRING_FIELDS, text_fields=TEXT_FIELDS):
+    """
+    Rewrite one store (memory.json or user_data.json, legacy or compact) in
+    the compact layout and refresh its near-duplicate flags.
+
+    Two streaming passes: the first finds repeated strings and near-duplicate
+    inputs, the second writes the new file. Every entry keeps its logical
+    content; only the DUPLICATE_KEY flag is recomputed. Neither pass holds
+    the writer lock, so the app keeps appending meanwhile; those entries are
+    carried over when the new file is published. Returns a stats dict.
+    """
+    bytes_before = os.path.getsize(path)
+    load_before = _load_seconds(path)
+
+    stream = JsonEntryStream(path)
+    seen = Counter()
+    strings = {}
+    index = NearDuplicateIndex(threshold)
+    duplicates = {}
+    count = 0
+    for i, entry in enumerate(stream):
+        count += 1
+        if not isinstance(entry, dict):
+            continue
+        for field in string_fields:
+            value = entry.get(field)
+            if isinstance(value, str):
+                # Count by hash to keep memory small; the second sighting supplies the string
+                key = hash(value)
+                seen[key] += 1
+                if seen[key] == 2:
+                    strings.setdefault(value, None)
+        text = next((entry[f] for f in text_fields if isinstance(entry.get(f), str)), None)
+        if text is not None:
+            original = index.add(i, text)
+            if original is not None:
+                duplicates[i] = original
+    fields = stream.fields
+
+    second = JsonEntryStream(path)
+
+    def flagged():
+        for i, entry in enumerate(second):
+            if isinstance(entry, dict):
+                entry.pop(DUPLICATE_KEY, None)
+                if i in duplicates:
+                    entry[DUPLICATE_KEY] = duplicates[i]
+            yield entry
+
+    write_compact(path, flagged(), fields, string_fields, strings=list(strings), source=second)
+
+    stats = {
+        "path": path,
+        "entries": count,
+        "interned_strings": len(strings),
+        "near_duplicates": len(duplicates),
+        "bytes_before": bytes_before,
+        "bytes_after": os.path.getsize(path),
+        "load_seconds_before": round(load_before, 4),
+        "load_seconds_after": round(_load_seconds(path), 4),
+    }
+    log.info("Compacted %s", path, extra=stats)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Intern repeated strings and flag near-duplicate inputs in DotPi's stores.")
+    parser.add_argument("paths", nargs="*", default=["data/memory.json", "data/user_data.json"])
+    parser.add_argument("--threshold", type=float, default=0.8,
+                        help="estimated Jaccard similarity at which inputs count as near-duplicates")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    setup_logging(args.log_level, log_file="data/logs/compaction.log", console=False)
+
+    for store in args.paths:
+        if not os.path.exists(store):
+            print(f"{store}: not found, skipped")
+            continue
+        try:
+            print(json.dumps(compact_store(store, args.threshold), indent=4))
+        except ValueError as e:
+            # e.g. the app rewrote the store while it was being compacted
+            print(f"{store}: {e}, skipped")
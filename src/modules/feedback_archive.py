@@ -0,0 +1,347 @@
+# -------------------- feedback_archive.py --------------------
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from collections import Counter
+from datetime import date
+
+from modules.analytics_query import to_seconds
+from modules.file_lock import replace_file
+from modules.json_stream import JsonEntryStream, open_snapshot
+from modules.records import FeedbackRecord, Vocabulary, feedback_records
+from modules.log_setup import get_logger
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency; callers fall back to the JSON file
+    np = None
+
+log = get_logger("archive")
+
+MAGIC = b"DPFA\x00\x00\x00\x02"
+VERSION = 2
+
+# magic, version, count, source offset, source fingerprint, source size,
+# source mtime_ns, then section offsets: ts, mood, tone, feedback, text index,
+# heap, heap length, vocab, vocab length
+_HEADER = struct.Struct("<8sIQqqQq9Q")
+
+# Source offset of an archive sealed from a file that isn't a compact log
+NO_OFFSET = -1
+
+# Entries appended since sealing are read from the JSON log; once there are
+# more than this (or than 1/RESEAL_FRACTION of the sealed ones) it is resealed
+RESEAL_MIN_ENTRIES = 500
+RESEAL_FRACTION = 10
+
+# Label columns: archive column name → FeedbackRecord attribute
+LABEL_COLUMNS = {"mood": "detected_mood", "tone": "tone_used", "feedback": "feedback"}
+
+# Strings per entry in the text heap
+_TEXTS = ("user_message", "ai_response", "extra")
+
+NO_TIMESTAMP = -1
+
+
+def default_archive_path(source_path):
+    return os.path.splitext(source_path)[0] + ".archive"
+
+
+def _align(f, boundary=8):
+    pad = -f.tell() % boundary
+    if pad:
+        f.write(b"\0" * pad)
+    return f.tell()
+
+
+def build_archive(source_path, archive_path=None):
+    """
+    Seal the feedback log into a columnar archive next to it.
+
+    Entries are streamed from one snapshot of the JSON file; only the
+    fixed-width columns are held in memory (14 bytes per entry), the text
+    heap is spooled to disk. A compact log is sealed up to its end offset, so
+    later appends can be read on top of the archive. The archive replaces any
+    older one atomically. Returns the archive path.
+    """
+    with open_snapshot(source_path) as snapshot:
+        return _build(snapshot, archive_path or default_archive_path(source_path))
+
+
+def _build(snapshot, archive_path):
+    stat = os.fstat(snapshot.file.fileno())
+    stream = JsonEntryStream(snapshot.path)
+
+    ts_column = array("q")
+    label_columns = {name: array("H") for name in LABEL_COLUMNS}
+    vocabularies = {name: Vocabulary() for name in LABEL_COLUMNS}
+    text_index = array("Q", [0])
+
+    with tempfile.TemporaryFile() as heap:
+        for entry in stream.read(snapshot):
+            if not isinstance(entry, dict):
+                continue
+            record = FeedbackRecord.from_dict(entry)
+            ts_column.append(record.ts if record.ts is not None else NO_TIMESTAMP)
+            for name, attribute in LABEL_COLUMNS.items():
+                label_columns[name].append(vocabularies[name].code(getattr(record, attribute)))
+            for field in _TEXTS:
+                value = getattr(record, field)
+                if field == "extra":
+                    value = json.dumps(value) if value else ""
+                heap.write((value or "").encode("utf-8"))
+                text_index.append(heap.tell())
+
+        vocab = json.dumps({name: v.values for name, v in vocabularies.items()}).encode("utf-8")
+        count = len(ts_column)
+        offset = stream.end_offset(snapshot)
+        fingerprint = snapshot.fingerprint(offset) if offset is not None else 0
+        directory = os.path.dirname(archive_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(b"\0" * _HEADER.size)
+                offsets = {}
+                for name, column in (("ts", ts_column), *label_columns.items(), ("text_index", text_index)):
+                    offsets[name] = _align(out)
+                    if sys.byteorder == "big":
+                        column.byteswap()  # the format is little-endian
+                    column.tofile(out)
+                offsets["heap"] = _align(out)
+                heap.seek(0)
+                shutil.copyfileobj(heap, out, 1 << 20)
+                heap_len = out.tell() - offsets["heap"]
+                offsets["vocab"] = out.tell()
+                out.write(vocab)
+
+                out.seek(0)
+                out.write(_HEADER.pack(MAGIC, VERSION, count, NO_OFFSET if offset is None else offset,
+                                       fingerprint, snapshot.size, stat.st_mtime_ns,
+                                       offsets["ts"], offsets["mood"], offsets["tone"], offsets["feedback"],
+                                       offsets["text_index"], offsets["heap"], heap_len,
+                                       offsets["vocab"], len(vocab)))
+            # An archive mapped by another process can't be replaced on Windows until it is closed
+            replace_file(tmp_path, archive_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    return archive_path
+
+
+class FeedbackArchive:
+    """
+    Read-only, memory-mapped view of a sealed feedback log.
+
+    Columns (ts, mood, tone, feedback) are NumPy arrays created with
+    frombuffer over the mapping, so aggregations scan the file pages directly
+    without building per-entry objects. Text fields are decoded on demand
+    from the heap. Label columns hold archive-local codes; `labels[name]`
+    maps them back (code 0 is None).
+
+    Entries appended to the log after it was sealed are read from the JSON
+    into `tail` (see catch_up) and merged into every aggregate, so the
+    archive only has to be resealed once the tail grows large.
+    """
+
+    def __init__(self, path):
+        if np is None:
+            raise RuntimeError("NumPy is required to read feedback archives")
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, self.count, offset, self.source_fingerprint, size, mtime_ns,
+             ts_off, mood_off, tone_off, feedback_off, index_off, self._heap_off, _heap_len,
+             vocab_off, vocab_len) = _HEADER.unpack_from(self._mm)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} feedback archive")
+            self.source_offset = None if offset == NO_OFFSET else offset
+            self.source_signature = (size, mtime_ns)
+            self.tail = []
+            self.labels = json.loads(self._mm[vocab_off:vocab_off + vocab_len].decode("utf-8"))
+            self.columns = {
+                "ts": np.frombuffer(self._mm, dtype="<i8", count=self.count, offset=ts_off),
+                "mood": np.frombuffer(self._mm, dtype="<u2", count=self.count, offset=mood_off),
+                "tone": np.frombuffer(self._mm, dtype="<u2", count=self.count, offset=tone_off),
+                "feedback": np.frombuffer(self._mm, dtype="<u2", count=self.count, offset=feedback_off),
+            }
+            self._text_index = np.frombuffer(self._mm, dtype="<u8", count=self.count * len(_TEXTS) + 1,
+                                             offset=index_off)
+        except Exception:
+            self._mm.close()
+            raise
+
+    @classmethod
+    def for_source(cls, source_path, archive_path=None, rebuild=True):
+        """
+        Open the archive for `source_path` with the entries appended since it
+        was sealed. It is resealed first if it is missing, no longer matches
+        the source, or (with `rebuild`) its tail has grown past the reseal
+        threshold. Returns None when no archive can be used (NumPy missing,
+        no source file, or a read/build error).
+        """
+        if np is None or not os.path.exists(source_path):
+            return None
+        archive_path = archive_path or default_archive_path(source_path)
+        try:
+            if os.path.exists(archive_path):
+                archive = cls(archive_path)
+                if archive.catch_up(source_path) and not (rebuild and archive.needs_reseal()):
+                    return archive
+                archive.close()
+            if not rebuild:
+                return None
+            return cls(build_archive(source_path, archive_path))
+        except (OSError, ValueError, struct.error) as e:
+            log.warning("Feedback archive unavailable for %s: %s", source_path, e)
+            return None
+
+    def catch_up(self, source_path):
+        """
+        Read the entries appended to the source since sealing into `tail`.
+        Returns False if the archive no longer applies: the source was
+        rewritten, or it isn't a compact log and has changed at all.
+        """
+        try:
+            with open_snapshot(source_path) as snapshot:
+                if self.source_offset is None:
+                    self.tail = []
+                    return (snapshot.size, os.fstat(snapshot.file.fileno()).st_mtime_ns) == self.source_signature
+                if snapshot.fingerprint(self.source_offset) != self.source_fingerprint:
+                    return False
+                if snapshot.sealed and snapshot.end == self.source_offset:
+                    self.tail = []
+                else:
+                    stream = JsonEntryStream(source_path)
+                    self.tail = feedback_records(stream.entries_after(self.source_offset, snapshot))
+        except (OSError, ValueError) as e:
+            log.debug("Feedback archive doesn't match %s: %s", source_path, e)
+            return False
+        return True
+
+    def needs_reseal(self):
+        return len(self.tail) > max(RESEAL_MIN_ENTRIES, self.count // RESEAL_FRACTION)
+
+    def close(self):
+        self.columns = {}
+        self._text_index = None
+        try:
+            self._mm.close()
+        except BufferError:
+            # Arrays handed out by column() still point into the mapping
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count + len(self.tail)
+
+    # ---------- TEXT / ROWS ----------
+    def text(self, i, field="user_message"):
+        slot = i * len(_TEXTS) + _TEXTS.index(field)
+        start = self._heap_off + int(self._text_index[slot])
+        end = self._heap_off + int(self._text_index[slot + 1])
+        return self._mm[start:end].decode("utf-8")
+
+    def record(self, i):
+        """Entry `i` as a FeedbackRecord (same .get() keys as the JSON dicts)."""
+        if i >= self.count:
+            return self.tail[i - self.count]
+        extra = self.text(i, "extra")
+        ts = int(self.columns["ts"][i])
+        return FeedbackRecord(
+            None if ts == NO_TIMESTAMP else ts,
+            self.text(i, "user_message"), self.text(i, "ai_response"),
+            *(self.labels[name][int(self.columns[name][i])] for name in ("feedback", "mood", "tone")),
+            extra=json.loads(extra) if extra else None,
+        )
+
+    def __iter__(self):
+        return (self.record(i) for i in range(len(self)))
+
+    # ---------- AGGREGATION ----------
+    def column(self, name):
+        """A sealed column (the tail isn't included)."""
+        return self.columns[name]
+
+    def code(self, name, label):
+        """Code of `label` in a label column (None if it never occurs)."""
+        try:
+            return self.labels[name].index(label)
+        except ValueError:
+            return None
+
+    def mask(self, start=None, end=None, **labels):
+        """
+        Boolean selection over the sealed entries followed by the tail:
+        timestamps in [start, end) and label columns equal to the given
+        values, e.g. mask(feedback="like").
+        """
+        selected = np.ones(self.count, dtype=bool)
+        ts = self.columns["ts"]
+        start = None if start is None else to_seconds(start)
+        end = None if end is None else to_seconds(end)
+        if start is not None or end is not None:
+            selected &= ts != NO_TIMESTAMP
+        if start is not None:
+            selected &= ts >= start
+        if end is not None:
+            selected &= ts < end
+        for name, label in labels.items():
+            code = self.code(name, label)
+            if code is None:
+                selected[:] = False
+            else:
+                selected &= self.columns[name] == code
+
+        def in_tail(record):
+            if (start is not None or end is not None) and record.ts is None:
+                return False
+            if (start is not None and record.ts < start) or (end is not None and record.ts >= end):
+                return False
+            return all(getattr(record, LABEL_COLUMNS[name]) == label for name, label in labels.items())
+
+        tail = np.fromiter((in_tail(record) for record in self.tail), dtype=bool, count=len(self.tail))
+        return np.concatenate((selected, tail))
+
+    def _tail_labels(self, name, mask):
+        attribute = LABEL_COLUMNS[name]
+        for i, record in enumerate(self.tail):
+            if mask is None or mask[self.count + i]:
+                yield record, getattr(record, attribute)
+
+    def value_counts(self, name, mask=None):
+        """Counter of labels in a column (None excluded), most frequent first."""
+        codes = self.columns[name] if mask is None else self.columns[name][mask[:self.count]]
+        counts = np.bincount(codes, minlength=len(self.labels[name]))
+        totals = Counter({self.labels[name][c]: int(counts[c]) for c in range(1, len(counts)) if counts[c]})
+        totals.update(label for _, label in self._tail_labels(name, mask) if label is not None)
+        return Counter(dict(totals.most_common()))
+
+    def daily_counts(self, name, mask=None):
+        """{date: Counter(label → n)} for entries with a timestamp."""
+        selected = self.columns["ts"] != NO_TIMESTAMP
+        if mask is not None:
+            selected &= mask[:self.count]
+        days = self.columns["ts"][selected] // 86400
+        codes = self.columns[name][selected].astype(np.int64)
+        width = len(self.labels[name])
+        keys, counts = np.unique(days * width + codes, return_counts=True)
+        by_day = {}
+        for key, n in zip(keys.tolist(), counts.tolist()):
+            day, code = divmod(key, width)
+            by_day.setdefault(date.fromordinal(day), Counter())[self.labels[name][code] or "unknown"] += n
+        for record, label in self._tail_labels(name, mask):
+            if record.ts is not None:
+                by_day.setdefault(date.fromordinal(record.ts // 86400), Counter())[label or "unknown"] += 1
+        return by_day
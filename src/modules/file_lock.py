@@ -0,0 +1,143 @@
+# -------------------- file_lock.py --------------------
+import errno
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import ctypes
+    import msvcrt
+
+# The lock lives in a sidecar file so the data file itself can be replaced while locked
+LOCK_SUFFIX = ".lock"
+
+# On Windows a file can't be replaced while another process has it open
+# without FILE_SHARE_DELETE (or mapped); replace_file() retries for this long
+REPLACE_TIMEOUT = 5.0
+
+_held = threading.local()
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """
+    Advisory inter-process lock for the data file `path`.
+
+    Writers lock exclusively around anything that changes the file; readers
+    lock shared only while opening a snapshot (json_stream.open_snapshot),
+    so they never hold up a writer for longer than an open() and a stat().
+    Re-entrant within a thread: nested locks on the same path are no-ops.
+    Windows has no shared locks, so there readers lock exclusively too, and
+    msvcrt.locking() gives up after ten one-second attempts; it is retried
+    until the lock is granted, so a slow holder delays rather than fails us.
+    """
+    key = os.path.abspath(path)
+    held = _held.__dict__.setdefault("paths", set())
+    if key in held:
+        yield
+        return
+    try:
+        fd = os.open(path + LOCK_SUFFIX, os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError:
+        if not shared:
+            raise
+        # A reader that can't create the lock file (read-only directory) reads unlocked
+        yield
+        return
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            _lock_windows(fd)
+        held.add(key)
+        try:
+            yield
+        finally:
+            held.discard(key)
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+
+def _lock_windows(fd):
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            return
+        except OSError as e:
+            if e.errno != errno.EDEADLOCK:
+                raise
+
+
+def open_shared(path):
+    """
+    Open `path` for binary reading so that writers can still replace it.
+
+    POSIX allows that anyway. On Windows the file is opened with
+    FILE_SHARE_DELETE, without which os.replace() onto it fails while the
+    handle is open.
+    """
+    if fcntl is not None:
+        return open(path, "rb")
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.CreateFileW.restype = ctypes.c_void_p
+    handle = kernel32.CreateFileW(
+        path, 0x80000000,       # GENERIC_READ
+        0x1 | 0x2 | 0x4,        # FILE_SHARE_READ | FILE_SHARE_WRITE | FILE_SHARE_DELETE
+        None, 3, 0x80, None,    # OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL
+    )
+    if handle is None or handle == ctypes.c_void_p(-1).value:
+        error = ctypes.get_last_error()
+        raise OSError(None, ctypes.FormatError(error), path, error)
+    try:
+        fd = msvcrt.open_osfhandle(handle, os.O_RDONLY | os.O_BINARY)
+    except OSError:
+        kernel32.CloseHandle(ctypes.c_void_p(handle))
+        raise
+    return open(fd, "rb")
+
+
+def replace_file(src, dst, timeout=REPLACE_TIMEOUT):
+    """
+    os.replace(), retried while `dst` is held open on Windows (PermissionError)
+    by a reader that didn't allow deletion or has the file mapped.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    while True:
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+
+@contextmanager
+def atomic_write(path, mode="w", encoding="utf-8", **kwargs):
+    """
+    Open a uniquely named temporary file next to `path` and publish it with
+    replace_file() on success, so readers see the old or the new file, never
+    a partial one, and concurrent writers never share a temp file.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else encoding, **kwargs) as f:
+            yield f
+        replace_file(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
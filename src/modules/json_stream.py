@@ -0,0 +1,417 @@
+# -------------------- json_stream.py --------------------
+import io
+import json
+import os
+import re
+import zlib
+from collections import deque
+
+from modules.file_lock import file_lock, open_shared
+
+CHUNK_SIZE = 1 << 16
+
+# Compact store layout (written by modules/compaction.py): repeated strings of
+# `string_fields` are stored once in "strings" and entries refer to them by index.
+# Entries are written one per line, which lets readers decode them in batches.
+COMPACT_FORMAT = "dotpi-compact/1"
+LAYOUT_FIELDS = ("format", "string_fields", "strings")
+# Every compact document ends with this; appends overwrite it
+COMPACT_TRAILER = b"\n]}\n"
+# The line opening a compact document's entries
+ENTRIES_LINE = b'"entries": ['
+# Bytes before a saved offset that must be unchanged for it to still apply
+FINGERPRINT_BYTES = 256
+
+_skip_ws = re.compile(r"[ \t\n\r]*").match
+_decoder = json.JSONDecoder()
+
+
+class Snapshot:
+    """
+    A data file as it was when opened, safe to read while a writer works.
+
+    Opened under a brief shared lock (modules/file_lock.py), and with
+    open_shared() so that on Windows too a writer can replace the file whole
+    (replace_file()) while this snapshot keeps reading the old one. Writers
+    either do that or append to a compact store in place, which only rewrites
+    bytes from its trailer on. Reads are therefore bounded to `end` (the
+    size, less the trailer of a compact store) and the trailer is supplied
+    from memory, so readers never see a half-written append.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with file_lock(path, shared=True):
+            self.file = open_shared(path)
+            try:
+                stat = os.fstat(self.file.fileno())
+                self.size = stat.st_size
+                self.file.seek(max(0, self.size - len(COMPACT_TRAILER)))
+                self.sealed = self.file.read() == COMPACT_TRAILER
+            except BaseException:
+                self.file.close()
+                raise
+        self.identity = (stat.st_dev, stat.st_ino)
+        self.end = self.size - len(COMPACT_TRAILER) if self.sealed else self.size
+
+    def read(self, start, end=None):
+        end = self.end if end is None else min(end, self.end)
+        self.file.seek(start)
+        return self.file.read(max(0, end - start))
+
+    def fingerprint(self, offset):
+        """
+        Checksum of the bytes just before `offset`. If it still matches, the
+        file was appended to since `offset` was saved, not rewritten.
+        """
+        return zlib.crc32(self.read(max(0, offset - FINGERPRINT_BYTES), offset))
+
+    def text(self):
+        """The snapshot's contents as a text stream."""
+        raw = _BoundedRaw(self.file, self.end, COMPACT_TRAILER if self.sealed else b"")
+        return io.TextIOWrapper(io.BufferedReader(raw, CHUNK_SIZE), encoding="utf-8")
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_snapshot(path):
+    return Snapshot(path)
+
+
+class _BoundedRaw(io.RawIOBase):
+    """The first `end` bytes of a binary file followed by `suffix`."""
+
+    def __init__(self, f, end, suffix):
+        self.f = f
+        self.remaining = end
+        self.suffix = suffix
+        f.seek(0)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.remaining > 0:
+            n = self.f.readinto(memoryview(b)[:min(len(b), self.remaining)])
+            if n:
+                self.remaining -= n
+                return n
+            self.remaining = 0
+        n = min(len(b), len(self.suffix))
+        b[:n] = self.suffix[:n]
+        self.suffix = self.suffix[n:]
+        return n
+
+
+class JsonEntryStream:
+    """
+    Incrementally read entries from a legacy JSON document.
+
+    Supports a top-level array (data/user_data.json) or an object whose
+    `key` holds the array (data/memory.json's {"entries": [...]}). Entries
+    are decoded one at a time from a sliding buffer, so memory stays bounded
+    by the largest single entry rather than the file size. Other top-level
+    fields of an object document (e.g. "user_name") are collected in `fields`.
+
+    Compact documents (COMPACT_FORMAT) are expanded transparently: their
+    entries always live under "entries" and string-table references are
+    resolved, so callers see the same entries as in the legacy layout. The
+    layout fields themselves are kept apart in `layout`.
+
+    Each pass reads a Snapshot of the file, so a concurrent writer never
+    shows up as a truncated document; appended() returns what a writer
+    added after the last pass.
+
+    Raises json.JSONDecodeError (a ValueError) on malformed input.
+    """
+
+    def __init__(self, path, key="entries", chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.key = key
+        self.chunk_size = chunk_size
+        self.fields = {}
+        self.layout = {}
+        self.chars_read = 0
+        self._compact = None
+        self._source = None
+
+    def __iter__(self):
+        return self.read()
+
+    def read(self, snapshot=None):
+        """Generator over the entries of `snapshot`, or of a new snapshot of the file."""
+        if snapshot is None:
+            with open_snapshot(self.path) as snapshot:
+                yield from self.read(snapshot)
+            return
+        self._source = (snapshot.identity, snapshot.size, snapshot.end if snapshot.sealed else None)
+        reader = _Reader(snapshot.text(), self.chunk_size, self)
+        first = reader.peek()
+        if first == "[":
+            yield from reader.array()
+        elif first == "{":
+            yield from self._object(reader)
+        elif first is None:
+            return
+        else:
+            raise json.JSONDecodeError("Expected '[' or '{'", reader.buffer, reader.pos)
+
+    def _object(self, reader):
+        reader.expect("{")
+        if reader.peek() == "}":
+            reader.pos += 1
+            return
+        while True:
+            name = reader.value()
+            reader.expect(":")
+            compact = self.layout.get("format") == COMPACT_FORMAT
+            if (name == self.key or (compact and name == "entries")) and reader.peek() == "[":
+                yield from self._expand(reader.line_array()) if compact else reader.array()
+            elif name in LAYOUT_FIELDS:
+                self.layout[name] = reader.value()
+            else:
+                self.fields[name] = reader.value()
+            sep = reader.peek()
+            reader.expect(sep if sep in (",", "}") else ",")
+            if sep == "}":
+                return
+
+    def tail(self, n):
+        """
+        The last `n` entries, oldest first. Compact documents are read
+        backwards from the end of the file, so the cost doesn't depend on how
+        many entries come before them (only the header, whose string table
+        holds the repeated replies, is read from the front); other layouts
+        are streamed in full.
+        `fields` and `layout` are filled in either way.
+        """
+        if n <= 0:
+            return []
+        if not self.header():
+            return list(deque(self, maxlen=n))
+        with open_snapshot(self.path) as snapshot:
+            return self._decode_lines(_tail_lines(snapshot, n))
+
+    def header(self, snapshot=None):
+        """Read the fields and layout ahead of the entries. True if the document is compact."""
+        if self._compact is None:
+            if snapshot is None:
+                with open_snapshot(self.path) as snapshot:
+                    return self.header(snapshot)
+            reader = _Reader(snapshot.text(), self.chunk_size, self)
+            self._compact = reader.peek() == "{" and self._header(reader)
+        return self._compact
+
+    def end_offset(self, snapshot=None):
+        """
+        Byte offset just past the last entry of a compact document (where the
+        next append goes), or None for other layouts.
+        """
+        if snapshot is None:
+            with open_snapshot(self.path) as snapshot:
+                return self.end_offset(snapshot)
+        return snapshot.end if self.header(snapshot) and snapshot.sealed else None
+
+    def entries_after(self, offset, snapshot=None):
+        """Entries appended after byte `offset` (an earlier end_offset()) of a compact document."""
+        if snapshot is None:
+            with open_snapshot(self.path) as snapshot:
+                return self.entries_after(offset, snapshot)
+        end = self.end_offset(snapshot)
+        if end is None or end < offset:
+            raise ValueError(f"{self.path} has no compact entries after offset {offset}")
+        return self._decode_lines(_entry_lines(snapshot.read(offset)))
+
+    def appended(self):
+        """
+        Entries a writer appended in place since the last pass over the file.
+        Raises ValueError if the file was replaced or rewritten instead. Call
+        it holding the writer lock, or more may be appended right after.
+        """
+        if self._source is None:
+            raise ValueError(f"{self.path} hasn't been read yet")
+        identity, size, end = self._source
+        with open_snapshot(self.path) as snapshot:
+            if snapshot.identity != identity:
+                raise ValueError(f"{self.path} was replaced")
+            if snapshot.size == size:
+                return []
+            if end is None or not snapshot.sealed:
+                raise ValueError(f"{self.path} was modified in place")
+            return self._decode_lines(_entry_lines(snapshot.read(end)))
+
+    def _decode_lines(self, lines):
+        return list(self._expand(_decoder.decode(line.decode("utf-8")) for line in lines))
+
+    def _header(self, reader):
+        """Read fields up to the entries of a compact document; False for any other layout."""
+        reader.expect("{")
+        while reader.peek() == '"':
+            name = reader.value()
+            reader.expect(":")
+            if name == "entries":
+                return self.layout.get("format") == COMPACT_FORMAT and reader.peek() == "["
+            if name in LAYOUT_FIELDS:
+                self.layout[name] = reader.value()
+            else:
+                self.fields[name] = reader.value()
+            if reader.peek() != ",":
+                return False
+            reader.pos += 1
+        return False
+
+    def _expand(self, entries):
+        strings = self.layout.get("strings") or []
+        string_fields = self.layout.get("string_fields") or ()
+        for entry in entries:
+            if isinstance(entry, dict):
+                for field in string_fields:
+                    ref = entry.get(field)
+                    if type(ref) is int:
+                        entry[field] = strings[ref]
+            yield entry
+
+
+class _Reader:
+    """Sliding-window buffer over a text file with JSON value decoding."""
+
+    def __init__(self, f, chunk_size, stream=None):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.stream = stream
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+        chunk = self.f.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        if self.stream is not None:
+            # Progress hint for long reads (characters, not bytes)
+            self.stream.chars_read += len(chunk)
+        # Drop what has been consumed before growing the buffer
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character (None at EOF)."""
+        while True:
+            self.pos = _skip_ws(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return None
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expected {char!r}", self.buffer, self.pos)
+        self.pos += 1
+
+    def value(self):
+        """Decode one JSON value, reading more input until it is complete."""
+        if self.peek() is None:
+            raise json.JSONDecodeError("Unexpected end of input", self.buffer, self.pos)
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Each retry reads as much again as is buffered, so a large value
+                # (e.g. a compact store's string table) is decoded O(log n) times
+                if not self._fill(size):
+                    raise
+                size = max(size, len(self.buffer) - self.pos)
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self.buffer[self.pos] in "-0123456789" and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def array(self):
+        """Yield the elements of the array starting at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            sep = self.peek()
+            if sep == ",":
+                self.pos += 1
+            elif sep == "]":
+                self.pos += 1
+                return
+            else:
+                raise json.JSONDecodeError("Expected ',' or ']'", self.buffer, self.pos)
+
+    def line_array(self):
+        """
+        Yield the elements of an array written one element per line, decoding
+        each buffer's complete lines with a single json.loads call.
+        """
+        self.expect("[")
+        while True:
+            end = self.buffer.rfind("\n", self.pos)
+            closing = self.buffer.find("\n]", self.pos)
+            if closing >= 0:
+                end = closing
+            if end > self.pos:
+                body = self.buffer[self.pos:end].strip().rstrip(",")
+                self.pos = end
+                if body:
+                    yield from _decoder.decode(f"[{body}]")
+            if closing >= 0:
+                self.expect("]")
+                return
+            if not self._fill():
+                if self.peek() == "]":
+                    self.pos += 1
+                    return
+                raise json.JSONDecodeError("Unterminated array", self.buffer, self.pos)
+
+
+def _entry_lines(data):
+    """Entry lines (trailing commas removed) of a whole-lines slice of a compact document."""
+    return [line.rstrip(b",") for line in data.split(b"\n") if line.startswith(b"{")]
+
+
+def _tail_lines(snapshot, n, block_size=CHUNK_SIZE):
+    """Last `n` entry lines of a compact document (bytes, trailing commas removed), oldest first."""
+    pos = snapshot.end
+    data = b""
+    while True:
+        step = min(block_size, pos)
+        pos -= step
+        data = snapshot.read(pos, pos + step) + data
+        lines = data.split(b"\n")
+        if ENTRIES_LINE in lines:
+            lines = lines[lines.index(ENTRIES_LINE) + 1:]
+            break
+        if pos == 0:
+            raise json.JSONDecodeError("Entries not found", data.decode("utf-8", "replace"), 0)
+        # The first line may be cut off; it is only used once more data is read
+        entries = [line for line in lines[1:] if line.startswith(b"{")]
+        if len(entries) >= n:
+            lines = lines[1:]
+            break
+    return _entry_lines(b"\n".join(lines))[-n:]
+
+
+def iter_json_entries(path, key="entries", chunk_size=CHUNK_SIZE):
+    """Generator over the entries of `path`; yields nothing if the file is missing."""
+    if not os.path.exists(path):
+        return iter(())
+    return iter(JsonEntryStream(path, key=key, chunk_size=chunk_size))
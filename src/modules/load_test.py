@@ -0,0 +1,291 @@
+# -------------------- load_test.py --------------------
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from modules.routing import RoutingConfig
+from modules.user_state import UserStateManager
+from modules.log_setup import get_logger, setup_logging
+
+log = get_logger("load_test")
+
+# Synthetic messages per category, and the mood a session reports with them
+MESSAGES = {
+    "trivial": (("thanks", "positive"), ("ok", "neutral"), ("cool", "positive"), ("got it", "neutral")),
+    "short": (("what should I do next", "neutral"), ("any tips for focus", "neutral"),
+              ("how was my week", "neutral")),
+    "substantive": (
+        ("I keep putting off my project and I am not sure how to plan the next few weeks", "neutral"),
+        ("Can you help me figure out a routine that balances work, exercise and rest", "neutral"),
+        ("My manager asked for a proposal by Friday and I have not started outlining it yet", "negative"),
+    ),
+    "emotional": (("I feel awful about how today went", "negative"),
+                  ("I'm so happy, I finally finished it!", "positive"),
+                  ("Everything is going wrong and I'm exhausted", "negative")),
+}
+
+DEFAULT_MIX = {"trivial": 0.25, "short": 0.25, "substantive": 0.35, "emotional": 0.15}
+TONES = ("Blunt", "Empathetic", "Balanced")
+
+
+def parse_mix(spec):
+    """Parse "trivial=0.3,substantive=0.7" into a weight dict."""
+    mix = {}
+    for part in spec.split(","):
+        name, weight = part.split("=", 1)
+        if name.strip() not in MESSAGES:
+            raise ValueError(f"Unknown message category {name!r}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+# -------------------- FAKE API --------------------
+class FakeChatAPI:
+    """
+    Local stand-in for an OpenAI-compatible /v1/chat/completions endpoint.
+
+    Each request sleeps for a log-normal latency around `latency_ms` and fails
+    with HTTP 500 at `error_rate`, so fallbacks and slow tails show up under load.
+    """
+
+    def __init__(self, latency_ms=400, jitter=0.5, error_rate=0.02, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.stats = Counter()
+        self.server = None
+
+    def start(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with api.rng_lock:
+                    delay = api.latency_ms / 1000 * api.rng.lognormvariate(0, api.jitter)
+                    fail = api.rng.random() < api.error_rate
+                time.sleep(delay)
+                with api.rng_lock:
+                    api.stats["requests"] += 1
+                    api.stats["errors"] += fail
+                if fail:
+                    self._reply(500, {"error": {"message": "simulated upstream error"}})
+                    return
+                user_message = body.get("messages", [{}])[-1].get("content", "")
+                self._reply(200, {"choices": [{"message": {
+                    "role": "assistant", "content": f"(fake) Let's look at that: {user_message[-60:]}"}}]})
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="fake-api", daemon=True).start()
+        return self
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+# -------------------- MEASUREMENT --------------------
+class _MetricsCollector:
+    """Stands in for MetricsLog: keeps the engine's per-reply metrics in memory."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.backends = Counter()
+        self.fallbacks = Counter()
+
+    def record(self, metrics):
+        with self.lock:
+            self.backends[metrics.backend] += 1
+            if metrics.fallback:
+                self.fallbacks[metrics.fallback_reason] += 1
+
+
+def _rss_mb():
+    """Resident set size of this process in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+    except (ImportError, OSError):
+        return None
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+# -------------------- SESSIONS --------------------
+def run_session(engine, session_id, messages, mix, think_ms, feedback_rate, rng, latencies):
+    """One synthetic user: send `messages` messages with think time, sometimes rate the reply."""
+    categories = list(mix)
+    weights = [mix[c] for c in categories]
+    tone = rng.choice(TONES)
+    for _ in range(messages):
+        if think_ms:
+            time.sleep(rng.expovariate(1000 / think_ms))
+        message, mood = rng.choice(MESSAGES[rng.choices(categories, weights)[0]])
+
+        start = time.perf_counter()
+        # user_id gives every session its own context window in the engine
+        engine.generate_response(message, tone, mood, user_id=session_id)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        if rng.random() < feedback_rate:
+            engine.record_feedback(session_id, rng.choice(("like", "dislike")), tone, mood)
+
+
+def run_load_test(sessions=100, messages_per_session=20, mix=None, think_ms=500, feedback_rate=0.2,
+                  mode="auto", api_latency_ms=400, api_error_rate=0.02, api_concurrency=32,
+                  api_timeout=10, sample_interval=1.0, seed=None, report_file="data/load_report.json"):
+    """
+    Drive one ResponseEngine with `sessions` concurrent synthetic chats against a local fake API.
+    Returns the report dict and writes it to `report_file` (if given).
+    """
+    from response_engine import ResponseEngine
+
+    mix = mix or DEFAULT_MIX
+    api = FakeChatAPI(api_latency_ms, error_rate=api_error_rate, seed=seed).start()
+    collector = _MetricsCollector()
+    latencies = []
+    timeline = []
+
+    with tempfile.TemporaryDirectory(prefix="dotpi-load-") as state_dir:
+        # Every file the engine reads or writes lives in state_dir, and routing
+        # uses the defaults: the app's data/ is neither an input nor touched
+        engine = ResponseEngine(
+            mode=mode, seed=seed, metrics=collector, routing=RoutingConfig(),
+            feedback_file=os.path.join(state_dir, "user_data.json"),
+            checkpoint_file=os.path.join(state_dir, "preference_checkpoint.json"),
+            user_states=UserStateManager(base_dir=state_dir, capacity=sessions * 2),
+            api_backend="http-chat",
+            backend_options={"http-chat": {"base_url": api.base_url, "max_concurrency": api_concurrency,
+                                           "timeout": api_timeout}},
+        )
+
+        stop = threading.Event()
+        start = time.perf_counter()
+        baseline_mb = _rss_mb()
+
+        def sample():
+            # Memory and progress over time, until the sessions finish
+            while not stop.wait(sample_interval):
+                timeline.append({"t": round(time.perf_counter() - start, 2), "completed": len(latencies),
+                                 "rss_mb": _rss_mb()})
+
+        sampler = threading.Thread(target=sample, name="load-sampler", daemon=True)
+        sampler.start()
+        try:
+            with ThreadPoolExecutor(max_workers=sessions) as pool:
+                futures = [
+                    pool.submit(run_session, engine, f"session-{i}", messages_per_session, mix, think_ms,
+                                feedback_rate, random.Random(None if seed is None else seed * 100003 + i),
+                                latencies)
+                    for i in range(sessions)
+                ]
+                for future in futures:
+                    future.result()
+        finally:
+            stop.set()
+            sampler.join()
+            api.stop()
+        elapsed = time.perf_counter() - start
+        end_mb = _rss_mb()
+
+    ordered = sorted(latencies)
+    replies = len(ordered)
+    report = {
+        "sessions": sessions,
+        "mode": mode,
+        "replies": replies,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_s": round(replies / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": round(sum(ordered) / replies, 2) if replies else None,
+            "p50": _percentile(ordered, 50),
+            "p95": _percentile(ordered, 95),
+            "p99": _percentile(ordered, 99),
+            "max": ordered[-1] if ordered else None,
+        },
+        "fallback_rate": round(sum(collector.fallbacks.values()) / replies, 4) if replies else None,
+        "fallback_reasons": dict(collector.fallbacks),
+        "backends": dict(collector.backends),
+        "routing": engine.router.stats(),
+        "upstream": dict(api.stats),
+        "memory_mb": {
+            "start": baseline_mb,
+            "end": end_mb,
+            "growth": round(end_mb - baseline_mb, 2) if end_mb is not None and baseline_mb is not None else None,
+            "timeline": timeline,
+        },
+    }
+    for key in ("p50", "p95", "p99", "max"):
+        if report["latency_ms"][key] is not None:
+            report["latency_ms"][key] = round(report["latency_ms"][key], 2)
+
+    if report_file:
+        os.makedirs(os.path.dirname(report_file) or ".", exist_ok=True)
+        with open(report_file, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test ResponseEngine with concurrent synthetic sessions.")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=20, help="messages per session")
+    parser.add_argument("--mix", type=parse_mix, default=None,
+                        help="category weights, e.g. trivial=0.3,short=0.2,substantive=0.4,emotional=0.1")
+    parser.add_argument("--think-ms", type=float, default=500, help="mean think time between messages")
+    parser.add_argument("--feedback-rate", type=float, default=0.2)
+    parser.add_argument("--mode", default="auto", choices=["local", "api", "auto"])
+    parser.add_argument("--api-latency-ms", type=float, default=400)
+    parser.add_argument("--api-error-rate", type=float, default=0.02)
+    parser.add_argument("--api-concurrency", type=int, default=32)
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--report", default="data/load_report.json")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    # Log file only, so the report on stdout stays readable
+    setup_logging(args.log_level, log_file="data/logs/load_test.log", console=False)
+
+    report = run_load_test(args.sessions, args.messages, args.mix, args.think_ms, args.feedback_rate,
+                           args.mode, args.api_latency_ms, args.api_error_rate, args.api_concurrency,
+                           sample_interval=args.sample_interval, seed=args.seed, report_file=args.report)
+    print(json.dumps(report, indent=4))
@@ -0,0 +1,177 @@
+# -------------------- local_generator.py --------------------
+import random
+from types import MappingProxyType
+
+# Templates and tone prefixes are compiled once at import time.
+TEMPLATES = MappingProxyType({
+    "positive": (
+        "That’s great! Keep that energy going.",
+        "I like your attitude — positivity always helps.",
+        "Nice progress — let’s build on that."
+    ),
+    "negative": (
+        "That sounds tough, but let’s figure out a way forward.",
+        "I get it — sometimes things just don’t feel right. What do you think caused it?",
+        "I hear you. We'll take a small step together."
+    ),
+    "neutral": (
+        "Hmm, tell me more about that.",
+        "Alright, let’s break this down together.",
+        "Okay — what's the most useful next step?"
+    )
+})
+
+TONE_EFFECT = MappingProxyType({
+    "Blunt": "Here’s my honest take: ",
+    "Empathetic": "I understand how you feel. ",
+    "Balanced": ""
+})
+
+MOOD_KEYS = ("positive", "negative", "neutral")
+
+
+def base_mood_key(mood):
+    """Map sentiments onto our simple template keys."""
+    if mood in ("positive", "happy", "happy-ish"):
+        return "positive"
+    if mood in ("negative", "sad"):
+        return "negative"
+    return "neutral"
+
+
+def build_alias_table(weights):
+    """
+    Build a Vose alias table for the given weights.
+    Returns (prob, alias) lists so a sample costs one random draw.
+    """
+    n = len(weights)
+    total = sum(max(w, 0) for w in weights) or 1
+    scaled = [max(w, 0) * n / total for w in weights]
+    prob = [0.0] * n
+    alias = [0] * n
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] = scaled[l] + scaled[s] - 1.0
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+
+    # Leftovers are exactly 1 up to rounding
+    for i in large + small:
+        prob[i] = 1.0
+        alias[i] = i
+
+    return prob, alias
+
+
+class AliasSampler:
+    """O(1) weighted sampler over a fixed tuple of outcomes."""
+
+    __slots__ = ("outcomes", "prob", "alias", "n")
+
+    def __init__(self, outcomes, weights):
+        self.outcomes = tuple(outcomes)
+        self.prob, self.alias = build_alias_table(weights)
+        self.n = len(self.outcomes)
+
+    def sample(self, rng):
+        u = rng.random() * self.n
+        i = int(u)
+        if i >= self.n:
+            i = self.n - 1
+        return self.outcomes[i if (u - i) < self.prob[i] else self.alias[i]]
+
+
+class LocalGenerator:
+    """
+    Precompiled template generator behind ResponseEngine.generate_local_response.
+
+    Full reply strings (tone prefix + template) are joined once per tone. The
+    sampling distribution only depends on (tone, base mood key, preference
+    state), so an alias table is cached per key and each reply is one draw.
+    """
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self._replies = {}
+        self._samplers = {}
+
+    def seed(self, seed=None):
+        """Reseed the generator for reproducible output."""
+        self.rng.seed(seed)
+
+    def all_replies(self):
+        """Every reply the generator can produce (used to pre-cache speech)."""
+        return [reply for tone in TONE_EFFECT
+                for replies in self._replies_for(tone).values() for reply in replies]
+
+    def _replies_for(self, tone):
+        replies = self._replies.get(tone)
+        if replies is None:
+            prefix = TONE_EFFECT.get(tone, "")
+            replies = {key: tuple(prefix + t for t in TEMPLATES[key]) for key in MOOD_KEYS}
+            self._replies[tone] = replies
+        return replies
+
+    @staticmethod
+    def preference_state(tone, liked_tone_counts, liked_mood_counts):
+        """Reduce preference counts to the bits that affect the weights."""
+        liked_moods = tuple(k for k in MOOD_KEYS if liked_mood_counts.get(k, 0) > 0)
+        tone_liked = liked_tone_counts.get(tone, 0) > 0
+        return liked_moods, tone_liked
+
+    def mood_weights(self, base_key, liked_moods, tone_liked):
+        """Same weighting as the original per-call table."""
+        # Start with small base weights to keep behavior stable
+        weights = {"positive": 1, "negative": 1, "neutral": 1}
+        # Preserve existing behavior by biasing toward detected/base_key
+        weights[base_key] += 3
+        # Boost if user liked this mood previously
+        for mood_key in liked_moods:
+            weights[mood_key] += 10
+        # Boost toward the base_key if the current tone is among liked tones
+        if tone_liked:
+            weights[base_key] += 10
+        return weights
+
+    def sampler(self, tone, base_key, pref_state):
+        key = (tone, base_key, pref_state)
+        sampler = self._samplers.get(key)
+        if sampler is None:
+            weights = self.mood_weights(base_key, *pref_state)
+            replies = self._replies_for(tone)
+            outcomes, flat_weights = [], []
+            for mood_key in MOOD_KEYS:
+                # Spread each mood's weight evenly across its templates
+                per_reply = weights[mood_key] / len(replies[mood_key])
+                for reply in replies[mood_key]:
+                    outcomes.append(reply)
+                    flat_weights.append(per_reply)
+            sampler = AliasSampler(outcomes, flat_weights)
+            self._samplers[key] = sampler
+        return sampler
+
+    def generate(self, tone, mood, liked_tone_counts, liked_mood_counts):
+        pref_state = self.preference_state(tone, liked_tone_counts, liked_mood_counts)
+        return self.sampler(tone, base_mood_key(mood), pref_state).sample(self.rng)
+
+    def generate_batch(self, items, liked_tone_counts, liked_mood_counts):
+        """Generate one reply per (tone, mood) pair."""
+        rng = self.rng
+        pref_cache = {}
+        replies = []
+        append = replies.append
+        for tone, mood in items:
+            pref_state = pref_cache.get(tone)
+            if pref_state is None:
+                pref_state = self.preference_state(tone, liked_tone_counts, liked_mood_counts)
+                pref_cache[tone] = pref_state
+            append(self.sampler(tone, base_mood_key(mood), pref_state).sample(rng))
+        return replies
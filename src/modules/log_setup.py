@@ -0,0 +1,104 @@
+# -------------------- log_setup.py --------------------
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+ROOT_LOGGER = "dotpi"
+DEFAULT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+def get_logger(name):
+    """Logger under the app's namespace, e.g. get_logger("engine") → "dotpi.engine"."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+class StructuredFormatter(logging.Formatter):
+    """Appends fields passed via `extra=` (latency_ms, tone, mood, backend, …) as key=value."""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = [f"{key}={value}" for key, value in record.__dict__.items()
+                  if key not in _STANDARD_ATTRS and not key.startswith("_")]
+        return f"{line} | {' '.join(fields)}" if fields else line
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Puts the raw record on the queue. The stock QueueHandler formats the
+    message in the caller's thread; here that work is left to the listener.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def parse_module_levels(spec):
+    """Parse "engine=DEBUG,dashboard=WARNING" into {"engine": "DEBUG", ...}."""
+    levels = {}
+    for part in (spec or "").split(","):
+        if "=" in part:
+            name, level = part.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level=None, log_file="data/logs/dotpi.log", module_levels=None,
+                  console=True, max_bytes=1_000_000, backup_count=5):
+    """
+    Route all "dotpi.*" loggers through a queue to a background listener
+    that writes a rotating log file (and the console).
+
+    level: default level (env DOTPI_LOG_LEVEL, else INFO).
+    module_levels: {"engine": "DEBUG", ...} (env DOTPI_LOG_LEVELS="engine=DEBUG,...").
+    Safe to call more than once; later calls replace the handlers.
+    """
+    global _listener
+    shutdown_logging()
+
+    level = (level or os.getenv("DOTPI_LOG_LEVEL") or "INFO").upper()
+    module_levels = dict(parse_module_levels(os.getenv("DOTPI_LOG_LEVELS")), **(module_levels or {}))
+
+    formatter = StructuredFormatter(DEFAULT_FORMAT)
+    handlers = []
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes,
+                                           backupCount=backup_count, encoding="utf-8")
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers[:] = [_DeferredQueueHandler(log_queue)]
+    root.setLevel(level)
+    root.propagate = False
+    for name, module_level in module_levels.items():
+        get_logger(name).setLevel(module_level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,181 @@
+# -------------------- memory_export.py --------------------
+import csv
+import gzip
+import io
+import json
+import os
+import threading
+
+from modules.analytics_query import to_seconds
+from modules.json_stream import JsonEntryStream
+
+# Format name → (file extension, description) for the save dialog
+EXPORT_FORMATS = {
+    "jsonl": (".jsonl", "JSON Lines"),
+    "jsonl.gz": (".jsonl.gz", "Compressed JSON Lines"),
+    "csv": (".csv", "CSV"),
+    "json": (".json", "JSON (legacy layout)"),
+}
+
+CSV_FIELDS = ("timestamp", "input", "response", "mood", "tags")
+
+
+def format_for_path(path):
+    """Pick an export format from the file name."""
+    lowered = path.lower()
+    if lowered.endswith(".jsonl.gz") or lowered.endswith(".gz"):
+        return "jsonl.gz"
+    if lowered.endswith(".jsonl"):
+        return "jsonl"
+    if lowered.endswith(".csv"):
+        return "csv"
+    return "json"
+
+
+class MemoryExporter:
+    """
+    Export memory entries in chunks, streaming from the memory file on disk.
+
+    Only `chunk_size` entries are buffered at a time, so peak memory does not
+    grow with history size. Output goes to a temp file that replaces the
+    destination only when the export completes.
+
+    progress(fraction, exported) is called after each chunk; set
+    `cancel_event` to stop early (the destination is then left untouched).
+    """
+
+    def __init__(self, source_path, dest_path, fmt=None, start=None, end=None,
+                 moods=None, chunk_size=500, progress=None, cancel_event=None):
+        self.source_path = source_path
+        self.dest_path = dest_path
+        self.fmt = fmt or format_for_path(dest_path)
+        self.start = to_seconds(start)
+        self.end = to_seconds(end)
+        self.moods = set(moods) if moods else None
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.cancel_event = cancel_event or threading.Event()
+        self.exported = 0
+
+    def _matches(self, entry):
+        if self.moods is not None and entry.get("mood") not in self.moods:
+            return False
+        if self.start is not None or self.end is not None:
+            ts = to_seconds(entry.get("timestamp"))
+            if ts is None:
+                return False
+            if self.start is not None and ts < self.start:
+                return False
+            if self.end is not None and ts >= self.end:
+                return False
+        return True
+
+    def _open(self, path):
+        if self.fmt == "jsonl.gz":
+            return io.TextIOWrapper(gzip.open(path, "wb"), encoding="utf-8")
+        return open(path, "w", encoding="utf-8", newline="" if self.fmt == "csv" else None)
+
+    def run(self):
+        """Run the export; returns the number of entries written (None if cancelled)."""
+        stream = JsonEntryStream(self.source_path)
+        total_chars = max(os.path.getsize(self.source_path), 1) if os.path.exists(self.source_path) else 1
+        tmp_path = self.dest_path + ".part"
+
+        try:
+            with self._open(tmp_path) as out:
+                writer = _FORMAT_WRITERS[self.fmt](out)
+                chunk = []
+                for entry in stream if os.path.exists(self.source_path) else ():
+                    if not isinstance(entry, dict) or not self._matches(entry):
+                        continue
+                    chunk.append(entry)
+                    if len(chunk) >= self.chunk_size:
+                        if self.cancel_event.is_set():
+                            raise _Cancelled()
+                        writer.write_chunk(chunk)
+                        self.exported += len(chunk)
+                        chunk = []
+                        if self.progress:
+                            self.progress(min(stream.chars_read / total_chars, 1.0), self.exported)
+                if chunk:
+                    writer.write_chunk(chunk)
+                    self.exported += len(chunk)
+                writer.finish(stream.fields)
+            os.replace(tmp_path, self.dest_path)
+        except _Cancelled:
+            _remove(tmp_path)
+            return None
+        except Exception:
+            _remove(tmp_path)
+            raise
+
+        if self.progress:
+            self.progress(1.0, self.exported)
+        return self.exported
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class _JsonLinesWriter:
+    def __init__(self, out):
+        self.out = out
+
+    def write_chunk(self, entries):
+        self.out.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries))
+
+    def finish(self, fields):
+        pass
+
+
+class _CsvWriter:
+    def __init__(self, out):
+        self.writer = csv.DictWriter(out, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        self.writer.writeheader()
+
+    def write_chunk(self, entries):
+        self.writer.writerows(
+            dict(e, tags=";".join(str(t) for t in e.get("tags") or [])) for e in entries
+        )
+
+    def finish(self, fields):
+        pass
+
+
+class _LegacyJsonWriter:
+    """Same {"user_name": ..., "entries": [...]} layout as the old export, written incrementally."""
+
+    def __init__(self, out):
+        self.out = out
+        self.first = True
+        self.out.write('{"entries": [')
+
+    def write_chunk(self, entries):
+        parts = []
+        for entry in entries:
+            parts.append(("\n    " if self.first else ",\n    ") + json.dumps(entry))
+            self.first = False
+        self.out.write("".join(parts))
+
+    def finish(self, fields):
+        self.out.write("\n]")
+        for key, value in fields.items():
+            if key != "entries":
+                self.out.write(f",\n{json.dumps(key)}: {json.dumps(value)}")
+        self.out.write("}\n")
+
+
+_FORMAT_WRITERS = {
+    "jsonl": _JsonLinesWriter,
+    "jsonl.gz": _JsonLinesWriter,
+    "csv": _CsvWriter,
+    "json": _LegacyJsonWriter,
+}
@@ -1,34 +1,55 @@
 # -------------------- mood_trend_dashboard.py --------------------
-import json
 import os
 from datetime import datetime
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from collections import Counter
+from modules.chart_utils import bucket_series, max_points_for
+from modules.records import load_feedback_records
+from modules.feedback_archive import FeedbackArchive
+from modules.log_setup import get_logger
+
+log = get_logger("dashboard")
 
 class MoodTrendDashboard:
-    def __init__(self, feedback_file="data/user_data.json"):
+    def __init__(self, feedback_file="data/user_data.json", data=None, archive=None):
         self.feedback_file = feedback_file
-        self.data = self._load_data()
+        # Pre-filtered entries (e.g. a TimeIndex range) skip the file read;
+        # otherwise per-day counts come from the memory-mapped archive when available
+        self.archive = archive if data is None else None
+        if data is None and self.archive is None:
+            self.archive = FeedbackArchive.for_source(feedback_file)
+        self.data = data if data is not None or self.archive is not None else self._load_data()
+
+        # Reused across refreshes; lines are updated in place
+        self.fig = None
+        self.ax = None
+        self.lines = {}
 
     def _load_data(self):
         """Load feedback data from JSON."""
         if not os.path.exists(self.feedback_file):
-            print(f"DEBUG: No data file found at {self.feedback_file}")
+            log.debug("No data file found at %s", self.feedback_file)
             return []
 
         try:
-            with open(self.feedback_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    print(f"DEBUG: Loaded {len(data)} feedback entries.")
-                    return data
-                else:
-                    print("DEBUG: Invalid data structure.")
-                    return []
+            # Streamed into compact records instead of one big json.load
+            data = load_feedback_records(self.feedback_file)
+            log.debug("Loaded %d feedback entries.", len(data))
+            return data
         except Exception as e:
-            print(f"DEBUG: Error loading data: {e}")
+            log.debug("Error loading data: %s", e)
             return []
 
+    def mood_trend(self):
+        """Mood frequency by date for this dashboard's data (archive or entries)."""
+        if self.data is None and self.archive is not None:
+            mood_by_date = self.archive.daily_counts("mood")
+            if not mood_by_date:
+                log.debug("No mood data found.")
+            return mood_by_date or None
+        return self.prepare_mood_trend(self.data) if self.data else None
+
     def prepare_mood_trend(self, data):
         """Prepare mood frequency by date."""
         mood_by_date = {}
@@ -48,21 +69,17 @@ class MoodTrendDashboard:
             mood_by_date[date][mood] += 1
 
         if not mood_by_date:
-            print("DEBUG: No mood data found.")
+            log.debug("No mood data found.")
             return None
 
         return mood_by_date
 
-    def plot_mood_trends(self):
+    def plot_mood_trends(self, mood_by_date=None):
         """Return a Matplotlib Figure for embedding in Tkinter."""
-        data = self._load_data()
-        if not data:
-            print("No feedback data found.")
-            return None
-
-        mood_by_date = self.prepare_mood_trend(data)
+        if mood_by_date is None:
+            mood_by_date = self.mood_trend()
         if not mood_by_date:
-            print("No mood trend data available.")
+            log.info("No mood trend data available.")
             return None
 
         # Prepare data for plotting
@@ -71,32 +88,47 @@ class MoodTrendDashboard:
         for counts in mood_by_date.values():
             moods.update(counts.keys())
 
-        # Create figure
-        fig, ax = plt.subplots(figsize=(8, 5))
-        for mood in moods:
-            counts = [mood_by_date[d].get(mood, 0) for d in dates]
-            ax.plot(dates, counts, marker="o", label=mood)
-
-        ax.set_title("Mood Trend Over Time", fontsize=14)
-        ax.set_xlabel("Date", fontsize=12)
-        ax.set_ylabel("Frequency", fontsize=12)
-        ax.legend(title="Detected Mood")
-        ax.grid(True)
-        fig.tight_layout()
-
-        return fig
+        # Create the figure once (not through pyplot, so it isn't kept in its registry)
+        if self.fig is None:
+            self.fig = Figure(figsize=(8, 5))
+            self.ax = self.fig.add_subplot(111)
+            self.ax.set_title("Mood Trend Over Time", fontsize=14)
+            self.ax.set_xlabel("Date", fontsize=12)
+            self.ax.set_ylabel("Frequency", fontsize=12)
+            self.ax.grid(True)
+
+        # Long ranges are bucketed to what the axes can actually show
+        series = {mood: [mood_by_date[d].get(mood, 0) for d in dates] for mood in moods}
+        dates, series = bucket_series(dates, series, max_points_for(self.fig, self.ax))
+
+        for mood in sorted(moods):
+            line = self.lines.get(mood)
+            if line is None:
+                (line,) = self.ax.plot(dates, series[mood], marker="o", label=mood)
+                self.lines[mood] = line
+            else:
+                line.set_data(dates, series[mood])
+        for mood in list(self.lines):
+            if mood not in moods:
+                self.lines.pop(mood).remove()
+
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.ax.legend(title="Detected Mood")
+        self.fig.tight_layout()
+
+        return self.fig
 
 
     def show_dashboard(self):
         """Display the mood trend dashboard."""
-        data = self._load_data()
-        if not data:
+        if not self.data and not self.archive:
             print("No feedback data found.")
             return
 
-        mood_by_date = self.prepare_mood_trend(data)
+        mood_by_date = self.mood_trend()
         if not mood_by_date:
-            print("No mood trend data available.")
+            log.info("No mood trend data available.")
             return
 
         # Prepare data for plotting
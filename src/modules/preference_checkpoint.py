@@ -0,0 +1,174 @@
+# -------------------- preference_checkpoint.py --------------------
+import json
+import os
+import threading
+
+from modules.file_lock import atomic_write
+from modules.json_stream import JsonEntryStream, open_snapshot
+from modules.user_state import aggregate_likes
+from modules.log_setup import get_logger
+from tk_app.preference_learner import PreferenceLearner
+
+log = get_logger("preferences")
+
+
+class PreferenceSnapshot:
+    """
+    Frozen copy of the preference counts and the learner's recommended tone.
+    Safe to use on any thread; it answers like a UserState does.
+    """
+
+    __slots__ = ("liked_tone_counts", "liked_mood_counts", "tone")
+
+    def __init__(self, liked_tone_counts, liked_mood_counts, tone):
+        self.liked_tone_counts = liked_tone_counts
+        self.liked_mood_counts = liked_mood_counts
+        self.tone = tone
+
+    def recommend_tone(self):
+        return self.tone
+
+
+class PreferenceCheckpoint:
+    """
+    Preference aggregates of the feedback log, saved with the byte offset
+    they cover.
+
+    Holds the engine's liked tone/mood counts and a PreferenceLearner's
+    counters, which are changed in place under the lock: other threads
+    should read them through snapshot(). The feedback log is a compact store that only grows by
+    in-place appends, so on open only entries after `offset` are replayed.
+    A CRC of the bytes just before the offset detects a rewritten log; a
+    missing, outdated or stale checkpoint is rebuilt from the whole log.
+    """
+
+    VERSION = 1
+
+    def __init__(self, feedback_file="data/user_data.json", path="data/preference_checkpoint.json"):
+        self.feedback_file = feedback_file
+        self.path = path
+        self.offset = None          # None: the log isn't compact, so nothing can be skipped
+        self.fingerprint = None
+        self.learner = PreferenceLearner(feedback_file, load=False)
+        self.liked_tone_counts, self.liked_mood_counts = aggregate_likes([])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, feedback_file="data/user_data.json", path="data/preference_checkpoint.json"):
+        """Load the checkpoint and bring it up to date with the log (rebuilding if needed)."""
+        checkpoint = cls(feedback_file, path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                restored = checkpoint._restore(json.load(f))
+        except FileNotFoundError:
+            restored = False
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            log.warning("Could not read %s, rebuilding: %s", path, e)
+            restored = False
+        if not restored:
+            checkpoint.rebuild()
+        else:
+            checkpoint.catch_up()
+        return checkpoint
+
+    def snapshot(self):
+        """A PreferenceSnapshot of the current counts, taken under the lock."""
+        with self._lock:
+            return PreferenceSnapshot(dict(self.liked_tone_counts), dict(self.liked_mood_counts),
+                                      self.learner.recommend_tone())
+
+    # ---------- FOLDING ----------
+    def _fold(self, entries):
+        entries = [entry for entry in entries if isinstance(entry, dict)]
+        aggregate_likes(entries, self.liked_tone_counts, self.liked_mood_counts)
+        for entry in entries:
+            self.learner.observe(entry)
+        return len(entries)
+
+    def _reset(self):
+        # In place: the engine holds on to these objects
+        for counts in (self.liked_tone_counts, self.liked_mood_counts):
+            counts.update(dict.fromkeys(counts, 0))
+        self.learner.entry_count = 0
+        for counter in (self.learner.liked_tones, self.learner.disliked_tones, self.learner.moods):
+            counter.clear()
+        self.offset = self.fingerprint = None
+
+    def _mark(self, stream, snapshot):
+        self.offset = stream.end_offset(snapshot)
+        self.fingerprint = snapshot.fingerprint(self.offset) if self.offset is not None else None
+
+    def rebuild(self):
+        """Recount everything from the log."""
+        with self._lock:
+            self._reset()
+            try:
+                if os.path.exists(self.feedback_file):
+                    # The counts and the offset come from the same snapshot of the log
+                    with open_snapshot(self.feedback_file) as snapshot:
+                        stream = JsonEntryStream(self.feedback_file)
+                        self._fold(stream.read(snapshot))
+                        self._mark(stream, snapshot)
+            except (OSError, ValueError) as e:
+                # Zeroed preferences rather than a broken engine
+                log.warning("Could not read %s: %s", self.feedback_file, e)
+                self._reset()
+            log.info("Preference checkpoint rebuilt", extra={"entries": self.learner.entry_count})
+            self._save()
+
+    def catch_up(self):
+        """Fold in entries appended since the checkpoint. Returns how many were added."""
+        with self._lock:
+            try:
+                if self.offset is None:
+                    raise ValueError("the feedback log isn't compact")
+                with open_snapshot(self.feedback_file) as snapshot:
+                    if snapshot.fingerprint(self.offset) != self.fingerprint:
+                        raise ValueError("checkpoint doesn't match the feedback log")
+                    stream = JsonEntryStream(self.feedback_file)
+                    added = self._fold(stream.entries_after(self.offset, snapshot))
+                    self._mark(stream, snapshot)
+            except (OSError, ValueError) as e:
+                log.info("Preference checkpoint is stale (%s); rebuilding", e)
+                added = None
+            else:
+                if added:
+                    self._save()
+        if added is None:
+            self.rebuild()
+            return self.learner.entry_count
+        return added
+
+    # ---------- PERSISTENCE ----------
+    def to_dict(self):
+        return {
+            "version": self.VERSION,
+            "offset": self.offset,
+            "fingerprint": self.fingerprint,
+            "entry_count": self.learner.entry_count,
+            "liked_tone_counts": self.liked_tone_counts,
+            "liked_mood_counts": self.liked_mood_counts,
+            "liked_tones": dict(self.learner.liked_tones),
+            "disliked_tones": dict(self.learner.disliked_tones),
+            "moods": dict(self.learner.moods),
+        }
+
+    def _restore(self, data):
+        if data.get("version") != self.VERSION or data.get("offset") is None:
+            return False
+        self.offset = data["offset"]
+        self.fingerprint = data.get("fingerprint")
+        self.liked_tone_counts.update(data.get("liked_tone_counts", {}))
+        self.liked_mood_counts.update(data.get("liked_mood_counts", {}))
+        self.learner.entry_count = data.get("entry_count", 0)
+        self.learner.liked_tones.update(data.get("liked_tones", {}))
+        self.learner.disliked_tones.update(data.get("disliked_tones", {}))
+        self.learner.moods.update(data.get("moods", {}))
+        return True
+
+    def _save(self):
+        try:
+            with atomic_write(self.path) as f:
+                json.dump(self.to_dict(), f)
+        except OSError as e:
+            log.error("Could not save preference checkpoint: %s", e)
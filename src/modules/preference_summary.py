@@ -1,22 +1,36 @@
-import json
 from collections import Counter
+from modules.records import load_feedback_records
+from modules.feedback_archive import FeedbackArchive
+from modules.log_setup import get_logger
+
+log = get_logger("summary")
 
 class PreferenceSummary:
-    def __init__(self, feedback_file="data/user_data.json"):
+    def __init__(self, feedback_file="data/user_data.json", data=None, archive=None):
         self.feedback_file = feedback_file
-        self.data = self._load_data()
+        # Pre-filtered entries (e.g. a TimeIndex range) skip the file read;
+        # otherwise counts come from the memory-mapped archive when available
+        self.archive = archive if data is None else None
+        if data is None and self.archive is None:
+            self.archive = FeedbackArchive.for_source(feedback_file)
+        self.data = data if data is not None or self.archive is not None else self._load_data()
 
     def _load_data(self):
         try:
-            with open(self.feedback_file, "r") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            print("DEBUG: Error loading file:", e)
+            # Streamed into compact records instead of one big json.load
+            return load_feedback_records(self.feedback_file)
+        except (OSError, ValueError) as e:
+            log.debug("Error loading file: %s", e)
             return []
 
-    def summarize(self):
-        if not self.data:
-            return "No feedback data found yet."
+    def count_preferences(self):
+        """(liked tone, disliked tone, mood) Counters."""
+        if self.archive is not None:
+            # Column scans over the mmap; no per-entry objects are built
+            archive = self.archive
+            return (archive.value_counts("tone", archive.mask(feedback="like")),
+                    archive.value_counts("tone", archive.mask(feedback="dislike")),
+                    archive.value_counts("mood"))
 
         liked_tones = []
         disliked_tones = []
@@ -27,26 +41,34 @@ class PreferenceSummary:
             mood = entry.get("detected_mood")
             feedback = entry.get("feedback")
 
-            if feedback == "like":
+            # Entries without a tone are skipped, as in the archive's value_counts
+            if feedback == "like" and tone is not None:
                 liked_tones.append(tone)
-            elif feedback == "dislike":
+            elif feedback == "dislike" and tone is not None:
                 disliked_tones.append(tone)
 
             if mood:
                 moods.append(mood)
 
+        return Counter(liked_tones), Counter(disliked_tones), Counter(moods)
+
+    def summarize(self):
+        if not self.data and not self.archive:
+            return "No feedback data found yet."
+
+        liked_tones, disliked_tones, moods = self.count_preferences()
         summary = []
 
         if liked_tones:
-            most_liked = Counter(liked_tones).most_common(2)
+            most_liked = liked_tones.most_common(2)
             summary.append(f"You like {', '.join([t for t, _ in most_liked])} tones.")
 
         if disliked_tones:
-            most_disliked = Counter(disliked_tones).most_common(2)
+            most_disliked = disliked_tones.most_common(2)
             summary.append(f"You dislike {', '.join([t for t, _ in most_disliked])} tones.")
 
         if moods:
-            common_moods = Counter(moods).most_common(2)
+            common_moods = moods.most_common(2)
             summary.append(f"You mostly interact when your mood is {', '.join([m for m, _ in common_moods])}.")
 
         return " ".join(summary)
@@ -0,0 +1,198 @@
+# -------------------- records.py --------------------
+import sys
+
+from modules.analytics_query import TIMESTAMP_FORMAT, from_seconds, to_seconds
+from modules.json_stream import iter_json_entries
+
+
+class Vocabulary:
+    """Interns a small set of labels (tones, moods, feedback) as int codes. Code 0 is None."""
+
+    def __init__(self, *values):
+        self.values = [None]
+        self.codes = {None: 0}
+        for value in values:
+            self.code(value)
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            if isinstance(value, str):
+                value = sys.intern(value)
+            code = len(self.values)
+            self.values.append(value)
+            self.codes[value] = code
+        return code
+
+    def value(self, code):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+TONES = Vocabulary("Blunt", "Empathetic", "Balanced", "Auto", "neutral")
+MOODS = Vocabulary("positive", "negative", "neutral", "happy", "sad", "unknown")
+FEEDBACK = Vocabulary("like", "dislike")
+
+
+def _format_ts(ts):
+    return from_seconds(ts).strftime(TIMESTAMP_FORMAT) if ts is not None else None
+
+
+class _Record:
+    """
+    Shared behaviour for slotted records. They answer .get()/[] with the same
+    keys as the JSON dicts they replace, so existing readers keep working.
+    Unknown JSON keys are kept in `extra` and written back untouched.
+    """
+    __slots__ = ()
+    FIELDS = ()
+
+    def get(self, key, default=None):
+        getter = self._GETTERS.get(key)
+        if getter is not None:
+            value = getter(self)
+            return default if value is None else value
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    @property
+    def timestamp(self):
+        if self.ts is None and self.extra:
+            return self.extra.get("timestamp")
+        return _format_ts(self.ts)
+
+    def to_dict(self):
+        data = {key: self.get(key) for key in self.FIELDS}
+        if self.extra:
+            for key, value in self.extra.items():
+                data.setdefault(key, value)
+        return data
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    @staticmethod
+    def _split(data, fields):
+        extra = {k: v for k, v in data.items() if k not in fields}
+        ts = to_seconds(data.get("timestamp"))
+        if ts is not None:
+            extra.pop("timestamp", None)
+        elif "timestamp" in data:
+            # Keep malformed timestamps verbatim
+            extra["timestamp"] = data["timestamp"]
+        return ts, extra or None
+
+
+_MISSING = object()
+
+
+class FeedbackRecord(_Record):
+    """One entry of data/user_data.json."""
+    __slots__ = ("ts", "user_message", "ai_response", "feedback_code",
+                 "mood_code", "tone_code", "extra")
+    FIELDS = ("timestamp", "user_message", "ai_response", "feedback",
+              "detected_mood", "tone_used")
+
+    def __init__(self, ts, user_message, ai_response, feedback, detected_mood, tone_used, extra=None):
+        self.ts = ts
+        self.user_message = user_message
+        # Local-mode replies repeat a handful of templates; share one copy
+        self.ai_response = sys.intern(ai_response) if isinstance(ai_response, str) else ai_response
+        self.feedback_code = FEEDBACK.code(feedback)
+        self.mood_code = MOODS.code(detected_mood)
+        self.tone_code = TONES.code(tone_used)
+        self.extra = extra
+
+    @property
+    def feedback(self):
+        return FEEDBACK.values[self.feedback_code]
+
+    @property
+    def detected_mood(self):
+        return MOODS.values[self.mood_code]
+
+    @property
+    def tone_used(self):
+        return TONES.values[self.tone_code]
+
+    @classmethod
+    def from_dict(cls, data):
+        ts, extra = cls._split(data, cls.FIELDS)
+        return cls(ts, data.get("user_message"), data.get("ai_response"), data.get("feedback"),
+                   data.get("detected_mood"), data.get("tone_used"), extra)
+
+
+FeedbackRecord._GETTERS = {
+    "timestamp": lambda r: r.timestamp,
+    "user_message": lambda r: r.user_message,
+    "ai_response": lambda r: r.ai_response,
+    "feedback": lambda r: FEEDBACK.values[r.feedback_code],
+    "detected_mood": lambda r: MOODS.values[r.mood_code],
+    "tone_used": lambda r: TONES.values[r.tone_code],
+}
+
+
+class MemoryRecord(_Record):
+    """One entry of memory_data["entries"] in data/memory.json."""
+    __slots__ = ("ts", "input", "response", "mood_code", "tags", "extra")
+    FIELDS = ("timestamp", "input", "response", "mood", "tags")
+
+    def __init__(self, ts, input, response, mood, tags=None, extra=None):
+        self.ts = ts
+        self.input = input
+        self.response = sys.intern(response) if isinstance(response, str) else response
+        self.mood_code = MOODS.code(mood)
+        # Most entries have no tags; share one empty tuple instead of a list each
+        self.tags = tuple(tags) if tags else ()
+        self.extra = extra
+
+    @property
+    def mood(self):
+        return MOODS.values[self.mood_code]
+
+    @classmethod
+    def from_dict(cls, data):
+        ts, extra = cls._split(data, cls.FIELDS)
+        return cls(ts, data.get("input"), data.get("response"), data.get("mood"),
+                   data.get("tags"), extra)
+
+
+MemoryRecord._GETTERS = {
+    "timestamp": lambda r: r.timestamp,
+    "input": lambda r: r.input,
+    "response": lambda r: r.response,
+    "mood": lambda r: MOODS.values[r.mood_code],
+    "tags": lambda r: list(r.tags),
+}
+
+
+def to_jsonable(value):
+    """json.dump `default=` hook so record lists serialize as the original dicts."""
+    if isinstance(value, _Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def feedback_records(entries):
+    return [FeedbackRecord.from_dict(e) for e in entries if isinstance(e, dict)]
+
+
+def memory_records(entries):
+    return [MemoryRecord.from_dict(e) for e in entries if isinstance(e, dict)]
+
+
+def load_feedback_records(path):
+    """Stream a feedback file into records. Raises ValueError on malformed JSON."""
+    return feedback_records(iter_json_entries(path))
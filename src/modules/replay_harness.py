@@ -0,0 +1,243 @@
+# -------------------- replay_harness.py --------------------
+import argparse
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from modules.routing import RoutingConfig
+from modules.tone_strategies import STRATEGIES, TONES
+from modules.json_stream import iter_json_entries
+from modules.log_setup import get_logger, setup_logging
+
+log = get_logger("replay")
+
+# Engine used inside each worker process (created once by _init_worker)
+_engine = None
+
+# The engine's VADER labels, in the app's mood vocabulary (see MOOD_TO_TONE)
+_ENGINE_MOODS = {"positive": "happy", "negative": "sad", "neutral": "neutral"}
+
+
+def iter_exchanges(feedback_file="data/user_data.json", memory_file="data/memory.json"):
+    """Yield stored exchanges as flat dicts: feedback log first, then memory."""
+    for entry in _stream(feedback_file, key=None):
+        yield {
+            "source": "feedback",
+            "message": entry.get("user_message", ""),
+            "mood": entry.get("detected_mood"),
+            "tone_used": entry.get("tone_used"),
+            "feedback": entry.get("feedback"),
+        }
+
+    for entry in _stream(memory_file, key="entries"):
+        yield {
+            "source": "memory",
+            "message": entry.get("input", ""),
+            "mood": entry.get("mood"),
+            "tone_used": None,
+            "feedback": None,
+        }
+
+
+def _stream(path, key):
+    # Stream one store; a malformed file ends its stream with a warning
+    if not path:
+        return
+    try:
+        for entry in iter_json_entries(path, key=key):
+            if isinstance(entry, dict):
+                yield entry
+    except (OSError, ValueError) as e:
+        log.warning("Could not read %s: %s", path, e)
+
+
+def _init_worker(backend, seed, feedback_file, state_dir):
+    global _engine
+    from response_engine import ResponseEngine
+    # Preferences come from the replayed log and the checkpoint lives in
+    # state_dir; routing uses the defaults, so the app's data/ isn't touched
+    _engine = ResponseEngine(
+        mode=backend, seed=seed, routing=RoutingConfig(),
+        feedback_file=feedback_file or "",
+        checkpoint_file=os.path.join(state_dir, f"preference_checkpoint-{os.getpid()}.json"),
+    )
+
+
+def _generate(tone, exchange):
+    """Push one exchange through the engine. Returns True if it fell back."""
+    message, mood = exchange["message"], exchange["mood"]
+    if _engine.mode == "local":
+        _engine.generate_local_response(message, tone, mood)
+        return False
+    try:
+        _engine.request_ai_response(message, tone, mood)
+        return False
+    except Exception:
+        _engine.generate_local_response(message, tone, mood)
+        return True
+
+
+def _new_metrics():
+    return {
+        "exchanges": 0,
+        "liked_total": 0,
+        "liked_agree": 0,
+        "disliked_total": 0,
+        "disliked_repeat": 0,
+        "fallbacks": 0,
+        "latencies": [],
+        "tones": Counter(),
+    }
+
+
+def replay_shard(shard, strategy_names, liked_tone_counts, seed=None):
+    """
+    Replay one contiguous shard of history under each strategy.
+    `liked_tone_counts` are the likes seen before the shard starts, so
+    learning strategies behave as if replayed from the beginning.
+    `seed` should differ per shard so random strategies don't repeat a stream.
+    """
+    results = {}
+    for name in strategy_names:
+        strategy = STRATEGIES[name](liked_tone_counts, seed=seed)
+        metrics = _new_metrics()
+
+        for exchange in shard:
+            if _engine is not None and exchange["mood"] is None:
+                mood = _engine.detect_mood(exchange["message"])
+                exchange["mood"] = _ENGINE_MOODS.get(mood, mood)
+
+            start = time.perf_counter()
+            tone = strategy.choose(exchange["mood"])
+            fell_back = _generate(tone, exchange) if _engine is not None else False
+            metrics["latencies"].append(time.perf_counter() - start)
+
+            metrics["exchanges"] += 1
+            metrics["tones"][tone] += 1
+            if fell_back:
+                metrics["fallbacks"] += 1
+            if exchange["feedback"] == "like":
+                metrics["liked_total"] += 1
+                metrics["liked_agree"] += tone == exchange["tone_used"]
+            elif exchange["feedback"] == "dislike":
+                metrics["disliked_total"] += 1
+                metrics["disliked_repeat"] += tone == exchange["tone_used"]
+
+            strategy.observe(exchange["feedback"], exchange["tone_used"])
+
+        results[name] = metrics
+    return results
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def _merge(total, part):
+    for key in ("exchanges", "liked_total", "liked_agree", "disliked_total",
+                "disliked_repeat", "fallbacks"):
+        total[key] += part[key]
+    total["latencies"].extend(part["latencies"])
+    total["tones"].update(part["tones"])
+
+
+def build_report(merged, elapsed):
+    report = {"elapsed_seconds": round(elapsed, 3), "strategies": {}}
+    for name, m in merged.items():
+        latencies = sorted(m["latencies"])
+        exchanges = m["exchanges"] or 1
+        report["strategies"][name] = {
+            "exchanges": m["exchanges"],
+            "agreement_with_liked": round(m["liked_agree"] / m["liked_total"], 4) if m["liked_total"] else None,
+            "disliked_tone_repeat_rate": round(m["disliked_repeat"] / m["disliked_total"], 4) if m["disliked_total"] else None,
+            "fallback_rate": round(m["fallbacks"] / exchanges, 4),
+            "latency_ms": {
+                "mean": round(sum(latencies) / exchanges * 1000, 3),
+                "p50": round(_percentile(latencies, 50) * 1000, 3),
+                "p95": round(_percentile(latencies, 95) * 1000, 3),
+            },
+            "tone_distribution": dict(m["tones"]),
+        }
+    return report
+
+
+def run_replay(feedback_file="data/user_data.json", memory_file="data/memory.json",
+               strategies=None, backend="local", workers=None, shard_size=5000,
+               seed=None, report_file="data/replay_report.json"):
+    """
+    Stream stored history through the engine under each strategy on a process pool.
+    Returns the report dict and writes it to `report_file` (if given).
+    """
+    strategy_names = list(strategies or STRATEGIES)
+    workers = workers or os.cpu_count() or 1
+    merged = {name: _new_metrics() for name in strategy_names}
+    liked_before = Counter()
+    start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix="dotpi-replay-") as state_dir, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                initargs=(backend, seed, feedback_file, state_dir)) as pool:
+        pending = set()
+        shard = []
+        shard_index = 0
+
+        def submit(shard):
+            nonlocal shard_index
+            shard_seed = None if seed is None else seed + shard_index
+            shard_index += 1
+            pending.add(pool.submit(replay_shard, shard, strategy_names,
+                                    dict(liked_before), shard_seed))
+
+        def drain(limit):
+            # Keep only a bounded number of shards in flight
+            nonlocal pending
+            while len(pending) > limit:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for name, part in future.result().items():
+                        _merge(merged[name], part)
+
+        for exchange in iter_exchanges(feedback_file, memory_file):
+            shard.append(exchange)
+            if len(shard) >= shard_size:
+                submit(shard)
+                for entry in shard:
+                    if entry["feedback"] == "like" and entry["tone_used"] in TONES:
+                        liked_before[entry["tone_used"]] += 1
+                shard = []
+                drain(workers * 2)
+        if shard:
+            submit(shard)
+        drain(0)
+
+    report = build_report(merged, time.perf_counter() - start)
+    if report_file:
+        os.makedirs(os.path.dirname(report_file) or ".", exist_ok=True)
+        with open(report_file, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay stored conversations under each tone strategy.")
+    parser.add_argument("--feedback-file", default="data/user_data.json")
+    parser.add_argument("--memory-file", default="data/memory.json")
+    parser.add_argument("--strategy", action="append", choices=sorted(STRATEGIES))
+    parser.add_argument("--backend", default="local", choices=["local", "api", "auto"])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--shard-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--report", default="data/replay_report.json")
+    parser.add_argument("--log-level", default=None)
+    args = parser.parse_args()
+    setup_logging(args.log_level, log_file="data/logs/replay.log")
+
+    report = run_replay(args.feedback_file, args.memory_file, args.strategy, args.backend,
+                        args.workers, args.shard_size, args.seed, args.report)
+    print(json.dumps(report, indent=4))
@@ -0,0 +1,236 @@
+# -------------------- reply_metrics.py --------------------
+import json
+import os
+import threading
+from datetime import date, datetime
+
+from modules.analytics_query import to_seconds
+from modules.log_setup import get_logger
+
+log = get_logger("metrics")
+
+# Latency histogram bucket upper bounds (ms), ~25% apart: 10 ms … ~2 min
+LATENCY_BUCKETS_MS = tuple(round(10 * 1.25 ** i, 1) for i in range(43))
+
+
+class ReplyMetrics:
+    """One generated reply: which backend answered, how long it took, and why it fell back."""
+
+    __slots__ = ("ts", "backend", "latency_ms", "prompt_chars", "response_chars", "fallback_reason")
+
+    def __init__(self, backend, latency_ms, prompt_chars=0, response_chars=0,
+                 fallback_reason=None, ts=None):
+        self.ts = to_seconds(ts if ts is not None else datetime.now())
+        self.backend = backend
+        # Rounded as stored, so the live aggregate matches one rebuilt from the log
+        self.latency_ms = round(latency_ms, 1)
+        self.prompt_chars = prompt_chars
+        self.response_chars = response_chars
+        self.fallback_reason = fallback_reason
+
+    @property
+    def fallback(self):
+        return self.fallback_reason is not None
+
+    def to_dict(self):
+        entry = {
+            "ts": self.ts,
+            "backend": self.backend,
+            "latency_ms": self.latency_ms,
+            "prompt_chars": self.prompt_chars,
+            "response_chars": self.response_chars,
+        }
+        if self.fallback_reason is not None:
+            entry["fallback"] = self.fallback_reason
+        return entry
+
+    @classmethod
+    def from_dict(cls, entry):
+        return cls(entry.get("backend"), entry.get("latency_ms", 0.0), entry.get("prompt_chars", 0),
+                   entry.get("response_chars", 0), entry.get("fallback"), ts=entry.get("ts"))
+
+
+def _bucket_for(latency_ms):
+    # Linear scan is fine: 43 buckets, and latencies cluster in the low ones
+    for i, bound in enumerate(LATENCY_BUCKETS_MS):
+        if latency_ms <= bound:
+            return i
+    return len(LATENCY_BUCKETS_MS) - 1
+
+
+class DailyLatencyAggregate:
+    """
+    Per-day reply counts, fallbacks and a latency histogram.
+
+    Built incrementally from the metrics log: `offset` is the byte position
+    in the log already folded in, so catch_up() only reads newer lines.
+    Percentiles come from the histogram (bucket upper bound), which keeps the
+    aggregate a fixed size per day however many replies it covers.
+    """
+
+    VERSION = 1
+
+    def __init__(self):
+        self.days = {}      # ordinal → {"count", "fallbacks", "backends", "reasons", "hist"}
+        self.offset = 0
+
+    def add(self, metrics):
+        if metrics.ts is None:
+            return
+        day = self.days.get(metrics.ts // 86400)
+        if day is None:
+            day = {"count": 0, "fallbacks": 0, "backends": {}, "reasons": {},
+                   "hist": [0] * len(LATENCY_BUCKETS_MS)}
+            self.days[metrics.ts // 86400] = day
+        day["count"] += 1
+        day["hist"][_bucket_for(metrics.latency_ms)] += 1
+        day["backends"][metrics.backend] = day["backends"].get(metrics.backend, 0) + 1
+        if metrics.fallback:
+            day["fallbacks"] += 1
+            reason = metrics.fallback_reason
+            day["reasons"][reason] = day["reasons"].get(reason, 0) + 1
+
+    def catch_up(self, log_path):
+        """Fold in log lines written since the last call. Returns how many were added."""
+        try:
+            size = os.path.getsize(log_path)
+        except OSError:
+            return 0
+        if size < self.offset:
+            # Log was truncated or replaced: start over
+            self.days.clear()
+            self.offset = 0
+
+        added = 0
+        with open(log_path, "rb") as f:
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partially written line; picked up next time
+                self.offset += len(line)
+                try:
+                    self.add(ReplyMetrics.from_dict(json.loads(line)))
+                    added += 1
+                except (ValueError, TypeError, AttributeError) as e:
+                    log.debug("Skipping bad metrics line: %s", e)
+        return added
+
+    @staticmethod
+    def percentile(hist, q):
+        total = sum(hist)
+        if not total:
+            return None
+        target = q * total
+        running = 0
+        for bound, n in zip(LATENCY_BUCKETS_MS, hist):
+            running += n
+            if running >= target:
+                return bound
+        return LATENCY_BUCKETS_MS[-1]
+
+    def daily_series(self, start=None, end=None):
+        """
+        [(date, p50_ms, p95_ms, fallback_rate, count)] per day, oldest first,
+        for days inside [start, end) (datetimes or seconds; None = open).
+        """
+        start_day = None if start is None else to_seconds(start) // 86400
+        end_day = None if end is None else (to_seconds(end) - 1) // 86400
+        rows = []
+        for ordinal in sorted(self.days):
+            if start_day is not None and ordinal < start_day:
+                continue
+            if end_day is not None and ordinal > end_day:
+                continue
+            day = self.days[ordinal]
+            rows.append((date.fromordinal(ordinal),
+                         self.percentile(day["hist"], 0.50),
+                         self.percentile(day["hist"], 0.95),
+                         day["fallbacks"] / day["count"] if day["count"] else 0.0,
+                         day["count"]))
+        return rows
+
+    def to_dict(self):
+        return {
+            "version": self.VERSION,
+            "buckets_ms": list(LATENCY_BUCKETS_MS),
+            "offset": self.offset,
+            "days": {date.fromordinal(k).isoformat(): v for k, v in self.days.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregate = cls()
+        # A different bucket layout can't be merged; rebuild from the log instead
+        if data.get("version") != cls.VERSION or tuple(data.get("buckets_ms", ())) != LATENCY_BUCKETS_MS:
+            return aggregate
+        aggregate.offset = data.get("offset", 0)
+        aggregate.days = {date.fromisoformat(k).toordinal(): v for k, v in data.get("days", {}).items()}
+        return aggregate
+
+    @classmethod
+    def load(cls, aggregate_path, log_path):
+        """Load the saved aggregate (if any) and catch up with the log."""
+        aggregate = cls()
+        try:
+            with open(aggregate_path, "r", encoding="utf-8") as f:
+                aggregate = cls.from_dict(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log.warning("Could not read %s, rebuilding: %s", aggregate_path, e)
+        aggregate.catch_up(log_path)
+        return aggregate
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+
+class MetricsLog:
+    """
+    Append-only JSON Lines log of ReplyMetrics, one line per reply.
+
+    Appending never rewrites existing data. The daily aggregate is kept
+    current in memory and saved every `save_every` replies (and on close()),
+    so readers only replay the few lines written since the last save.
+    """
+
+    def __init__(self, path="data/reply_metrics.jsonl",
+                 aggregate_path="data/reply_metrics_daily.json", save_every=20):
+        self.path = path
+        self.aggregate_path = aggregate_path
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.aggregate = DailyLatencyAggregate.load(aggregate_path, path)
+
+    def record(self, metrics):
+        line = (json.dumps(metrics.to_dict()) + "\n").encode("utf-8")
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "ab") as f:
+                    f.write(line)
+            except OSError as e:
+                log.error("Could not append metrics: %s", e)
+                return
+            self.aggregate.add(metrics)
+            self.aggregate.offset += len(line)
+            self._unsaved += 1
+            if self._unsaved >= self.save_every:
+                self._save()
+
+    def _save(self):
+        try:
+            self.aggregate.save(self.aggregate_path)
+            self._unsaved = 0
+        except OSError as e:
+            log.error("Could not save metrics aggregate: %s", e)
+
+    def close(self):
+        with self._lock:
+            if self._unsaved:
+                self._save()
@@ -0,0 +1,146 @@
+# -------------------- routing.py --------------------
+import json
+import re
+import threading
+from collections import Counter, deque
+
+from modules.log_setup import get_logger
+
+log = get_logger("routing")
+
+# Short acknowledgements a template reply handles as well as the API would
+TRIVIAL_MESSAGES = frozenset({
+    "ok", "okay", "k", "kk", "cool", "nice", "great", "thanks", "thank you", "thx", "ty",
+    "yes", "yep", "yeah", "no", "nope", "sure", "fine", "alright", "hi", "hello", "hey",
+    "bye", "goodbye", "good night", "lol", "haha", "got it", "sounds good", "will do",
+})
+
+_WORD_RE = re.compile(r"[\w']+")
+
+
+class RoutingConfig:
+    """
+    The app's reply backend ("mode") and the thresholds of the "auto" mode.
+
+    Defaults can be overridden by a JSON file (data/routing.json) holding any
+    subset of the attribute names below, e.g. {"mode": "auto"}.
+    """
+
+    MODES = ("api", "local", "auto")
+
+    DEFAULTS = {
+        # Backend of the app's ResponseEngine: "api" (every reply from the API, as
+        # before routing existed), "local" (templates only) or "auto" (routed)
+        "mode": "api",
+        # Messages up to this many words are "simple" unless they carry strong sentiment
+        "max_local_words": 4,
+        # Messages with at least this many words always go to the API (when it's healthy)
+        "min_api_words": 12,
+        # |VADER compound| at or above this sends even a short message to the API
+        "sentiment_threshold": 0.5,
+        # Recent API calls considered for health checks
+        "window": 20,
+        # Above this fallback rate the API is treated as unhealthy...
+        "max_fallback_rate": 0.5,
+        # ...and above this average latency (ms) medium messages stay local
+        "latency_budget_ms": 4000,
+        # While unhealthy, still send every Nth routed message to the API as a probe
+        "probe_every": 10,
+    }
+
+    def __init__(self, **overrides):
+        unknown = set(overrides) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown routing settings: {', '.join(sorted(unknown))}")
+        if overrides.get("mode", "api") not in self.MODES:
+            raise ValueError(f"Unknown mode {overrides['mode']!r}; expected one of {', '.join(self.MODES)}")
+        for key, value in dict(self.DEFAULTS, **overrides).items():
+            setattr(self, key, value)
+
+    @classmethod
+    def from_file(cls, path="data/routing.json"):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except FileNotFoundError:
+            return cls()
+        except (OSError, ValueError, TypeError) as e:
+            log.warning("Could not read %s, using defaults: %s", path, e)
+            return cls()
+
+
+class Router:
+    """
+    Cheap per-message choice between the local generator and the API.
+
+    Decisions use message length, sentiment magnitude and the health of
+    recent API calls (fallback rate and latency, fed in via observe()).
+    Every decision is counted in `counts` (backend) and `reasons`.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or RoutingConfig()
+        self._recent = deque(maxlen=self.config.window)   # (latency_ms, fell_back)
+        self._lock = threading.Lock()
+        self._since_probe = 0
+        self.counts = Counter()
+        self.reasons = Counter()
+
+    def observe(self, latency_ms, fell_back):
+        """Feed the outcome of one API attempt."""
+        with self._lock:
+            self._recent.append((latency_ms, fell_back))
+
+    def api_health(self):
+        """(fallback_rate, average_latency_ms) over the recent window, or (None, None)."""
+        with self._lock:
+            recent = list(self._recent)
+        if not recent:
+            return None, None
+        fallback_rate = sum(1 for _, fell_back in recent if fell_back) / len(recent)
+        ok_latencies = [latency for latency, fell_back in recent if not fell_back]
+        average_latency = sum(ok_latencies) / len(ok_latencies) if ok_latencies else None
+        return fallback_rate, average_latency
+
+    def classify(self, message, compound=0.0):
+        """Return (backend, reason) for one message without adding it to the counters."""
+        config = self.config
+        text = message.strip().lower().rstrip("!.?")
+        if not text or text in TRIVIAL_MESSAGES:
+            return "local", "trivial"
+
+        words = len(_WORD_RE.findall(text))
+        strong = abs(compound) >= config.sentiment_threshold
+        if words <= config.max_local_words and not strong:
+            return "local", "short"
+
+        fallback_rate, latency = self.api_health()
+        if fallback_rate is not None and fallback_rate > config.max_fallback_rate:
+            with self._lock:
+                self._since_probe += 1
+                if self._since_probe < config.probe_every:
+                    return "local", "api_unhealthy"
+                self._since_probe = 0
+            return "api", "probe"
+        if (latency is not None and latency > config.latency_budget_ms
+                and words < config.min_api_words and not strong):
+            return "local", "api_slow"
+
+        return "api", "sentiment" if strong else "substantive"
+
+    def route(self, message, compound=0.0):
+        backend, reason = self.classify(message, compound)
+        self.counts[backend] += 1
+        self.reasons[reason] += 1
+        log.debug("Routed to %s", backend, extra={"reason": reason})
+        return backend
+
+    def stats(self):
+        total = sum(self.counts.values())
+        return {
+            "total": total,
+            "local": self.counts["local"],
+            "api": self.counts["api"],
+            "local_share": self.counts["local"] / total if total else 0.0,
+            "reasons": dict(self.reasons),
+        }
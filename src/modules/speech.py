@@ -0,0 +1,180 @@
+# -------------------- speech.py --------------------
+import hashlib
+import itertools
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+
+from modules.log_setup import get_logger
+
+log = get_logger("speech")
+
+try:
+    import pyttsx3
+except ImportError:  # optional dependency
+    pyttsx3 = None
+
+# Lower value = served first; speech always beats background cache filling
+PRIORITY_SPEAK = 0
+PRIORITY_CACHE = 1
+
+
+class SpeechQueue:
+    """
+    Speaks AI replies on a dedicated worker thread so the Tk loop never blocks.
+
+    Only the newest reply matters: queuing a new one drops older pending
+    replies and stops whatever is playing. Phrases in `cacheable_phrases`
+    (the local templates) are synthesized once to `cache_dir`, keyed by
+    text + voice + rate, and afterwards played straight from disk.
+    """
+
+    def __init__(self, cacheable_phrases=(), cache_dir="data/tts_cache", voice=None, rate=None):
+        self.cache_dir = cache_dir
+        self.voice = voice
+        self.rate = rate
+        self.cacheable_phrases = set(cacheable_phrases)
+        self.available = pyttsx3 is not None
+        if not self.available:
+            log.warning("pyttsx3 not installed. Spoken replies are disabled.")
+
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._player = None
+        self._engine = None
+        self._speaking = False
+        self._stop_requested = threading.Event()
+        self._thread = None
+        self.stats = {"spoken": 0, "cache_hits": 0, "synthesized": 0, "skipped": 0}
+
+    # ---------- PUBLIC ----------
+    def start(self):
+        if self.available and self._thread is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="speech-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def speak(self, text):
+        """Queue a reply, superseding anything not yet spoken."""
+        if not self.available or not text:
+            return
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        self.stop_current()
+        self._queue.put((PRIORITY_SPEAK, next(self._order), "speak", text, generation))
+
+    def warm_cache(self, phrases=None):
+        """Synthesize cacheable phrases in the background when the worker is idle."""
+        if not self.available:
+            return
+        for text in sorted(phrases or self.cacheable_phrases):
+            self._queue.put((PRIORITY_CACHE, next(self._order), "cache", text, None))
+
+    def stop_current(self):
+        """Interrupt the utterance that is currently playing, if any."""
+        player = self._player
+        if player is not None:
+            try:
+                player.terminate()
+            except Exception:
+                pass
+        if self._speaking:
+            # The engine belongs to the worker; it stops itself at the next word
+            self._stop_requested.set()
+        if sys.platform == "win32" and self._player is None:
+            try:
+                import winsound
+                winsound.PlaySound(None, 0)
+            except Exception:
+                pass
+
+    def shutdown(self):
+        self.stop_current()
+        self._queue.put((PRIORITY_SPEAK, next(self._order), "quit", None, None))
+
+    def cache_path(self, text):
+        key = f"{self.voice}|{self.rate}|{text}".encode("utf-8")
+        return os.path.join(self.cache_dir, hashlib.sha1(key).hexdigest() + ".wav")
+
+    # ---------- WORKER ----------
+    def _run(self):
+        # pyttsx3 engines must be created and used on a single thread
+        self._engine = pyttsx3.init()
+        if self.voice:
+            self._engine.setProperty("voice", self.voice)
+        if self.rate:
+            self._engine.setProperty("rate", self.rate)
+        self._engine.connect("started-word", self._on_word)
+
+        while True:
+            _, _, kind, text, generation = self._queue.get()
+            if kind == "quit":
+                return
+            try:
+                if kind == "speak":
+                    if generation != self._generation:
+                        self.stats["skipped"] += 1
+                        continue
+                    self._speak_now(text)
+                elif kind == "cache":
+                    self._synthesize(text)
+            except Exception as e:
+                log.error("%s failed: %s", kind, e)
+
+    def _speak_now(self, text):
+        path = self.cache_path(text)
+        if os.path.exists(path) and self._play_file(path):
+            self.stats["cache_hits"] += 1
+        else:
+            # Speak immediately; caching happens later, off the critical path
+            self._stop_requested.clear()
+            self._speaking = True
+            try:
+                self._engine.say(text)
+                self._engine.runAndWait()
+            finally:
+                self._speaking = False
+            if text in self.cacheable_phrases:
+                self._queue.put((PRIORITY_CACHE, next(self._order), "cache", text, None))
+        self.stats["spoken"] += 1
+
+    def _on_word(self, name, location, length):
+        # Runs on the worker inside runAndWait(), so stopping here stays on one thread
+        if self._speaking and self._stop_requested.is_set():
+            self._engine.stop()
+
+    def _synthesize(self, text):
+        path = self.cache_path(text)
+        if os.path.exists(path):
+            return
+        tmp_path = path + ".part"
+        self._engine.save_to_file(text, tmp_path)
+        self._engine.runAndWait()
+        if os.path.exists(tmp_path) and os.path.getsize(tmp_path) > 0:
+            os.replace(tmp_path, path)
+            self.stats["synthesized"] += 1
+
+    def _play_file(self, path):
+        """Play a cached file; returns False if no player is available."""
+        if sys.platform == "win32":
+            import winsound
+            winsound.PlaySound(path, winsound.SND_FILENAME)
+            return True
+
+        for player in ("afplay", "paplay", "aplay"):
+            if shutil.which(player):
+                self._player = subprocess.Popen([player, path], stdout=subprocess.DEVNULL,
+                                                stderr=subprocess.DEVNULL)
+                try:
+                    self._player.wait()
+                finally:
+                    self._player = None
+                return True
+        return False
@@ -0,0 +1,73 @@
+# -------------------- tone_strategies.py --------------------
+import random
+from collections import Counter
+
+# Fixed map used by the app's "Auto" tone mode
+MOOD_TO_TONE = {
+    "happy": "Balanced",
+    "sad": "Empathetic",
+    "neutral": "Blunt",
+    "angry": "Blunt",
+    "stressed": "Empathetic"
+}
+
+TONES = ("Blunt", "Empathetic", "Balanced")
+
+
+def auto_tone(mood):
+    """Tone picked by Auto mode for a detected mood."""
+    return MOOD_TO_TONE.get(mood, "Balanced")
+
+
+class ToneStrategy:
+    """
+    Picks a tone for each exchange. Strategies are replayed in history order,
+    so `observe` is called with each feedback entry after it has been scored.
+    """
+    name = "base"
+
+    def __init__(self, liked_tone_counts=None, seed=None):
+        self.liked = Counter()
+        for tone, count in (liked_tone_counts or {}).items():
+            if count:
+                self.liked[tone] += count
+        self.rng = random.Random(seed)
+
+    def choose(self, mood):
+        raise NotImplementedError
+
+    def observe(self, feedback, tone_used):
+        if feedback == "like" and tone_used:
+            self.liked[tone_used] += 1
+
+
+class MoodMapStrategy(ToneStrategy):
+    """AICoachCompanion's Auto mode: fixed mood → tone map."""
+    name = "mood_map"
+
+    def choose(self, mood):
+        return auto_tone(mood)
+
+
+class PreferenceLearnerStrategy(ToneStrategy):
+    """PreferenceLearner.recommend_tone: the most liked tone so far."""
+    name = "preference_learner"
+
+    def choose(self, mood):
+        if self.liked:
+            return self.liked.most_common(1)[0][0]
+        return "neutral"
+
+
+class WeightedTemplateStrategy(ToneStrategy):
+    """Samples a tone weighted by past likes (+1 smoothing), like the local templates."""
+    name = "weighted_templates"
+
+    def choose(self, mood):
+        weights = [self.liked.get(tone, 0) + 1 for tone in TONES]
+        return self.rng.choices(TONES, weights)[0]
+
+
+STRATEGIES = {
+    cls.name: cls for cls in (MoodMapStrategy, PreferenceLearnerStrategy, WeightedTemplateStrategy)
+}
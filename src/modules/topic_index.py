@@ -0,0 +1,235 @@
+# -------------------- topic_index.py --------------------
+import json
+import queue
+import re
+import threading
+from collections import Counter
+from datetime import date
+
+from modules.analytics_query import to_seconds
+from modules.file_lock import atomic_write
+from modules.json_stream import JsonEntryStream, Snapshot, open_snapshot
+from modules.log_setup import get_logger
+
+log = get_logger("topics")
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being
+below between both but by can could did do does doing done down during each even ever every feel
+feeling felt few for from get gets getting go goes going gone got had has have having he her here
+hers him his how i if in into is it its just know like lot make me might more most much must my
+need no nor not now of off on once one only or other our out over own really right same say see
+she should so some still such sure take than that the their them then there these they thing
+things think this those through to too today up very want was way we well were what when where
+which while who why will with would yeah yes yet you your
+""".split())
+
+_WORD_RE = re.compile(r"[a-z][a-z'-]+")
+
+
+def keywords(text):
+    """Content words of `text`: lower-cased, at least 3 letters, no stopwords or contractions."""
+    return [w.strip("-") for w in _WORD_RE.findall(text.lower())
+            if len(w) >= 3 and w not in STOPWORDS and "'" not in w]
+
+
+def noun_phrase_extractor():
+    """
+    TextBlob's noun-phrase extractor, or None when TextBlob or the NLTK
+    corpora it needs are missing (topics then come from keywords only).
+    """
+    try:
+        from textblob import TextBlob
+        TextBlob("warm up the phrase extractor").noun_phrases
+    except Exception as e:
+        log.info("Noun phrases unavailable, using keywords only: %s", e)
+        return None
+    return lambda text: TextBlob(text).noun_phrases
+
+
+def extract_topics(text, noun_phrases=None):
+    """
+    Distinct topics of one message: noun phrases (if an extractor is given)
+    followed by keywords not already part of a phrase.
+    """
+    if not text:
+        return []
+    phrases = [p.lower() for p in noun_phrases(text)] if noun_phrases else []
+    covered = {word for phrase in phrases for word in phrase.split()}
+    return list(dict.fromkeys(phrases + [w for w in keywords(text) if w not in covered]))
+
+
+class TopicIndex:
+    """
+    Per-day topic counts of logged user messages.
+
+    Built incrementally: `entries` is how many memory entries (one per
+    logged message) have been folded in, so only entries logged after that
+    are ever processed.
+    `totals` keeps the all-time counts, so the overall top topics are a
+    single most_common() call however long the history is.
+    """
+
+    VERSION = 2
+
+    def __init__(self):
+        self.days = {}          # ordinal → Counter(topic → n)
+        self.totals = Counter()
+        self.entries = 0
+
+    def add(self, ts, topics):
+        self.entries += 1
+        if ts is None or not topics:
+            return
+        self.days.setdefault(ts // 86400, Counter()).update(topics)
+        self.totals.update(topics)
+
+    def _days_in(self, start, end):
+        start_day = None if start is None else to_seconds(start) // 86400
+        end_day = None if end is None else (to_seconds(end) - 1) // 86400
+        return [ordinal for ordinal in sorted(self.days)
+                if (start_day is None or ordinal >= start_day) and (end_day is None or ordinal <= end_day)]
+
+    def top(self, n=5, start=None, end=None):
+        """[(topic, count)] most frequent first, over [start, end) (None = open)."""
+        if start is None and end is None:
+            return self.totals.most_common(n)
+        counts = Counter()
+        for ordinal in self._days_in(start, end):
+            counts.update(self.days[ordinal])
+        return counts.most_common(n)
+
+    def series(self, topics, start=None, end=None):
+        """(dates, {topic: [count per date]}) for days with any topic in [start, end)."""
+        ordinals = self._days_in(start, end)
+        return ([date.fromordinal(o) for o in ordinals],
+                {topic: [self.days[o].get(topic, 0) for o in ordinals] for topic in topics})
+
+    def to_dict(self):
+        return {
+            "version": self.VERSION,
+            "entries": self.entries,
+            "days": {date.fromordinal(k).isoformat(): dict(v) for k, v in self.days.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        if data.get("version") != cls.VERSION:
+            return index
+        index.entries = data.get("entries", 0)
+        index.days = {date.fromisoformat(k).toordinal(): Counter(v) for k, v in data.get("days", {}).items()}
+        for counts in index.days.values():
+            index.totals.update(counts)
+        return index
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except FileNotFoundError:
+            return cls()
+        except (OSError, ValueError) as e:
+            log.warning("Could not read %s, starting a new topic index: %s", path, e)
+            return cls()
+
+    def save(self, path):
+        with atomic_write(path) as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+
+class TopicIndexer:
+    """
+    Background pipeline feeding the TopicIndex.
+
+    submit() queues one newly logged message; a single worker thread
+    extracts its topics (TextBlob is slow to load and to run) and saves the
+    index whenever the queue drains or every `save_every` messages.
+    """
+
+    def __init__(self, path="data/topic_index.json", save_every=50):
+        self.path = path
+        self.save_every = save_every
+        self.index = TopicIndex.load(path)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="topic-indexer", daemon=True)
+        self._thread.start()
+
+    def submit(self, ts, message):
+        self._queue.put((ts, message))
+
+    def catch_up(self, memory_file="data/memory.json"):
+        """
+        Queue messages logged since the index was last saved. Call it once,
+        before the first submit(): the memory store is snapshotted now and
+        read on the worker, so messages submitted later aren't counted twice.
+        """
+        try:
+            self._queue.put(open_snapshot(memory_file))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning("Could not read %s: %s", memory_file, e)
+
+    def _backlog(self, snapshot):
+        """
+        (ts, message) of the snapshot's entries not yet in the index. If the
+        store has fewer entries than the index covers, it was replaced and the
+        index starts over.
+        """
+        with snapshot:
+            try:
+                backlog = self._read_from(snapshot, self.index.entries)
+                if backlog is None:
+                    log.warning("Memory store is shorter than the topic index; rebuilding it")
+                    self.index = TopicIndex()
+                    backlog = self._read_from(snapshot, 0)
+            except ValueError as e:
+                log.warning("Could not read %s: %s", snapshot.path, e)
+                return []
+        return backlog
+
+    @staticmethod
+    def _read_from(snapshot, done):
+        backlog = []
+        count = 0
+        for entry in JsonEntryStream(snapshot.path).read(snapshot):
+            if count >= done and isinstance(entry, dict):
+                backlog.append((to_seconds(entry.get("timestamp")), entry.get("input")))
+            count += 1
+        return backlog if count >= done else None
+
+    def _run(self):
+        noun_phrases = None
+        unsaved = 0
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            # The catch-up snapshot is read (and closed) before the extractor loads
+            backlog = self._backlog(item) if isinstance(item, Snapshot) else [item]
+            if noun_phrases is None:
+                noun_phrases = noun_phrase_extractor() or False
+            for ts, message in backlog:
+                self.index.add(ts, extract_topics(message, noun_phrases or None))
+                unsaved += 1
+                if unsaved >= self.save_every:
+                    self._save()
+                    unsaved = 0
+            if unsaved and self._queue.empty():
+                self._save()
+                unsaved = 0
+        if unsaved:
+            self._save()
+
+    def _save(self):
+        try:
+            self.index.save(self.path)
+        except OSError as e:
+            log.error("Could not save topic index: %s", e)
+
+    def close(self, timeout=10):
+        """Finish queued messages and save."""
+        self._queue.put(None)
+        self._thread.join(timeout)
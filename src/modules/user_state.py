@@ -0,0 +1,221 @@
+# -------------------- user_state.py --------------------
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+from modules.log_setup import get_logger
+
+log = get_logger("user_state")
+
+DEFAULT_TONES = ("Blunt", "Empathetic", "Balanced")
+DEFAULT_MOODS = ("positive", "negative", "neutral")
+
+
+def normalize_mood_key(mood):
+    """Map detected moods (VADER or TextBlob style) onto the template keys."""
+    if mood in ("positive", "negative", "neutral"):
+        return mood
+    if mood in ("happy",):
+        return "positive"
+    if mood in ("sad",):
+        return "negative"
+    return None
+
+
+def aggregate_likes(entries, liked_tone_counts=None, liked_mood_counts=None):
+    """
+    Count liked tones and moods over an iterable of feedback entries.
+    Existing count dicts may be passed in to be updated in place.
+    """
+    if liked_tone_counts is None:
+        liked_tone_counts = {tone: 0 for tone in DEFAULT_TONES}
+    if liked_mood_counts is None:
+        liked_mood_counts = {mood: 0 for mood in DEFAULT_MOODS}
+
+    for entry in entries:
+        try:
+            if entry.get("feedback") != "like":
+                continue
+            tone = entry.get("tone_used")
+            if tone in liked_tone_counts:
+                liked_tone_counts[tone] += 1
+            mood_key = normalize_mood_key(entry.get("detected_mood"))
+            if mood_key:
+                liked_mood_counts[mood_key] += 1
+        except Exception:
+            # Skip malformed entries
+            continue
+
+    return liked_tone_counts, liked_mood_counts
+
+
+class UserState:
+    """Preference aggregates and short-term context for a single user."""
+
+    __slots__ = ("user_id", "liked_tone_counts", "liked_mood_counts",
+                 "disliked_tone_counts", "context_window", "dirty")
+
+    def __init__(self, user_id, max_context=5):
+        self.user_id = user_id
+        self.liked_tone_counts = {tone: 0 for tone in DEFAULT_TONES}
+        self.liked_mood_counts = {mood: 0 for mood in DEFAULT_MOODS}
+        self.disliked_tone_counts = {}
+        self.context_window = deque(maxlen=max_context)
+        self.dirty = False
+
+    def record_feedback(self, feedback, tone_used, detected_mood):
+        """Fold one like/dislike into the aggregates."""
+        if feedback == "like":
+            if tone_used in self.liked_tone_counts:
+                self.liked_tone_counts[tone_used] += 1
+            mood_key = normalize_mood_key(detected_mood)
+            if mood_key:
+                self.liked_mood_counts[mood_key] += 1
+        elif feedback == "dislike" and tone_used:
+            self.disliked_tone_counts[tone_used] = self.disliked_tone_counts.get(tone_used, 0) + 1
+        self.dirty = True
+
+    def push_context(self, user_message, ai_response):
+        """Remember one exchange; the oldest drops off once the window is full."""
+        self.context_window.append({"user": user_message, "ai": ai_response})
+        self.dirty = True
+
+    def context_text(self):
+        """Render the context window the same way AICoachCompanion does."""
+        return "\n".join(
+            [f"You: {msg['user']} | Coach: {msg['ai']}" for msg in self.context_window]
+        )
+
+    def recommend_tone(self):
+        """Most liked tone for this user, mirroring PreferenceLearner.recommend_tone."""
+        best_tone, best_count = None, 0
+        for tone, count in self.liked_tone_counts.items():
+            if count > best_count:
+                best_tone, best_count = tone, count
+        return best_tone or "neutral"
+
+    def to_dict(self):
+        return {
+            "user_id": self.user_id,
+            "liked_tone_counts": self.liked_tone_counts,
+            "liked_mood_counts": self.liked_mood_counts,
+            "disliked_tone_counts": self.disliked_tone_counts,
+            "context_window": list(self.context_window),
+        }
+
+    @classmethod
+    def from_dict(cls, data, max_context=5):
+        state = cls(data.get("user_id"), max_context=max_context)
+        state.liked_tone_counts.update(data.get("liked_tone_counts", {}))
+        state.liked_mood_counts.update(data.get("liked_mood_counts", {}))
+        state.disliked_tone_counts.update(data.get("disliked_tone_counts", {}))
+        state.context_window.extend(data.get("context_window", []))
+        return state
+
+
+class UserStateManager:
+    """
+    User-keyed state with lazy loading and a bounded LRU.
+
+    Each user has a small state file under `base_dir`; a user without one
+    starts with empty aggregates. Only `capacity` users are kept in memory;
+    the least recently used one is written back (if changed) and dropped.
+    """
+
+    def __init__(self, base_dir="data/users", capacity=4096, max_context=5):
+        self.base_dir = base_dir
+        self.capacity = capacity
+        self.max_context = max_context
+        self._states = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ---------- PATHS ----------
+    def _user_dir(self, user_id):
+        # Named by the id's full hash, so distinct ids never share a directory
+        # whatever characters they contain; sharded by its first two hex
+        # digits so 100k users don't land in one directory
+        digest = hashlib.md5(str(user_id).encode("utf-8")).hexdigest()
+        return os.path.join(self.base_dir, digest[:2], digest)
+
+    def state_path(self, user_id):
+        return os.path.join(self._user_dir(user_id), "state.json")
+
+    # ---------- LOAD / SAVE ----------
+    def _load(self, user_id):
+        path = self.state_path(user_id)
+        try:
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    state = UserState.from_dict(json.load(f), max_context=self.max_context)
+                    state.user_id = user_id
+                    return state
+        except Exception as e:
+            log.warning("Could not read state for %s: %s", user_id, e)
+        return UserState(user_id, max_context=self.max_context)
+
+    def _write_back(self, state):
+        path = self.state_path(state.user_id)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state.to_dict(), f)
+            os.replace(tmp_path, path)
+            state.dirty = False
+        except Exception as e:
+            log.error("Write-back failed for %s: %s", state.user_id, e)
+
+    # ---------- LRU ----------
+    def get(self, user_id):
+        """Return the state for `user_id`, loading it on first use."""
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is not None:
+                self._states.move_to_end(user_id)
+                self.hits += 1
+                return state
+
+            self.misses += 1
+            state = self._load(user_id)
+            self._states[user_id] = state
+            while len(self._states) > self.capacity:
+                _, evicted = self._states.popitem(last=False)
+                self.evictions += 1
+                if evicted.dirty:
+                    self._write_back(evicted)
+            return state
+
+    def record_feedback(self, user_id, feedback, tone_used, detected_mood):
+        with self._lock:
+            self.get(user_id).record_feedback(feedback, tone_used, detected_mood)
+
+    def push_context(self, user_id, user_message, ai_response):
+        with self._lock:
+            self.get(user_id).push_context(user_message, ai_response)
+
+    def flush(self):
+        """Write every changed in-memory state back to disk."""
+        with self._lock:
+            for state in self._states.values():
+                if state.dirty:
+                    self._write_back(state)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "resident": len(self._states),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self):
+        return len(self._states)
+
+    def __contains__(self, user_id):
+        return user_id in self._states
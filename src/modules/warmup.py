@@ -0,0 +1,84 @@
+# -------------------- warmup.py --------------------
+import threading
+import time
+
+from modules.log_setup import get_logger
+
+log = get_logger("warmup")
+
+
+class _Component:
+    __slots__ = ("factory", "ready", "lock", "started", "value", "error", "seconds")
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.started = False
+        self.value = None
+        self.error = None
+        self.seconds = None
+
+
+class Warmup:
+    """
+    Initializes slow components (analyzers, API clients) off the critical path.
+
+    Each registered factory runs once, on its own background thread after
+    start(). Callers use get(name) to wait only for the component they need.
+    If nothing started it yet, get() builds it inline. Warm-up time per
+    component is kept in `timings`.
+    """
+
+    def __init__(self):
+        self._components = {}
+
+    def register(self, name, factory):
+        self._components[name] = _Component(factory)
+
+    def start(self, background=True):
+        for name in self._components:
+            if background:
+                threading.Thread(target=self._build, args=(name,), name=f"warmup-{name}",
+                                 daemon=True).start()
+            else:
+                self._build(name)
+        return self
+
+    def _build(self, name):
+        component = self._components[name]
+        with component.lock:
+            if component.started:
+                return
+            component.started = True
+        start = time.perf_counter()
+        try:
+            component.value = component.factory()
+        except Exception as e:
+            component.error = e
+            log.warning("%s failed: %s", name, e)
+        component.seconds = time.perf_counter() - start
+        log.debug("%s ready", name, extra={"latency_ms": round(component.seconds * 1000, 1)})
+        component.ready.set()
+
+    def get(self, name, timeout=None):
+        """Return the component, waiting for (or running) its warm-up."""
+        component = self._components[name]
+        if not component.started:
+            self._build(name)
+        if not component.ready.wait(timeout):
+            raise TimeoutError(f"{name} is still warming up")
+        if component.error is not None:
+            raise component.error
+        return component.value
+
+    def is_ready(self, name):
+        return self._components[name].ready.is_set()
+
+    def pending(self):
+        return [name for name, c in self._components.items() if not c.ready.is_set()]
+
+    @property
+    def timings(self):
+        """{name: seconds} for every component that has finished warming up."""
+        return {name: c.seconds for name, c in self._components.items() if c.seconds is not None}
@@ -1,106 +1,100 @@
 # response_engine.py
-from textblob import TextBlob
-import random
-import json
-import os
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-from tk_app.preference_learner import PreferenceLearner
-from openai import OpenAI
-from dotenv import load_dotenv
+import time
+from modules.local_generator import LocalGenerator
+from modules.batch_generation import run_batch, normalize_item
+from modules.preference_checkpoint import PreferenceCheckpoint
+from modules.warmup import Warmup
+from modules.reply_metrics import ReplyMetrics
+from modules.routing import Router, RoutingConfig
+from modules.backends import GenerationRequest, LocalTemplateBackend, create_backend
+from modules.log_setup import get_logger
 
+log = get_logger("engine")
 
 
-class ResponseEngine:
-    def __init__(self, mode="api"):
-        self.mode = mode
-        self.analyzer = SentimentIntensityAnalyzer()  # ← Initialize VADER here
-
-         # Load API key and initialize client
-        load_dotenv()
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            print("[WARNING] No OpenAI API key found. Running in local mode.")
-        self.client = OpenAI(api_key=api_key) if api_key else None
-
+# --- Warm-up factories (heavy imports happen here, not at module import) ---
+def _create_analyzer():
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+    return SentimentIntensityAnalyzer()
 
-        # Preference data loaded from user feedback
-        self.user_feedback_path = "data/user_data.json"
-        self.liked_tone_counts, self.liked_mood_counts = self._load_user_preferences()
-        self.preference_learner = PreferenceLearner()
-        print(f"[DotPi] ResponseEngine initialized in {self.mode.upper()} mode.")
 
+def _warm_textblob():
+    # First sentiment call loads the pattern lexicon
+    from textblob import TextBlob
+    TextBlob("warm up").sentiment
+    return TextBlob
 
 
-    def _load_user_preferences(self):
-        """Load user feedback and aggregate likes for tone and mood."""
-        liked_tone_counts = {"Blunt": 0, "Empathetic": 0, "Balanced": 0}
-        liked_mood_counts = {"positive": 0, "negative": 0, "neutral": 0}
-
-        try:
-            if os.path.exists(self.user_feedback_path):
-                with open(self.user_feedback_path, "r") as f:
-                    data = json.load(f)
-                    if isinstance(data, list):
-                        for entry in data:
-                            try:
-                                if entry.get("feedback") == "like":
-                                    tone = entry.get("tone_used")
-                                    mood = entry.get("detected_mood")
-                                    if tone in liked_tone_counts:
-                                        liked_tone_counts[tone] += 1
-                                    # Normalize mood keys to our template keys
-                                    if mood in ("positive", "negative", "neutral"):
-                                        liked_mood_counts[mood] += 1
-                                    elif mood in ("happy",):
-                                        liked_mood_counts["positive"] += 1
-                                    elif mood in ("sad",):
-                                        liked_mood_counts["negative"] += 1
-                            except Exception:
-                                # Skip malformed entries
-                                continue
-        except Exception:
-            # On any error, return zeroed prefs to avoid breaking logic
-            pass
-        #print("Liked tones:", liked_tone_counts)
-        #print("Liked moods:", liked_mood_counts)
-
-
-        return liked_tone_counts, liked_mood_counts
+class ResponseEngine:
+    def __init__(self, mode="api", user_states=None, seed=None, background_warmup=False, metrics=None,
+                 routing=None, local_backend="local", api_backend="openai", backend_options=None,
+                 feedback_file="data/user_data.json", checkpoint_file="data/preference_checkpoint.json"):
+        # "local" and "api" force a backend; "auto" routes each message (see modules/routing.py)
+        self.mode = mode
+        self.router = Router(routing or RoutingConfig.from_file())
+
+        # Optional MetricsLog; every generated reply is recorded there
+        self.metrics = metrics
+
+        # Precompiled template generator (seedable for reproducible output)
+        self.local_generator = LocalGenerator(seed=seed)
+
+        # Reply backends from the registry (modules/backends.py), one per role.
+        # backend_options: {backend name: constructor kwargs}
+        options = {name: dict(kwargs) for name, kwargs in (backend_options or {}).items()}
+        options.setdefault("local", {}).setdefault("generator", self.local_generator)
+        self.local_backend = create_backend(local_backend, **options.get(local_backend, {}))
+        self.api_backend = create_backend(api_backend, **options.get(api_backend, {}))
+
+        # VADER, TextBlob and the backends are built by the warm-up stage.
+        # With background_warmup they load on worker threads and each call
+        # waits only for the component it needs.
+        self.warmup = Warmup()
+        self.warmup.register("vader", _create_analyzer)
+        self.warmup.register("textblob", _warm_textblob)
+        for backend in (self.local_backend, self.api_backend):
+            self.warmup.register(backend.name, backend.ensure_ready)
+        self.warmup.start(background=background_warmup)
+
+        # Preference data from user feedback, restored from a checkpoint
+        # (`checkpoint_file`); only feedback logged since is read.
+        # The counts change in place on refresh, so replies use snapshots of them.
+        self.user_feedback_path = feedback_file
+        self.preferences = PreferenceCheckpoint.open(feedback_file, checkpoint_file)
+        self.liked_tone_counts = self.preferences.liked_tone_counts
+        self.liked_mood_counts = self.preferences.liked_mood_counts
+        self.preference_learner = self.preferences.learner
+
+        # Per-user state for multi-tenant use (None = single-user app)
+        self.user_states = user_states
+        log.info("ResponseEngine initialized in %s mode.", self.mode.upper())
+
+
+
+    @property
+    def analyzer(self):
+        return self.warmup.get("vader")
+
+    @property
+    def client(self):
+        """The API backend's client (None when it has none, e.g. no API key)."""
+        self.warmup.get(self.api_backend.name)
+        return getattr(self.api_backend, "client", None)
 
     def test_openai_connection(self, message="Hello DotPi!"):
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a friendly AI coach."},
-                    {"role": "user", "content": message}
-                ]        )
-            return response.choices[0].message.content
+            return self.api_backend.run(GenerationRequest(message, "Balanced", "neutral"))
         except Exception as e:
             return f"Error: {e}"
 
 
-    def _weighted_choice(self, weights_dict):
-        """Return a key from weights_dict based on weighted random selection."""
-        items = list(weights_dict.items())
-        total = sum(max(w, 0) for _, w in items) or 1
-        r = random.uniform(0, total)
-        upto = 0
-        for key, weight in items:
-            w = max(weight, 0)
-            if upto + w >= r:
-                return key
-            upto += w
-        return items[-1][0]
-
     def detect_mood(self, message):
         """Smarter mood detection using VADER sentiment analysis."""
         try:
             scores = self.analyzer.polarity_scores(message)
             compound = scores["compound"]
 
-            print("Scores:", scores, "Compound:", compound)
-
+            log.debug("Scores: %s", scores, extra={"compound": compound})
 
             if compound >= 0.3:
                 return "positive"
@@ -111,93 +105,114 @@ class ResponseEngine:
         except Exception:
             return "neutral"
 
+    def sentiment_compound(self, message):
+        """VADER compound score (−1…+1); 0.0 if the analyzer is unavailable."""
+        try:
+            return self.analyzer.polarity_scores(message)["compound"]
+        except Exception:
+            return 0.0
+
 
-    def generate_local_response(self, message, tone, mood=None):
+    def generate_local_response(self, message, tone, mood=None, user_state=None):
         """
         Local response generator.
         Accepts mood parameter but will still work if mood is None.
+        If user_state is given, its preference counts are used instead of the global ones
+        (a PreferenceSnapshot works too).
         """
         # If mood wasn't passed, try to detect it (fallback)
         if mood is None:
             mood = self.detect_mood(message)
 
-        # map sentiments to our simple keys
-        if mood in ("positive", "happy", "happy-ish"):
-            base_key = "positive"
-        elif mood in ("negative", "sad"):
-            base_key = "negative"
-        else:
-            base_key = "neutral"
-
-        templates = {
-            "positive": [
-                "That’s great! Keep that energy going.",
-                "I like your attitude — positivity always helps.",
-                "Nice progress — let’s build on that."
-            ],
-            "negative": [
-                "That sounds tough, but let’s figure out a way forward.",
-                "I get it — sometimes things just don’t feel right. What do you think caused it?",
-                "I hear you. We'll take a small step together."
-            ],
-            "neutral": [
-                "Hmm, tell me more about that.",
-                "Alright, let’s break this down together.",
-                "Okay — what's the most useful next step?"
-            ]
-        }
-
-        tone_effect = {
-            "Blunt": "Here’s my honest take: ",
-            "Empathetic": "I understand how you feel. ",
-            "Balanced": ""
-        }
-
-        # --- Weighted suggestion logic based on liked tone/mood ---
-        # Start with small base weights to keep behavior stable
-        weights = {"positive": 1, "negative": 1, "neutral": 1}
-
-        # Preserve existing behavior by biasing toward detected/base_key
-        weights[base_key] += 3
-
-        # Boost if user liked this mood previously
-        for mood_key, count in self.liked_mood_counts.items():
-            if count > 0:
-                weights[mood_key] += 10
-
-        # Boost toward the detected/base_key if the current tone is among liked tones
-        # (tone is fixed by caller; we only bias mood key selection)
-        if tone in self.liked_tone_counts and self.liked_tone_counts[tone] > 0:
-            weights[base_key] += 10
-
-        # Choose the mood key using weighted random selection
-        chosen_key = self._weighted_choice(weights)
-
-        prefix = tone_effect.get(tone, "")
-        choice = random.choice(templates.get(chosen_key, templates["neutral"]))
-        return prefix + choice
-
-    def generate_response(self, message, tone, mood=None):
-        """Main function — accepts mood and switches between local or API."""
-        if self.mode == "local":
+        preferences = user_state or self.preferences.snapshot()
+        liked_tone_counts = preferences.liked_tone_counts
+        liked_mood_counts = preferences.liked_mood_counts
+
+        return self.local_backend.run(GenerationRequest(message, tone, mood, liked_tone_counts, liked_mood_counts))
+
+    def generate_local_responses(self, batch, user_state=None):
+        """
+        Batch version of generate_local_response.
+        `batch` is a list of (message, tone) or (message, tone, mood) tuples.
+        """
+        items = []
+        for item in batch:
+            message, tone = item[0], item[1]
+            mood = item[2] if len(item) > 2 else None
+            if mood is None:
+                mood = self.detect_mood(message)
+            items.append((tone, mood))
+
+        preferences = user_state or self.preferences.snapshot()
+        liked_tone_counts = preferences.liked_tone_counts
+        liked_mood_counts = preferences.liked_mood_counts
+        if isinstance(self.local_backend, LocalTemplateBackend):
+            # Weighted template choice in one pass (see modules/local_generator.py)
+            return self.local_backend.generator.generate_batch(items, liked_tone_counts, liked_mood_counts)
+        return [self.local_backend.run(GenerationRequest(item[0], tone, mood, liked_tone_counts, liked_mood_counts))
+                for item, (tone, mood) in zip(batch, items)]
+
+    def generate_response(self, message, tone, mood=None, user_id=None, context=None, preferences=None):
+        """
+        Main function — accepts mood and switches between local or API.
+        With a user_id (and user_states configured) the user's own preferences
+        and context window are used, and the exchange is added to that window.
+        `context` is caller-kept conversation text to prepend to the prompt.
+        `preferences` is a PreferenceSnapshot to use instead of a fresh one.
+        In "auto" mode the router picks the backend from `message` alone.
+        """
+        user_state = self._get_user_state(user_id)
+        prompt = message
+        if user_state is not None and user_state.context_window:
+            context = user_state.context_text()
+        # One consistent view of the preferences for the whole reply
+        prefs = user_state or preferences or self.preferences.snapshot()
+        if context:
+            prompt = f"{context}\nYou: {message}"
+
+        backend = self.mode
+        if backend == "auto":
+            # Classify the new message only, not the context prepended to it
+            backend = self.router.route(message, self.sentiment_compound(message))
+
+        if backend == "local":
             # Get preferred tone from learner
-            preferred_tone = self.preference_learner.recommend_tone()
+            preferred_tone = self._recommend_tone(prefs)
             #print(f"[DEBUG] Tone in use: {preferred_tone or tone}")  # Debug confirmation
             
             # Generate response with preferred tone if available
-            return self.generate_local_response(message, preferred_tone or tone, mood)
+            start = time.perf_counter()
+            response = self.generate_local_response(prompt, preferred_tone or tone, mood, user_state=prefs)
+            self._record_metrics("local", start, prompt, response)
         else:
-            return self.generate_ai_response(message, tone, mood)
+            response = self.generate_ai_response(prompt, tone, mood, user_state=prefs)
+
+        if user_state is not None:
+            self.user_states.push_context(user_id, message, response)
+        return response
+
+    def _get_user_state(self, user_id):
+        if user_id is None or self.user_states is None:
+            return None
+        return self.user_states.get(user_id)
+
+    def _recommend_tone(self, user_state=None):
+        return (user_state or self.preferences.snapshot()).recommend_tone()
+
+    def record_feedback(self, user_id, feedback, tone_used, detected_mood):
+        """Update one user's preference aggregates after a like/dislike."""
+        if self.user_states is not None:
+            self.user_states.record_feedback(user_id, feedback, tone_used, detected_mood)
 
 
 
     # --- Refresh user preferences ---
     def refresh_user_preferences(self):
-        """Reload liked tone and mood counts from user feedback file."""
-        self.liked_tone_counts, self.liked_mood_counts = self._load_user_preferences()
+        """Fold feedback logged since the last refresh into the preference counts."""
+        self.preferences.catch_up()
 
 
-    def generate_ai_response(self, message, tone, mood=None):
+    def generate_ai_response(self, message, tone, mood=None, user_state=None):
         """
         Generate AI-based response using OpenAI API,
         enhanced with DotPi's local tone + mood logic.
@@ -208,38 +223,75 @@ class ResponseEngine:
             mood = self.detect_mood(message)
 
         # 2️⃣ Get preferred tone (learned locally)
-        preferred_tone = self.preference_learner.recommend_tone() or tone
-
-        # 3️⃣ Build system prompt with mood + tone context
-        system_prompt = (
-            "You are DotPi — an intelligent, emotionally-aware AI coach. "
-            "Your goal is to respond to the user in a tone that fits both their detected mood "
-            "and their learned preference tone. "
-            "Be concise, human-like, and emotionally attuned. "
-            f"Detected mood: {mood}. "
-            f"Preferred tone: {preferred_tone}. "
-            "If user sounds down, be supportive. If positive, encourage them. "
-            "Keep it conversational, no long paragraphs. "
-        )
+        preferred_tone = self._recommend_tone(user_state) or tone
 
+        start = time.perf_counter()
         try:
-            # 4️⃣ Generate GPT-based response
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": message}
-                ],
-                temperature=0.8
-            )
-
-            ai_message = response.choices[0].message.content.strip()
-            print(f"[DotPi][AI Mode] GPT response: {ai_message}")
+            ai_message = self.request_ai_response(message, preferred_tone, mood)
+            log.debug("GPT response: %s", ai_message, extra={
+                "backend": "api", "tone": preferred_tone, "mood": mood,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1)})
+            self.router.observe((time.perf_counter() - start) * 1000, False)
+            self._record_metrics("api", start, message, ai_message)
             return ai_message
 
         except Exception as e:
             # 5️⃣ Safe fallback to local mode
-            print(f"[DotPi] API error → Falling back to local mode: {e}")
-            return self.generate_local_response(message, preferred_tone, mood)
+            log.warning("API error → Falling back to local mode: %s", e, extra={
+                "backend": "api", "tone": preferred_tone, "mood": mood,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1)})
+            self.router.observe((time.perf_counter() - start) * 1000, True)
+            response = self.generate_local_response(message, preferred_tone, mood, user_state=user_state)
+            self._record_metrics("local", start, message, response, fallback_reason=type(e).__name__)
+            return response
+
+    def _record_metrics(self, backend, start, prompt, response, fallback_reason=None):
+        if self.metrics is None:
+            return
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.metrics.record(ReplyMetrics(backend, latency_ms, len(prompt), len(response or ""),
+                                         fallback_reason))
+
+    def request_ai_response(self, message, preferred_tone, mood):
+        """Single round trip to the API backend. Raises on any API error (no fallback)."""
+        return self.api_backend.run(GenerationRequest(message, preferred_tone, mood))
+
+    # --- Batch generation ---
+    def generate_responses(self, items, concurrency=8, rate_limit=None, progress=None):
+        """
+        Generate replies for many queued messages concurrently.
+
+        items: message strings, (message, tone[, mood]) tuples or
+               {"message", "tone", "mood"} dicts.
+        concurrency: max API calls in flight.
+        rate_limit: max API calls started per second (None = unlimited).
+        progress: optional callback(done, total).
 
-    
+        Returns a list of BatchResult in input order; items whose API call
+        failed carry fallback=True and a local template reply.
+        """
+        items = list(items)
+        # Workers share one copy of the preferences, taken before the batch starts
+        prefs = self.preferences.snapshot()
+
+        def generate(message, tone, mood):
+            if mood is None:
+                mood = self.detect_mood(message)
+            preferred_tone = prefs.recommend_tone() or tone
+            if self.mode == "local":
+                return self.generate_local_response(message, preferred_tone, mood, user_state=prefs)
+            return self.request_ai_response(message, preferred_tone, mood)
+
+        def fallback(message, tone, mood):
+            return self.generate_local_response(message, prefs.recommend_tone() or tone, mood, user_state=prefs)
+
+        results = run_batch(generate, fallback, items, concurrency=concurrency,
+                            rate_limit=rate_limit, progress=progress)
+        if self.metrics is not None:
+            backend = "local" if self.mode == "local" else "api"
+            for item, result in zip(items, results):
+                self.metrics.record(ReplyMetrics(
+                    "local" if result.fallback else backend, result.latency * 1000,
+                    len(normalize_item(item)[0] or ""), len(result.response or ""),
+                    fallback_reason=result.error_type if result.fallback else None))
+        return results
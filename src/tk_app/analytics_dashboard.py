@@ -1,9 +1,11 @@
-import json
 import tkinter as tk
 from tkinter import ttk, messagebox
 from collections import Counter
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from modules.background import BackgroundRunner, FileWatcher
+from modules.analytics_query import TimeIndex, RANGE_PRESETS, preset_range
+from modules.records import load_feedback_records
 
 class AnalyticsDashboard(tk.Toplevel):
     def __init__(self, master=None, feedback_file="data/user_data.json"):
@@ -15,22 +17,52 @@ class AnalyticsDashboard(tk.Toplevel):
         ttk.Label(self, text="AI Codes Companion — Analytics Dashboard",
                   font=("Helvetica", 14, "bold")).pack(pady=10)
 
-        self.summary_label = ttk.Label(self, text="", wraplength=600, justify="center")
+        range_bar = ttk.Frame(self)
+        range_bar.pack()
+        ttk.Label(range_bar, text="Range:").pack(side="left")
+        self.range_var = tk.StringVar(value=RANGE_PRESETS[0])
+        range_picker = ttk.Combobox(range_bar, textvariable=self.range_var, values=RANGE_PRESETS,
+                                    state="readonly", width=14)
+        range_picker.pack(side="left", padx=(6, 0))
+        range_picker.bind("<<ComboboxSelected>>", lambda e: self.update_dashboard())
+
+        self.summary_label = ttk.Label(self, text="Loading analytics…", wraplength=600, justify="center")
         self.summary_label.pack(pady=10)
 
         self.canvas_frame = ttk.Frame(self)
         self.canvas_frame.pack(fill="both", expand=True)
+        self.figure = None
+        self.canvas = None
+        self.tone_bars = None
+        self.mood_bars = None
 
         ttk.Button(self, text="Refresh", command=self.update_dashboard).pack(pady=5)
         ttk.Button(self, text="Close", command=self.destroy).pack(pady=5)
 
+        # Feedback is loaded and summarized off the UI thread
+        self.runner = BackgroundRunner(self)
+        self.loading = False
+        self.reload_pending = False
+        self.index = None
+        self.watcher = FileWatcher(self, self.feedback_file, self.on_file_changed).start()
+        self.bind("<Destroy>", self.on_destroy, add="+")
+
+        self.update_dashboard()
+
+    def on_destroy(self, event):
+        if event.widget is self:
+            self.watcher.stop()
+            self.runner.close()
+
+    def on_file_changed(self):
+        # Rebuild the timestamp index on the next pass
+        self.index = None
         self.update_dashboard()
 
     def load_feedback(self):
         try:
-            with open(self.feedback_file, "r") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
+            return load_feedback_records(self.feedback_file)
+        except (OSError, ValueError):
             return []
 
     def summarize_data(self, data):
@@ -65,26 +97,63 @@ class AnalyticsDashboard(tk.Toplevel):
         tone_counts = Counter(tones)
         mood_counts = Counter(moods)
 
-        fig = Figure(figsize=(6, 3))
-        ax1 = fig.add_subplot(121)
-        ax2 = fig.add_subplot(122)
-
-        ax1.bar(tone_counts.keys(), tone_counts.values())
-        ax1.set_title("Tone Feedback")
-        ax2.bar(mood_counts.keys(), mood_counts.values(), color="orange")
-        ax2.set_title("Mood Distribution")
-
-        for widget in self.canvas_frame.winfo_children():
-            widget.destroy()
-
-        canvas = FigureCanvasTkAgg(fig, master=self.canvas_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill="both", expand=True)
+        # One figure/canvas for the lifetime of the window
+        if self.figure is None:
+            self.figure = Figure(figsize=(6, 3))
+            self.ax1 = self.figure.add_subplot(121)
+            self.ax2 = self.figure.add_subplot(122)
+            self.canvas = FigureCanvasTkAgg(self.figure, master=self.canvas_frame)
+            self.canvas.get_tk_widget().pack(fill="both", expand=True)
+
+        self.tone_bars = self._update_bars(self.ax1, self.tone_bars, tone_counts, "Tone Feedback")
+        self.mood_bars = self._update_bars(self.ax2, self.mood_bars, mood_counts, "Mood Distribution",
+                                           color="orange")
+        self.canvas.draw_idle()
+
+    def _update_bars(self, ax, bars, counts, title, color=None):
+        """Set bar heights in place; only rebuild when the categories change."""
+        labels = list(counts.keys())
+        if bars is not None and bars[0] == labels:
+            for rect, value in zip(bars[1], counts.values()):
+                rect.set_height(value)
+            ax.relim()
+            ax.autoscale_view()
+            return bars
+
+        ax.clear()
+        container = ax.bar(labels, list(counts.values()), color=color)
+        ax.set_title(title)
+        return labels, list(container)
 
     def update_dashboard(self):
-        data = self.load_feedback()
-        self.summary_label.config(text=self.summarize_data(data))
+        if self.loading:
+            # Reload once more after the current pass finishes
+            self.reload_pending = True
+            return
+        self.loading = True
+
+        start, end = preset_range(self.range_var.get())
+
+        def compute():
+            if self.index is None:
+                self.index = TimeIndex(self.load_feedback())
+            data = self.index.range(start, end)
+            return data, self.summarize_data(data)
+
+        self.runner.submit(compute, self.on_data_loaded, self.on_load_error)
+
+    def on_data_loaded(self, result):
+        data, summary = result
+        self.loading = False
+        self.summary_label.config(text=summary)
         self.draw_chart(data)
+        if self.reload_pending:
+            self.reload_pending = False
+            self.update_dashboard()
+
+    def on_load_error(self, error):
+        self.loading = False
+        self.summary_label.config(text=f"Could not load feedback: {error}")
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -1,42 +1,52 @@
-import json
 from collections import Counter
+from modules.json_stream import iter_json_entries
 
 class PreferenceLearner:
-    def __init__(self, feedback_file="data/user_data.json"):
+    def __init__(self, feedback_file="data/user_data.json", load=True):
         self.feedback_file = feedback_file
-        self.data = self._load_data()
+        self.entry_count = 0
+        self.liked_tones = Counter()
+        self.disliked_tones = Counter()
+        self.moods = Counter()
+        # load=False starts empty, for callers that restore the counters themselves
+        if load:
+            self._load_data()
 
     def _load_data(self):
+        """Stream the feedback file into counters; entries are never held in memory."""
         try:
-            with open(self.feedback_file, "r") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+            for entry in iter_json_entries(self.feedback_file):
+                self.observe(entry)
+        except (OSError, ValueError):
+            self.entry_count = 0
+            self.liked_tones.clear()
+            self.disliked_tones.clear()
+            self.moods.clear()
 
-    def analyze_preferences(self):
-        if not self.data:
-            return {"status": "No feedback yet."}
-
-        liked_tones = []
-        disliked_tones = []
-        moods = []
+    def observe(self, entry):
+        """Fold one feedback entry into the counters."""
+        if not isinstance(entry, dict):
+            return
+        self.entry_count += 1
+        tone = entry.get("tone_used")
+        mood = entry.get("detected_mood")
+        feedback = entry.get("feedback")
 
-        for entry in self.data:
-            tone = entry.get("tone_used")
-            mood = entry.get("detected_mood")
-            feedback = entry.get("feedback")
+        if feedback == "like" and tone:
+            self.liked_tones[tone] += 1
+        elif feedback == "dislike" and tone:
+            self.disliked_tones[tone] += 1
+        if mood:
+            self.moods[mood] += 1
 
-            if feedback == "like" and tone:
-                liked_tones.append(tone)
-            elif feedback == "dislike" and tone:
-                disliked_tones.append(tone)
-            if mood:
-                moods.append(mood)
+    def analyze_preferences(self):
+        if not self.entry_count:
+            return {"status": "No feedback yet."}
 
         result = {
-            "most_liked_tones": [t for t, _ in Counter(liked_tones).most_common(2)],
-            "most_disliked_tones": [t for t, _ in Counter(disliked_tones).most_common(2)],
-            "common_moods": [m for m, _ in Counter(moods).most_common(2)]
+            "most_liked_tones": [t for t, _ in self.liked_tones.most_common(2)],
+            "most_disliked_tones": [t for t, _ in self.disliked_tones.most_common(2)],
+            "common_moods": [m for m, _ in self.moods.most_common(2)]
         }
         return result
 
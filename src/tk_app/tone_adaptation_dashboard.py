@@ -1,28 +1,41 @@
-import json
 import matplotlib.pyplot as plt
 from collections import Counter
 import os
+from modules.records import load_feedback_records
+from modules.feedback_archive import FeedbackArchive
+from modules.analytics_snapshot import AnalyticsSnapshot, DEFAULT_SNAPSHOT_FILE
+from modules.log_setup import get_logger
+
+log = get_logger("dashboard")
 
 class ToneAdaptationDashboard:
-    def __init__(self, feedback_file="data/user_data.json"):
+    def __init__(self, feedback_file="data/user_data.json", archive=None, snapshot_file=DEFAULT_SNAPSHOT_FILE):
         self.feedback_file = feedback_file
-        self.data = self._load_data()
+        # A current analytics snapshot already holds the counts; otherwise they
+        # come from the memory-mapped archive when available (NumPy installed)
+        snapshot = AnalyticsSnapshot.load(snapshot_file) if archive is None else None
+        self.snapshot = snapshot if snapshot is not None and snapshot.is_fresh(feedback_file) else None
+        self.archive = None if self.snapshot else archive or FeedbackArchive.for_source(feedback_file)
+        self.data = None if self.snapshot or self.archive is not None else self._load_data()
 
     def _load_data(self):
         if not os.path.exists(self.feedback_file):
-            print("[DEBUG] No feedback file found.")
+            log.debug("No feedback file found.")
             return []
         try:
-            with open(self.feedback_file, "r") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            print("[DEBUG] Could not decode JSON.")
+            return load_feedback_records(self.feedback_file)
+        except ValueError:
+            log.debug("Could not decode JSON.")
             return []
 
-    def visualize_tone_preferences(self):
-        if not self.data:
-            print("No feedback data available for visualization.")
-            return
+    def tone_feedback_counts(self):
+        """(liked, disliked) Counters keyed by tone."""
+        if self.snapshot is not None:
+            return self.snapshot.tone_feedback_counts()
+        if self.archive is not None:
+            archive = self.archive
+            return (archive.value_counts("tone", archive.mask(feedback="like")),
+                    archive.value_counts("tone", archive.mask(feedback="dislike")))
 
         liked = []
         disliked = []
@@ -30,13 +43,22 @@ class ToneAdaptationDashboard:
         for entry in self.data:
             tone = entry.get("tone_used")
             feedback = entry.get("feedback")
+            # Entries without a tone are skipped, as in the archive's value_counts
+            if tone is None:
+                continue
             if feedback == "like":
                 liked.append(tone)
             elif feedback == "dislike":
                 disliked.append(tone)
 
-        liked_count = Counter(liked)
-        disliked_count = Counter(disliked)
+        return Counter(liked), Counter(disliked)
+
+    def visualize_tone_preferences(self):
+        if not self.data and not self.archive and not (self.snapshot and self.snapshot.entries):
+            print("No feedback data available for visualization.")
+            return
+
+        liked_count, disliked_count = self.tone_feedback_counts()
 
         tones = list(set(list(liked_count.keys()) + list(disliked_count.keys())))
         likes = [liked_count.get(t, 0) for t in tones]